@@ -0,0 +1,162 @@
+"""
+Asset Store - Content-addressed storage for heavy exercise assets
+Schema PNGs and rendered math SVGs are kept on disk keyed by SHA-256 and the
+documents in Mongo only hold /api/assets/<sha256>.<ext> references.
+"""
+
+import base64
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from logger import get_logger
+
+logger = get_logger()
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+    'zip': 'application/zip'
+}
+EXTENSIONS = {content_type: ext for ext, content_type in CONTENT_TYPES.items()}
+
+ASSET_ID_PATTERN = re.compile(r'^([0-9a-f]{64})\.(png|svg|pdf|zip)$')
+ASSET_URL_PATTERN = re.compile(r'/api/assets/([0-9a-f]{64}\.(?:png|svg|pdf|zip))(?:[?#].*)?$')
+
+# Inline fragments worth moving out of the document
+INLINE_SVG_PATTERN = re.compile(r'<svg\b.*?</svg>', re.DOTALL)
+DATA_URI_PATTERN = re.compile(r'data:(image/png|image/svg\+xml);base64,([A-Za-z0-9+/=]+)')
+
+# Assets below this size stay inline - a reference would not be smaller
+MIN_EXTERNALIZE_BYTES = 512
+
+
+class AssetStore:
+    """Local blob directory keyed by SHA-256 of the content"""
+
+    def __init__(self, root_dir: str, public_base_url: str = ""):
+        self.root_dir = Path(root_dir)
+        self.public_base_url = public_base_url.rstrip('/')
+
+    def _path(self, digest: str, ext: str) -> Path:
+        return self.root_dir / digest[:2] / f"{digest}.{ext}"
+
+    def put(self, data: bytes, content_type: str) -> str:
+        """Store bytes and return the asset id (<sha256>.<ext>). Idempotent."""
+        ext = EXTENSIONS.get(content_type)
+        if not ext:
+            raise ValueError(f"Unsupported asset content type: {content_type}")
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest, ext)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Atomic write: concurrent workers may store the same asset
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        return f"{digest}.{ext}"
+
+    def path_for(self, asset_id: str) -> Optional[Path]:
+        """Return the file path of a stored asset, or None for invalid/missing ids"""
+        match = ASSET_ID_PATTERN.match(asset_id or "")
+        if not match:
+            return None
+        path = self._path(match.group(1), match.group(2))
+        return path if path.exists() else None
+
+    def get(self, asset_id: str) -> Optional[bytes]:
+        path = self.path_for(asset_id)
+        return path.read_bytes() if path else None
+
+    @staticmethod
+    def content_type_for(asset_id: str) -> str:
+        return CONTENT_TYPES.get(asset_id.rsplit('.', 1)[-1], 'application/octet-stream')
+
+    def url_for(self, asset_id: str) -> str:
+        return f"{self.public_base_url}/api/assets/{asset_id}"
+
+    def asset_id_from_url(self, url: str) -> Optional[str]:
+        """Extract the asset id from an /api/assets/ URL (absolute, relative or file://)"""
+        match = ASSET_URL_PATTERN.search(url or "")
+        return match.group(1) if match else None
+
+    def externalize_data_uri(self, data_uri: Optional[str]) -> Optional[str]:
+        """Replace a base64 data URI by an asset URL (returns input unchanged otherwise)"""
+        if not data_uri or not data_uri.startswith("data:"):
+            return data_uri
+        match = DATA_URI_PATTERN.fullmatch(data_uri)
+        if not match:
+            return data_uri
+        data = base64.b64decode(match.group(2))
+        if len(data) < MIN_EXTERNALIZE_BYTES:
+            return data_uri
+        return self.url_for(self.put(data, match.group(1)))
+
+    def externalize_html(self, html: Optional[str]) -> Optional[str]:
+        """Move inline SVG fragments and base64 images of an HTML fragment to the store"""
+        if not html or not isinstance(html, str):
+            return html
+
+        def replace_svg(match):
+            svg = match.group(0)
+            if len(svg) < MIN_EXTERNALIZE_BYTES:
+                return svg
+            asset_id = self.put(svg.encode('utf-8'), 'image/svg+xml')
+            return f'<img class="math-asset" src="{self.url_for(asset_id)}" alt="" style="vertical-align: middle;"/>'
+
+        def replace_data_uri(match):
+            return self.externalize_data_uri(match.group(0))
+
+        html = INLINE_SVG_PATTERN.sub(replace_svg, html)
+        return DATA_URI_PATTERN.sub(replace_data_uri, html)
+
+    def externalize_exercise(self, exercise: Dict[str, Any]) -> Dict[str, Any]:
+        """Externalize the heavy fields of an exercise dict (in place) before persisting it"""
+        try:
+            exercise['enonce'] = self.externalize_html(exercise.get('enonce'))
+            exercise['schema_img'] = self.externalize_data_uri(exercise.get('schema_img'))
+
+            solution = exercise.get('solution')
+            if isinstance(solution, dict):
+                if isinstance(solution.get('etapes'), list):
+                    solution['etapes'] = [self.externalize_html(step) for step in solution['etapes']]
+                if solution.get('resultat'):
+                    solution['resultat'] = self.externalize_html(solution['resultat'])
+        except Exception as e:
+            # Keeping the inline version is always a valid fallback
+            logger.error(f"Error externalizing exercise assets: {e}")
+        return exercise
+
+    def url_fetcher(self, url: str, *args, **kwargs) -> dict:
+        """WeasyPrint url_fetcher serving /api/assets/ references from disk"""
+        asset_id = self.asset_id_from_url(url)
+        if asset_id:
+            path = self.path_for(asset_id)
+            if path:
+                return {
+                    'string': path.read_bytes(),
+                    'mime_type': self.content_type_for(asset_id),
+                    'redirected_url': url
+                }
+        import weasyprint
+        return weasyprint.default_url_fetcher(url, *args, **kwargs)
+
+
+ROOT_DIR = Path(__file__).parent
+
+# Global instance for easy use
+asset_store = AssetStore(
+    os.environ.get('ASSET_STORE_DIR', str(ROOT_DIR / 'assets')),
+    os.environ.get('PUBLIC_ASSET_BASE_URL', '')
+)
@@ -0,0 +1,4 @@
+"""
+Benchmarks - Offline micro-benchmarks for the export pipeline
+Run from backend/: python -m benchmarks.<name>
+"""
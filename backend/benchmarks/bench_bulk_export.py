@@ -0,0 +1,136 @@
+"""
+Bulk export benchmark - 50 documents of a class set, separate exports vs one bulk run
+Separate: each document prepared with its own memo, as 50 /export calls on a cold process.
+Bulk: BulkExporter.prepare_parts, one memo for the run (shared exercises, formulas, schemas).
+With --render, the parts are also laid out by WeasyPrint on the render pool.
+
+Usage (from backend/): python -m benchmarks.bench_bulk_export [--documents 50] [--render] [--json]
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from bulk_export import BulkExporter  # noqa: E402
+from latex_to_svg import latex_renderer  # noqa: E402
+from render_pipeline import DocumentRenderPipeline, StageCache  # noqa: E402
+from template_env import template_registry  # noqa: E402
+
+TEMPLATE_NAME = "sujet_classique"
+
+# A term of Pythagore / Thalès worksheets: the same formulas and figures come back across documents
+FORMULAS = [
+    "$a^2 + b^2 = c^2$",
+    "$\\frac{AM}{AB} = \\frac{AN}{AC}$",
+    "$\\sqrt{9^2 + 12^2} = 15$",
+    "$BC^2 = AB^2 + AC^2$",
+    "$\\frac{3}{4} = 0,75$",
+]
+SCHEMAS = [
+    {"type": "triangle_rectangle", "points": ["A", "B", "C"], "angle_droit": "A",
+     "segments": [["A", "B", {"longueur": 3}], ["A", "C", {"longueur": 4}]]},
+    {"type": "triangle_rectangle", "points": ["D", "E", "F"], "angle_droit": "D",
+     "segments": [["D", "E", {"longueur": 6}], ["D", "F", {"longueur": 8}]]},
+    {"type": "rectangle", "longueur": 5, "largeur": 3},
+]
+
+
+def class_set(document_count: int = 50, exercises_per_document: int = 6) -> list:
+    """Synthetic documents sharing formulas and schemas, like a term of exports for one class"""
+    documents = []
+    for d in range(document_count):
+        exercises = []
+        for e in range(exercises_per_document):
+            n = d * exercises_per_document + e
+            formula = FORMULAS[n % len(FORMULAS)]
+            exercises.append({
+                "type": "ouvert",
+                "enonce": f"Exercice {e + 1} : on rappelle que {formula}. Calculer la longueur manquante.",
+                "donnees": {"schema": SCHEMAS[n % len(SCHEMAS)]} if e % 2 == 0 else None,
+                "difficulte": "moyen",
+                "solution": {"etapes": [f"On applique {formula}", f"On trouve {FORMULAS[(n + 2) % len(FORMULAS)]}"],
+                             "resultat": f"${(n % 7) + 5}$ cm"},
+                "bareme": [{"etape": "Méthode", "points": 1.5}, {"etape": "Résultat", "points": 0.5}],
+            })
+        documents.append({
+            "id": f"bench-{d:03d}", "matiere": "Mathématiques", "niveau": "4e",
+            "chapitre": "Théorème de Pythagore", "type_doc": "exercices", "difficulte": "moyen",
+            "nb_exercices": exercises_per_document, "exercises": exercises,
+            "created_at": "2026-09-01T08:00:00+00:00",
+        })
+    return documents
+
+
+def _build_part(index: int, document: dict):
+    html = template_registry.render(TEMPLATE_NAME, document=document, date_creation="19/10/2026")
+    return f"{document['id']}.pdf", TEMPLATE_NAME, html
+
+
+def run_separate(documents: list) -> dict:
+    # Same starting point for both modes: the LaTeX renderer keeps its own formula cache
+    latex_renderer.svg_cache.clear()
+    start = time.perf_counter()
+    misses = 0
+    for index, doc in enumerate(copy.deepcopy(documents), start=1):
+        pipeline = DocumentRenderPipeline("pdf", cache=StageCache())
+        prepared = pipeline.prepare(doc)
+        misses += pipeline.cache_misses + pipeline.fragment_misses
+        _build_part(index, prepared)
+    return {"ms": round((time.perf_counter() - start) * 1000, 1), "renders": misses}
+
+
+def run_bulk(documents: list, render: bool = False) -> dict:
+    from pdf_renderer import render_pool
+
+    exporter = BulkExporter(render_pool)
+    latex_renderer.svg_cache.clear()
+    start = time.perf_counter()
+    parts = exporter.prepare_parts(copy.deepcopy(documents), "sujet", _build_part)
+    result = {
+        "ms": round((time.perf_counter() - start) * 1000, 1),
+        "renders": exporter.stats["cache_misses"] + exporter.stats["fragment_misses"],
+        "stats": exporter.stats,
+    }
+    if render:
+        output = asyncio.run(exporter.render(parts, "zip", "bench"))
+        result["render_ms"] = exporter.stats["render_ms"]
+        result["zip_bytes"] = output.size
+        output.file.close()
+        render_pool.shutdown()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--render", action="store_true", help="also lay out the PDFs (needs WeasyPrint)")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    template_registry.precompile()
+    documents = class_set(args.documents)
+    results = {"documents": args.documents, "separate": run_separate(documents),
+               "bulk": run_bulk(documents, render=args.render)}
+    results["speedup"] = round(results["separate"]["ms"] / max(results["bulk"]["ms"], 1e-6), 1)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<10}{'prepare+template ms':>21}{'renders':>9}")
+    for mode in ("separate", "bulk"):
+        print(f"{mode:<10}{results[mode]['ms']:>21.1f}{results[mode]['renders']:>9}")
+    print(f"speedup: {results['speedup']}x")
+    if args.render:
+        print(f"layout (zip, {results['bulk']['stats']['documents']} PDFs): {results['bulk']['render_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
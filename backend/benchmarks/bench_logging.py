@@ -0,0 +1,97 @@
+"""
+Logging benchmark - cost of one AppLogger call on the request thread
+Synchronous: format + redaction + stdout + rotating file inside the call (LOG_QUEUE=false).
+Queued: the call only enqueues; the listener thread does the rest (default).
+Console output goes to /dev/null and the log file to a temporary directory.
+
+Usage (from backend/): python -m benchmarks.bench_logging [--calls 20000] [--format text|json] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import logger as app_logging  # noqa: E402
+
+BATCH = 500
+
+
+def _log_call(log):
+    # Shape of the hot-path logs (schema / render context), with an e-mail to redact
+    log.info(
+        "Schema processing success: triangle_rectangle for prof.martin@example.org",
+        module_name="schema",
+        func_name="process",
+        doc_id="3f2a9c1e",
+        exercise_id="ex-4",
+        schema_type="triangle_rectangle",
+        status="success",
+        template="sujet_classique"
+    )
+
+
+def measure(mode: str, calls: int, log_format: str) -> dict:
+    os.environ['LOG_QUEUE'] = 'true' if mode == 'queued' else 'false'
+    os.environ['APP_LOG_FORMAT'] = log_format
+    os.environ['APP_ENV'] = 'prod'
+
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull, tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        sys.stdout = devnull
+        try:
+            log = app_logging.AppLogger()
+            samples = []
+            for _ in range(max(calls // BATCH, 1)):
+                start = time.perf_counter()
+                for _ in range(BATCH):
+                    _log_call(log)
+                samples.append((time.perf_counter() - start) / BATCH * 1e6)
+            drain_start = time.perf_counter()
+            log.flush(restart=False)
+            drain_ms = (time.perf_counter() - drain_start) * 1000
+            dropped = log.queue_handler.dropped if log.queue_handler else 0
+            for handler in log.logger.handlers + list(log.listener.handlers if log.listener else []):
+                handler.close()
+        finally:
+            sys.stdout = stdout
+            os.chdir(cwd)
+
+    samples.sort()
+    return {
+        "median_us": round(statistics.median(samples), 2),
+        "p95_us": round(samples[int(0.95 * (len(samples) - 1))], 2),
+        "drain_ms": round(drain_ms, 1),
+        "dropped": dropped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--format", choices=("text", "json"), default="json")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = {mode: measure(mode, args.calls, args.format) for mode in ("sync", "queued")}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<8}{'median us/call':>16}{'p95 us/call':>13}{'drain ms':>10}{'dropped':>9}")
+    for mode, row in results.items():
+        print(f"{mode:<8}{row['median_us']:>16.2f}{row['p95_us']:>13.2f}{row['drain_ms']:>10.1f}{row['dropped']:>9}")
+
+
+if __name__ == "__main__":
+    main()
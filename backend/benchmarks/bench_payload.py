@@ -0,0 +1,91 @@
+"""
+Payload benchmark - Serialization time and bytes on the wire for document responses
+Before: FastAPI's jsonable_encoder + stdlib json (JSONResponse), sent uncompressed.
+After: OrjsonResponse serialization, then gzip / brotli as CompressionMiddleware
+sends it. Documents are the offline corpus prepared for the web (inline SVG
+math), with base64 schema_img on the geometry exercises as /api/generate returns.
+
+Usage (from backend/): python -m benchmarks.bench_payload [--repeat 5] [--json]
+"""
+
+import argparse
+import copy
+import json
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from benchmarks import corpus  # noqa: E402
+from benchmarks.bench_suite import measure  # noqa: E402
+from response_encoding import brotli, compress, dumps  # noqa: E402
+
+
+def payloads() -> dict:
+    """Name -> response body as the document routes build it"""
+    from geometry_renderer import GeometryRenderer
+    from render_pipeline import DocumentRenderPipeline, StageCache
+
+    pipeline = DocumentRenderPipeline("web", cache=StageCache())
+    renderer = GeometryRenderer()
+    figures = list(corpus.FIGURES.values())
+    bodies = {}
+    for name, document in corpus.documents().items():
+        prepared = pipeline.prepare(document)
+        if name == "geometry":
+            for index, exercise in enumerate(prepared["exercises"]):
+                exercise["schema_img"] = renderer.render_geometry_to_base64(copy.deepcopy(figures[index % len(figures)]))
+        bodies[name] = {"document": prepared}
+    bodies["listing"] = {"documents": [body["document"] for body in bodies.values()], "next_cursor": None}
+    return bodies
+
+
+def stdlib_render(content) -> bytes:
+    """What a plain dict return costs: jsonable_encoder, then JSONResponse.render"""
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def run(repeat: int = 5) -> dict:
+    results = {}
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    for name, content in payloads().items():
+        before = stdlib_render(content)
+        after = dumps(content)
+        row = {
+            "stdlib": {**measure(lambda c=content: stdlib_render(c), repeat), "bytes": len(before)},
+            "orjson": {**measure(lambda c=content: dumps(c), repeat), "bytes": len(after)},
+        }
+        for encoding in encodings:
+            wire = compress(after, encoding)
+            row[encoding] = {**measure(lambda e=encoding: compress(after, e), repeat), "bytes": len(wire)}
+        results[name] = row
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'payload':<14}{'stdlib ms':>11}{'orjson ms':>11}{'raw KB':>9}"
+          f"{'gzip ms':>9}{'gzip KB':>9}{'br ms':>8}{'br KB':>8}")
+    for name, row in results.items():
+        br = row.get("br", {"median_ms": float("nan"), "bytes": float("nan")})
+        print(f"{name:<14}{row['stdlib']['median_ms']:>11.3f}{row['orjson']['median_ms']:>11.3f}"
+              f"{row['stdlib']['bytes'] / 1024:>9.1f}{row['gzip']['median_ms']:>9.3f}{row['gzip']['bytes'] / 1024:>9.1f}"
+              f"{br['median_ms']:>8.3f}{br['bytes'] / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
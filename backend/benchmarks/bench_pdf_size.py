@@ -0,0 +1,72 @@
+"""
+PDF size benchmark - export size per document with and without pdf_optimizer
+Always reports the HTML/SVG bytes handed to WeasyPrint; with --render, also lays
+out every document twice (optimizer off / on) and reports the PDF bytes.
+
+Usage (from backend/): python -m benchmarks.bench_pdf_size [--documents 5] [--render] [--json]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.bench_bulk_export import TEMPLATE_NAME, class_set  # noqa: E402
+from pdf_optimizer import optimize_html  # noqa: E402
+from render_pipeline import DocumentRenderPipeline, StageCache  # noqa: E402
+from template_env import template_registry  # noqa: E402
+
+
+def run(document_count: int = 5, render: bool = False) -> list:
+    pipeline = DocumentRenderPipeline("pdf", cache=StageCache())
+    renderers = None
+    if render:
+        from map_mirror import map_mirror
+        from pdf_renderer import PDFRenderer
+
+        renderers = {"off": PDFRenderer(map_mirror.url_fetcher, optimize=False),
+                     "on": PDFRenderer(map_mirror.url_fetcher, optimize=True)}
+
+    rows = []
+    for doc in class_set(document_count):
+        prepared = pipeline.prepare(doc)
+        html = template_registry.render(TEMPLATE_NAME, document=prepared, date_creation="19/10/2026")
+        _, report = optimize_html(html)
+        row = {"document": doc["id"], **report}
+        if renderers:
+            row["pdf_bytes_before"] = len(renderers["off"].render_pdf(html))
+            row["pdf_bytes_after"] = len(renderers["on"].render_pdf(html))
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--render", action="store_true", help="also render the PDFs (needs WeasyPrint)")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    rows = run(args.documents, render=args.render)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    header = f"{'document':<12}{'html before':>13}{'html after':>12}{'svg':>5}{'shared':>8}"
+    if args.render:
+        header += f"{'pdf before':>12}{'pdf after':>11}"
+    print(header)
+    for row in rows:
+        line = (f"{row['document']:<12}{row['html_bytes_before']:>13}{row['html_bytes_after']:>12}"
+                f"{row['svg_fragments']:>5}{row['svg_shared']:>8}")
+        if args.render:
+            line += f"{row['pdf_bytes_before']:>12}{row['pdf_bytes_after']:>11}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
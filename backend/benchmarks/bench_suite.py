@@ -0,0 +1,264 @@
+"""
+Benchmark suite - Renderers, templates and PDF export on the offline corpus
+Times LaTeXToSVGRenderer, MathRenderer, process_math_content_for_pdf,
+SchemaRenderer (per schema type), GeometryRenderer.render_geometry_to_base64
+(per figure), the keyword classifiers, the geo catalog search, Jinja
+rendering per template and write_pdf per export style.
+Results can be written to JSON and compared against a stored baseline: a case
+whose median is slower than baseline * (1 + threshold) is a regression (exit 1).
+
+Usage (from backend/): python -m benchmarks.bench_suite [--repeat 5] [--only latex,template]
+    [--output results.json] [--baseline benchmarks/baseline.json] [--threshold 0.25] [--save-baseline]
+"""
+
+import argparse
+import copy
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks import corpus  # noqa: E402
+from benchmarks.bench_templates import STYLES  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_THRESHOLD = 0.25
+# Cases faster than this are dominated by timer noise: never reported as regressions
+NOISE_FLOOR_MS = 0.05
+# Fast cases are looped until one sample lasts at least this long
+MIN_SAMPLE_MS = 20.0
+
+Case = Tuple[str, Callable[[], object]]
+
+
+def _latex_cases() -> List[Case]:
+    from latex_to_svg import LaTeXToSVGRenderer
+
+    renderer = LaTeXToSVGRenderer()
+
+    def render_all():
+        renderer.svg_cache.clear()  # Cold: every formula goes through matplotlib
+        for formula in corpus.FORMULAS:
+            renderer.render_latex_expression(formula)
+
+    return [("latex/formulas", render_all),
+            ("latex/text", lambda: (renderer.svg_cache.clear(), renderer.convert_text_with_latex(corpus.MATH_TEXT)))]
+
+
+def _math_cases() -> List[Case]:
+    from curriculum_complete import process_math_content_for_pdf
+    from math_renderer import MathRenderer
+
+    renderer = MathRenderer()
+    return [("math_renderer/text", lambda: renderer.render_math_expressions(corpus.MATH_TEXT)),
+            ("process_math_content_for_pdf/text", lambda: process_math_content_for_pdf(corpus.MATH_TEXT))]
+
+
+def _schema_cases() -> List[Case]:
+    from render_schema import SchemaRenderer
+
+    renderer = SchemaRenderer()
+    return [(f"schema_renderer/{schema_type}", lambda schema=schema: renderer.render_to_svg(copy.deepcopy(schema)))
+            for schema_type, schema in corpus.SCHEMAS.items()]
+
+
+def _geometry_cases() -> List[Case]:
+    from geometry_renderer import GeometryRenderer
+
+    renderer = GeometryRenderer()
+    return [(f"geometry_base64/{figure}", lambda data=data: renderer.render_geometry_to_base64(copy.deepcopy(data)))
+            for figure, data in corpus.FIGURES.items()]
+
+
+def _keyword_cases() -> List[Case]:
+    from document_search import DOCUMENT_TYPE_CLASSIFIER
+    from keyword_classifier import GEOMETRY_KEYWORDS, MATH_CONTENT_TYPES
+
+    # Throughput: every corpus enonce classified by each classifier
+    return [(f"keywords/{name}", lambda c=classifier: [c.rank(enonce) for enonce in corpus.ENONCES])
+            for name, classifier in (("document_type", DOCUMENT_TYPE_CLASSIFIER),
+                                     ("math_content", MATH_CONTENT_TYPES),
+                                     ("geometry", GEOMETRY_KEYWORDS))]
+
+
+def _catalog_cases() -> List[Case]:
+    from geo_catalog import geo_catalog
+
+    requests = [("carte_france", ["départements"], []), ("carte_europe", ["Union européenne"], []),
+                ("carte_asie", [], ["Carte du monde centrée sur l'Asie"]), ("carte_thematique", ["relief"], [])]
+    return [("catalog/search", lambda: [geo_catalog.search(doc_type, elements, "4e", avoid)
+                                        for doc_type, elements, avoid in requests])]
+
+
+def _prepared_documents() -> Dict[str, dict]:
+    from render_pipeline import DocumentRenderPipeline, StageCache
+
+    pipeline = DocumentRenderPipeline("pdf", cache=StageCache())
+    return {name: pipeline.prepare(doc) for name, doc in corpus.documents().items()}
+
+
+def _template_context(document: dict) -> dict:
+    return {
+        "document": document,
+        "date_creation": "19/10/2026",
+        "template_config": {"school_name": "Collège Jean Moulin", "professor_name": "M. Martin",
+                            "school_year": "2026-2027", "footer_text": "", "logo_url": None},
+    }
+
+
+def _template_cases() -> List[Case]:
+    from template_env import template_registry
+
+    template_registry.precompile()
+    prepared = _prepared_documents()
+    names = sorted({name for pair in STYLES.values() for name in pair})
+    cases = []
+    for template_name in names:
+        for doc_name, document in prepared.items():
+            context = _template_context(document)
+            cases.append((f"template/{template_name}/{doc_name}",
+                          lambda t=template_name, c=context: template_registry.render(t, **c)))
+    return cases
+
+
+def _write_pdf_cases() -> List[Case]:
+    from map_mirror import map_mirror
+    from pdf_renderer import PDFRenderer
+    from template_env import template_registry
+
+    renderer = PDFRenderer(map_mirror.url_fetcher)
+    template_registry.precompile()
+    prepared = _prepared_documents()
+    cases = []
+    for style, (sujet, corrige) in STYLES.items():
+        for export_type, template_name in (("sujet", sujet), ("corrige", corrige)):
+            html_parts = [template_registry.render(template_name, **_template_context(doc)) for doc in prepared.values()]
+            cases.append((f"write_pdf/{style}/{export_type}",
+                           lambda parts=html_parts: [renderer.render_pdf(html) for html in parts]))
+    return cases
+
+
+GROUPS: Dict[str, Callable[[], List[Case]]] = {
+    "latex": _latex_cases,
+    "math": _math_cases,
+    "schema": _schema_cases,
+    "geometry": _geometry_cases,
+    "keywords": _keyword_cases,
+    "catalog": _catalog_cases,
+    "template": _template_cases,
+    "write_pdf": _write_pdf_cases,
+}
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Per-call times: one warmup call sizes the loop, then `repeat` samples"""
+    start = time.perf_counter()
+    func()
+    warmup_ms = (time.perf_counter() - start) * 1000
+    number = max(1, int(MIN_SAMPLE_MS / max(warmup_ms, 1e-3)))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 4),
+        "min_ms": round(samples[0], 4),
+        "runs": repeat,
+        "loops": number,
+    }
+
+
+def run(groups: Optional[List[str]] = None, repeat: int = 5) -> Dict[str, object]:
+    """Run the selected groups; a group whose dependencies are missing is reported as skipped"""
+    results: Dict[str, dict] = {}
+    skipped: Dict[str, str] = {}
+    for group in groups or list(GROUPS):
+        try:
+            cases = GROUPS[group]()
+            for name, func in cases:
+                results[name] = measure(func, repeat)
+        except (ImportError, OSError) as e:
+            # WeasyPrint without its system libraries (pango), missing matplotlib...
+            skipped[group] = f"{type(e).__name__}: {e}"
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = DEFAULT_THRESHOLD) -> Dict[str, list]:
+    """Split the cases into regressions / improvements / new against a baseline (median based)"""
+    report: Dict[str, list] = {"regressions": [], "improvements": [], "new": []}
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            report["new"].append(name)
+            continue
+        ratio = current["median_ms"] / max(previous["median_ms"], 1e-9)
+        entry = {"case": name, "baseline_ms": previous["median_ms"], "current_ms": current["median_ms"],
+                 "ratio": round(ratio, 2)}
+        if ratio > 1 + threshold and current["median_ms"] - previous["median_ms"] > NOISE_FLOOR_MS:
+            report["regressions"].append(entry)
+        elif ratio < 1 - threshold and previous["median_ms"] - current["median_ms"] > NOISE_FLOOR_MS:
+            report["improvements"].append(entry)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help=f"comma-separated groups ({', '.join(GROUPS)})")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    groups = [group.strip() for group in args.only.split(",")] if args.only else None
+    unknown = [group for group in groups or [] if group not in GROUPS]
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(unknown)}")
+
+    report = run(groups, args.repeat)
+    baseline_path = Path(args.baseline)
+    comparison = None
+    if baseline_path.exists() and not args.save_baseline:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+        comparison = compare(report["results"], baseline, args.threshold)
+        report["comparison"] = {"baseline": str(baseline_path), "threshold": args.threshold, **comparison}
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    print(f"{'case':<52}{'median ms':>11}{'p95 ms':>10}")
+    for name, row in report["results"].items():
+        print(f"{name:<52}{row['median_ms']:>11.3f}{row['p95_ms']:>10.3f}")
+    for group, reason in report["skipped"].items():
+        print(f"skipped {group}: {reason}")
+    if comparison:
+        for entry in comparison["regressions"]:
+            print(f"REGRESSION {entry['case']}: {entry['baseline_ms']:.3f} -> {entry['current_ms']:.3f} ms (x{entry['ratio']})")
+        print(f"{len(comparison['regressions'])} regression(s), {len(comparison['improvements'])} improvement(s), "
+              f"{len(comparison['new'])} new case(s) vs {baseline_path.name}")
+        if comparison["regressions"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Template rendering benchmark - per export style, legacy vs compiled environment
+Legacy: read templates/<name>.html and build jinja2.Template(...) on every export.
+Compiled: process-wide Environment (FileSystemLoader + bytecode cache).
+
+Usage (from backend/): python -m benchmarks.bench_templates [--iterations 200] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from jinja2 import Template  # noqa: E402
+
+from template_env import TEMPLATES_DIR, template_registry  # noqa: E402
+
+# Style -> (sujet template, corrige template), as in EXPORT_TEMPLATE_STYLES + the Pro export
+STYLES = {
+    "classique": ("sujet_classique", "corrige_classique"),
+    "moderne": ("sujet_moderne", "corrige_moderne"),
+    "eleve": ("sujet_eleve", "corrige_eleve"),
+    "minimal": ("sujet_minimal", "corrige_minimal"),
+    "academique": ("sujet_academique", "corrige_academique"),
+    "corrige_detaille": ("sujet_classique", "corrige_detaille"),
+    "pro": ("sujet_pro", "corrige_pro"),
+}
+
+
+def sample_context(exercise_count: int = 8) -> dict:
+    """Representative render context (inline SVG math, QCM options, bareme)"""
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="40" height="12"><path d="M0 0L40 12"/></svg>'
+    exercises = []
+    for i in range(exercise_count):
+        exercises.append({
+            "type": "qcm" if i % 3 == 0 else "ouvert",
+            "enonce": f"Exercice {i + 1} : résoudre {svg} puis justifier.",
+            "donnees": {"options": ["A", "B", "C", "D"]} if i % 3 == 0 else None,
+            "difficulte": "moyen",
+            "solution": {"etapes": [f"Étape {j} {svg}" for j in range(3)], "resultat": f"x = {i}"},
+            "bareme": [{"etape": "Méthode", "points": 1.5}, {"etape": "Résultat", "points": 0.5}],
+            "schema_svg": svg if i % 2 else "",
+        })
+    document = {
+        "matiere": "Mathématiques", "niveau": "4e", "chapitre": "Théorème de Pythagore",
+        "type_doc": "exercices", "exercises": exercises, "exercices": exercises,
+    }
+    return {
+        "document": document,
+        "date_creation": "19/10/2026",
+        "template_config": {"school_name": "Collège Jean Moulin", "professor_name": "M. Martin",
+                            "school_year": "2026-2027", "footer_text": "", "logo_url": None},
+        "advanced_css": "",
+    }
+
+
+def _legacy_render(template_name: str, context: dict) -> str:
+    with open(TEMPLATES_DIR / f"{template_name}.html", "r", encoding="utf-8") as f:
+        return Template(f.read()).render(**context)
+
+
+def _compiled_render(template_name: str, context: dict) -> str:
+    return template_registry.get_template(template_name).render(**context)
+
+
+def _time(func, template_name: str, context: dict, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func(template_name, context)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 3),
+    }
+
+
+def run(iterations: int = 200) -> dict:
+    template_registry.precompile()
+    context = sample_context()
+    results = {}
+    for style, templates in STYLES.items():
+        for export_type, template_name in zip(("sujet", "corrige"), templates):
+            legacy = _time(_legacy_render, template_name, context, iterations)
+            compiled = _time(_compiled_render, template_name, context, iterations)
+            results[f"{style}/{export_type}"] = {
+                "template": template_name,
+                "legacy": legacy,
+                "compiled": compiled,
+                "speedup": round(legacy["median_ms"] / max(compiled["median_ms"], 1e-6), 1),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'style/type':<28}{'template':<22}{'legacy ms':>11}{'compiled ms':>13}{'speedup':>9}")
+    for key, row in results.items():
+        print(f"{key:<28}{row['template']:<22}{row['legacy']['median_ms']:>11.3f}"
+              f"{row['compiled']['median_ms']:>13.3f}{row['speedup']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark corpus - Fixed, offline set of representative documents
+Math with LaTeX, geometry with every schema type, geography with maps (inline
+PNG, no network) and a long corrigé. Same content on every run, so timings
+can be compared against a stored baseline.
+"""
+
+import base64
+import io
+from functools import lru_cache
+
+FORMULAS = [
+    "$a^2 + b^2 = c^2$",
+    "$\\frac{AM}{AB} = \\frac{AN}{AC} = \\frac{MN}{BC}$",
+    "$\\sqrt{9^2 + 12^2} = \\sqrt{225} = 15$",
+    "$\\cos(\\widehat{ABC}) = \\frac{AB}{BC}$",
+    "$f(x) = 3x^2 - 2x + \\frac{1}{2}$",
+    "$\\sum_{k=1}^{n} k = \\frac{n(n+1)}{2}$",
+]
+
+MATH_TEXT = ("Dans le triangle ABC rectangle en A, on a $AB = 3$ cm et $AC = 4$ cm. "
+             "D'après le théorème de Pythagore, $BC^2 = AB^2 + AC^2$ donc $BC = \\sqrt{25} = 5$ cm. "
+             "On en déduit \\(\\cos(\\widehat{ABC}) = \\frac{3}{5}\\) et $$\\tan(\\widehat{ABC}) = \\frac{4}{3}$$")
+
+# render_schema.SchemaRenderer: one schema per supported type
+SCHEMAS = {
+    "triangle": {"type": "triangle", "points": ["A", "B", "C"], "labels": {"A": "A", "B": "B", "C": "C"},
+                 "segments": [["A", "B", {"longueur": 5}], ["B", "C", {"longueur": 6}]]},
+    "triangle_rectangle": {"type": "triangle_rectangle", "points": ["A", "B", "C"], "angle_droit": "A",
+                           "segments": [["A", "B", {"longueur": 3}], ["A", "C", {"longueur": 4}]]},
+    "rectangle": {"type": "rectangle", "longueur": 5, "largeur": 3},
+    "carre": {"type": "carre", "cote": 4},
+    "cercle": {"type": "cercle", "rayon": 3},
+    "cylindre": {"type": "cylindre", "rayon": 2, "hauteur": 5},
+    "pyramide": {"type": "pyramide", "base": "carree", "hauteur": 6, "cote": 4},
+}
+
+# geometry_renderer.GeometryRenderer: one figure per supported type
+FIGURES = {
+    "triangle_rectangle": {"figure": "triangle_rectangle", "points": ["A", "B", "C"], "angle_droit": "A"},
+    "triangle": {"figure": "triangle", "points": ["A", "B", "C"]},
+    "carre": {"figure": "carre", "points": ["A", "B", "C", "D"]},
+    "rectangle": {"figure": "rectangle", "points": ["A", "B", "C", "D"]},
+    "cercle": {"figure": "cercle", "centre": "O", "rayon": 3, "montrer_rayon": True, "label_rayon": "r"},
+    "parallelogramme": {"figure": "parallelogramme", "points": ["A", "B", "C", "D"]},
+}
+
+# Enoncés classified for the document type / icon / geometry detection
+ENONCES = [
+    "À partir de la carte, décrivez les flux de marchandises entre la Chine, le Japon et les États-Unis.",
+    "Présentez les pays membres de l'Union européenne et l'espace Schengen.",
+    "Localisez Paris, Lyon et Marseille puis décrivez le réseau de métropoles françaises.",
+    "Expliquez la croissance urbaine de Lagos et l'urbanisation du Sahel en Afrique.",
+    "Sur le planisphère, repérez l'équateur, les tropiques et les océans.",
+    "Dans le triangle ABC rectangle en A, calculer l'hypoténuse puis l'aire du triangle.",
+    "Résoudre l'équation 3x + 2 = 11 puis simplifier la fraction obtenue.",
+    "Calculer la moyenne des données du graphique et la probabilité de tirer une boule rouge.",
+    "Décrivez une statue de la place centrale et expliquez pourquoi elle est nécessaire au quartier.",
+]
+
+GEOGRAPHY_TITLES = [
+    "Planisphère des grandes métropoles",
+    "Carte des flux commerciaux mondiaux",
+    "Carte de l'Union européenne",
+]
+
+
+@lru_cache(maxsize=1)
+def map_data_uri() -> str:
+    """Small raster "map" drawn locally: stands in for the mirrored Wikimedia maps"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(6, 4), dpi=100)
+    ax.fill([0, 2, 3, 5, 4, 1], [0, 1, 0, 2, 4, 3], color="#9ecae1")
+    ax.fill([5, 7, 8, 6], [1, 0, 3, 4], color="#a1d99b")
+    for x, y, name in ((1, 2, "Paris"), (6.5, 2, "Berlin")):
+        ax.plot(x, y, "ko")
+        ax.annotate(name, (x, y), textcoords="offset points", xytext=(4, 4))
+    ax.axis("off")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _exercise(enonce: str, etapes: list, resultat: str, donnees=None, document=None, kind="ouvert") -> dict:
+    exercise = {
+        "type": kind,
+        "enonce": enonce,
+        "donnees": donnees,
+        "difficulte": "moyen",
+        "solution": {"etapes": etapes, "resultat": resultat},
+        "bareme": [{"etape": "Méthode", "points": 1.5}, {"etape": "Résultat", "points": 0.5}],
+    }
+    if document:
+        exercise["document"] = document
+    return exercise
+
+
+def _document(doc_id: str, matiere: str, chapitre: str, exercises: list) -> dict:
+    return {
+        "id": doc_id, "matiere": matiere, "niveau": "4e", "chapitre": chapitre,
+        "type_doc": "exercices", "difficulte": "moyen", "nb_exercices": len(exercises),
+        "exercises": exercises, "created_at": "2026-09-01T08:00:00+00:00",
+    }
+
+
+def math_document() -> dict:
+    exercises = [
+        _exercise(f"Exercice {i + 1} : {MATH_TEXT if i % 2 == 0 else 'Calculer ' + formula}",
+                  [f"On écrit {formula}", "On simplifie"], FORMULAS[(i + 1) % len(FORMULAS)])
+        for i, formula in enumerate(FORMULAS)
+    ]
+    exercises.append(_exercise("Quelle est la bonne réponse ?", ["On élimine B et C"], "Réponse A",
+                               donnees={"options": ["$x = 2$", "$x = -2$", "$x = 0$", "$x = 4$"]}, kind="qcm"))
+    return _document("corpus-math", "Mathématiques", "Théorème de Pythagore", exercises)
+
+
+def geometry_document() -> dict:
+    exercises = [
+        _exercise(f"Exercice {i + 1} : calculer le périmètre et l'aire de la figure ({schema_type}).",
+                  ["On identifie la figure", "On applique la formule $\\mathcal{A} = L \\times l$"], "$12$ cm²",
+                  donnees={"schema": schema})
+        for i, (schema_type, schema) in enumerate(SCHEMAS.items())
+    ]
+    return _document("corpus-geometry", "Mathématiques", "Géométrie dans l'espace", exercises)
+
+
+def geography_document() -> dict:
+    exercises = []
+    for i, title in enumerate(GEOGRAPHY_TITLES):
+        document = {
+            "titre": title, "type": "carte", "url_fichier_direct": map_data_uri(),
+            "licence": {"type": "CC BY-SA 4.0", "notice_attribution": "Carte de démonstration, corpus de benchmark"},
+        }
+        exercises.append(_exercise(f"Exercice {i + 1} : à partir du document « {title} », décrire la répartition.",
+                                   ["On localise les espaces", "On caractérise les flux"], "Réponse rédigée",
+                                   document=document))
+    return _document("corpus-geography", "Géographie", "Des espaces transformés par la mondialisation", exercises)
+
+
+def long_corrige_document(steps: int = 40) -> dict:
+    etapes = [f"Étape {j + 1} : {FORMULAS[j % len(FORMULAS)]} donc on poursuit le raisonnement." for j in range(steps)]
+    exercises = [_exercise(f"Problème {i + 1} : {MATH_TEXT}", etapes, "$x = \\frac{7}{3}$") for i in range(4)]
+    return _document("corpus-long-corrige", "Mathématiques", "Équations et inéquations", exercises)
+
+
+def documents() -> dict:
+    """Name -> fresh copy of each corpus document"""
+    return {
+        "math": math_document(),
+        "geometry": geometry_document(),
+        "geography": geography_document(),
+        "long_corrige": long_corrige_document(),
+    }
@@ -0,0 +1,268 @@
+"""
+Bulk Export - Class-set export of many documents as one ZIP or one merged PDF
+Every document of a run goes through the same render pipeline and memo, so
+exercises, formulas and schemas shared between documents are rendered once.
+ZIP exports lay documents out on the render pool with bounded concurrency and
+write each entry as it completes. A merged PDF is laid out serially, in one
+render_merged call on a single worker, so the pages share one layout context
+and one outline. Either output goes to a spooled buffer that is streamed back
+(export_response.stream_response).
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from logger import get_logger
+from metrics import metrics
+from render_pipeline import DocumentRenderPipeline, StageCache, run_prepare
+
+logger = get_logger()
+
+MAX_BULK_DOCUMENTS = int(os.environ.get('BULK_EXPORT_MAX_DOCUMENTS', '100'))
+# Concurrent layouts per ZIP bulk export (the render pool is shared with single exports);
+# a merged PDF is one serial layout
+BULK_RENDER_CONCURRENCY = int(os.environ.get('BULK_EXPORT_CONCURRENCY', '2'))
+# ZIP archives stay in memory up to this size, then spill to a temporary file
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+# Memo for one run: large enough that nothing is evicted before the run ends
+RUN_CACHE_BYTES = int(os.environ.get('BULK_EXPORT_CACHE_MB', '256')) * 1024 * 1024
+
+FILTER_FIELDS = ("matiere", "niveau", "chapitre", "type_doc")
+
+bulk_documents = metrics.histogram("bulk_export_documents", "Documents per bulk export")
+bulk_duration = metrics.histogram("bulk_export_stage_seconds", "Bulk export time by stage (prepare, render)")
+
+
+def _created_at_bound(value: datetime) -> Tuple[str, datetime]:
+    """Both stored forms of a created_at bound: ISO string (/generate) and UTC datetime"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.isoformat(), value
+
+
+def build_owner_query(user_email: Optional[str], guest_ids: Iterable[Optional[str]],
+                      filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Mongo query over the documents of a user narrowed by filters. A Pro user owns
+    the documents generated while logged in (user_id) and those of the guest ids
+    linked to the account (pro_users.guest_ids, plus this device's guest id).
+    """
+    owners = []
+    if user_email:
+        owners.append({"user_id": user_email})
+    guest_ids = list(dict.fromkeys(guest_id for guest_id in guest_ids or [] if guest_id))
+    if len(guest_ids) == 1:
+        owners.append({"guest_id": guest_ids[0]})
+    elif guest_ids:
+        owners.append({"guest_id": {"$in": guest_ids}})
+    if not owners:
+        raise ValueError("A bulk export filter needs an owner (user e-mail or guest id)")
+
+    query: Dict[str, Any] = {}
+    clauses = [{"$or": owners}] if len(owners) > 1 else []
+    if not clauses:
+        query.update(owners[0])
+    filters = filters or {}
+    for field in FILTER_FIELDS:
+        if filters.get(field):
+            query[field] = filters[field]
+
+    # created_at is an ISO string for new documents, a datetime for older ones:
+    # a range only matches values of its own BSON type, so each form gets its own
+    as_string, as_datetime = {}, {}
+    for key, operator in (("created_after", "$gte"), ("created_before", "$lt")):
+        if filters.get(key):
+            as_string[operator], as_datetime[operator] = _created_at_bound(filters[key])
+    if as_string:
+        clauses.append({"$or": [{"created_at": as_string}, {"created_at": as_datetime}]})
+
+    if len(clauses) == 1:
+        query.update(clauses[0])
+    elif clauses:
+        query["$and"] = clauses
+    return query
+
+
+def order_by_ids(docs: List[dict], document_ids: List[str]) -> Tuple[List[dict], List[str]]:
+    """Documents in the requested order (duplicates removed) and the ids that were not found"""
+    by_id = {doc["id"]: doc for doc in docs}
+    ordered, missing, seen = [], [], set()
+    for document_id in document_ids:
+        if document_id in seen:
+            continue
+        seen.add(document_id)
+        if document_id in by_id:
+            ordered.append(by_id[document_id])
+        else:
+            missing.append(document_id)
+    return ordered, missing
+
+
+def part_label(index: int, document: dict, export_type: str) -> str:
+    """Bookmark label of a document in a merged PDF"""
+    title = " - ".join(str(document.get(key)) for key in ("matiere", "niveau", "chapitre") if document.get(key))
+    return f"{index}. {title or document.get('id', '')} ({export_type})"
+
+
+@dataclass
+class BulkPart:
+    """One document of a bulk export, ready for layout"""
+    document_id: str
+    filename: str
+    template_name: str
+    label: str
+    html: str
+
+
+@dataclass
+class BulkOutput:
+    """Rendered bulk export; `file` is positioned at 0 and owned by the caller"""
+    file: Any
+    size: int
+    media_type: str
+    filename: str
+
+    def read_all(self) -> bytes:
+        try:
+            return self.file.read()
+        finally:
+            self.file.close()
+
+
+# build_part(index, prepared_document) -> (filename, template_name, html)
+PartBuilder = Callable[[int, dict], Tuple[str, str, str]]
+
+
+class BulkExporter:
+    """Prepare and render many documents with shared render work"""
+
+    def __init__(self, renderer, concurrency: int = BULK_RENDER_CONCURRENCY,
+                 cache: Optional[StageCache] = None):
+        # renderer: pdf_renderer.RenderPool (render / render_merged coroutines)
+        self.renderer = renderer
+        self.concurrency = max(1, concurrency)
+        self.cache = cache if cache is not None else StageCache(max_bytes=RUN_CACHE_BYTES)
+        self.stats = {"documents": 0, "cache_hits": 0, "cache_misses": 0,
+                      "fragment_hits": 0, "fragment_misses": 0, "prepare_ms": 0.0, "render_ms": 0.0}
+
+    # ------------------------------------------------------------------ prepare
+
+    def prepare_parts(self, docs: List[dict], export_type: str, build_part: PartBuilder,
+                      model: Optional[Callable[..., Any]] = None,
+                      progress: Optional[Callable[[str, int, int], None]] = None) -> List[BulkPart]:
+        """Run every document through one pdf pipeline (shared memo), then its template"""
+        start = time.perf_counter()
+        pipeline = DocumentRenderPipeline("pdf", cache=self.cache, model=model)
+        parts = []
+        for index, doc in enumerate(docs, start=1):
+            document_id = str(doc.get("id", ""))
+            document_dict = pipeline.prepare(doc, doc_id=document_id[:8])
+            for counter in ("cache_hits", "cache_misses", "fragment_hits", "fragment_misses"):
+                self.stats[counter] += getattr(pipeline, counter)
+
+            filename, template_name, html = build_part(index, document_dict)
+            parts.append(BulkPart(document_id, filename, template_name,
+                                  part_label(index, document_dict, export_type), html))
+            if progress:
+                progress("prepare", index, len(docs))
+
+        elapsed = time.perf_counter() - start
+        self.stats["documents"] = len(parts)
+        self.stats["prepare_ms"] = round(elapsed * 1000, 2)
+        bulk_duration.observe(elapsed, stage="prepare")
+        bulk_documents.observe(len(parts))
+        return parts
+
+    async def prepare_parts_async(self, docs: List[dict], export_type: str, build_part: PartBuilder,
+                                  model: Optional[Callable[..., Any]] = None,
+                                  progress: Optional[Callable[[str, int, int], None]] = None) -> List[BulkPart]:
+        """prepare_parts off the event loop (dozens of documents take seconds)"""
+        return await run_prepare(self.prepare_parts, docs, export_type, build_part, model, progress)
+
+    # ------------------------------------------------------------------ render
+
+    async def render(self, parts: List[BulkPart], export_format: str, base_name: str,
+                     log_context: Optional[Dict[str, Any]] = None,
+                     progress: Optional[Callable[[str, int, int], None]] = None) -> BulkOutput:
+        start = time.perf_counter()
+        if export_format == "pdf":
+            output = await self._render_merged(parts, base_name, log_context, progress)
+        else:
+            output = await self._render_zip(parts, base_name, log_context, progress)
+
+        elapsed = time.perf_counter() - start
+        self.stats["render_ms"] = round(elapsed * 1000, 2)
+        bulk_duration.observe(elapsed, stage="render")
+        logger.info(
+            "Bulk export rendered",
+            module_name="bulk_export",
+            func_name="render",
+            format=export_format,
+            bytes=output.size,
+            concurrency=self.concurrency if export_format != "pdf" else 1,
+            duration_ms=round(elapsed * 1000, 2),
+            **self.stats,
+            **(log_context or {})
+        )
+        return output
+
+    async def _render_merged(self, parts: List[BulkPart], base_name: str,
+                             log_context: Optional[Dict[str, Any]],
+                             progress: Optional[Callable[[str, int, int], None]]) -> BulkOutput:
+        # Serial on purpose: one layout context keeps a single outline with one entry per part
+        payload = await self.renderer.render_merged(
+            [part.html for part in parts],
+            log_context={**(log_context or {}), "parts": len(parts)},
+            bookmarks=[part.label for part in parts]
+        )
+        if progress:
+            progress("render", len(parts), len(parts))
+        buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        buffer.write(payload)
+        buffer.seek(0)
+        return BulkOutput(buffer, len(payload), "application/pdf", f"{base_name}.pdf")
+
+    async def _render_zip(self, parts: List[BulkPart], base_name: str,
+                          log_context: Optional[Dict[str, Any]],
+                          progress: Optional[Callable[[str, int, int], None]]) -> BulkOutput:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def render_part(index: int, part: BulkPart) -> Tuple[int, BulkPart, bytes]:
+            async with semaphore:
+                pdf_bytes = await self.renderer.render(
+                    part.html,
+                    log_context={**(log_context or {}), "doc_id": part.document_id[:8], "template": part.template_name}
+                )
+            return index, part, pdf_bytes
+
+        buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        tasks = [asyncio.ensure_future(render_part(index, part)) for index, part in enumerate(parts, start=1)]
+        try:
+            # PDF streams are already compressed: store them, and write each one as soon as it is laid out
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+                for done, finished in enumerate(asyncio.as_completed(tasks), start=1):
+                    index, part, pdf_bytes = await finished
+                    # The index prefix keeps the requested order in the archive listing
+                    archive.writestr(f"{index:03d}_{part.filename}", pdf_bytes)
+                    if progress:
+                        progress("render", done, len(parts))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            buffer.close()
+            raise
+
+        size = buffer.tell()
+        buffer.seek(0)
+        return BulkOutput(buffer, size, "application/zip", f"{base_name}.zip")
+
+
+def bulk_base_name(document_count: int, export_type: str) -> str:
+    return f"LeMaitremot_lot_{document_count}_documents_{export_type}_{datetime.now().strftime('%Y%m%d')}"
@@ -0,0 +1,138 @@
+"""
+Document Listing - Keyset pagination and projections for the documents API
+Pages are ordered by (created_at, id) descending and addressed by an opaque cursor.
+created_at is an ISO string on documents from /generate and a datetime on older
+ones: pages sort and resume on SORT_FIELD, the date both forms convert to.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 20
+# created_at as a date whatever its stored form (added by the pipeline, removed by paginate)
+SORT_FIELD = "_ts"
+MAX_PAGE_SIZE = {"summary": 200, "full": 50}
+
+# Lightweight listing for the history page: no exercise content at all
+SUMMARY_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "guest_id": 1,
+    "user_id": 1,
+    "matiere": 1,
+    "niveau": 1,
+    "chapitre": 1,
+    "type_doc": 1,
+    "difficulte": 1,
+    "nb_exercices": 1,
+    "export_count": 1,
+    "created_at": 1,
+    "exercise_count": {"$size": {"$ifNull": ["$exercises", []]}},
+    "geometry_count": {"$size": {"$filter": {
+        "input": {"$ifNull": ["$exercises", []]},
+        "cond": {"$ne": [{"$ifNull": ["$$this.geometric_schema", None]}, None]}
+    }}},
+    "document_count": {"$size": {"$filter": {
+        "input": {"$ifNull": ["$exercises", []]},
+        "cond": {"$ne": [{"$ifNull": ["$$this.document", None]}, None]}
+    }}}
+}
+
+# Top-level fields a client may request explicitly with fields=a,b,c
+SELECTABLE_FIELDS = {
+    "id", "guest_id", "user_id", "matiere", "niveau", "chapitre", "type_doc",
+    "difficulte", "nb_exercices", "export_count", "created_at", "exercises"
+}
+
+
+def encode_cursor(created_at: Any, doc_id: str) -> str:
+    """Build an opaque cursor pointing after the given document"""
+    if isinstance(created_at, datetime):
+        value = {"d": created_at.isoformat()}
+    else:
+        value = {"s": created_at}
+    payload = json.dumps([value, doc_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """Decode a cursor built by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if "d" in value:
+            created_at = datetime.fromisoformat(value["d"])
+        else:
+            created_at = value["s"]
+        if not isinstance(doc_id, str):
+            raise ValueError("invalid document id")
+        return created_at, doc_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Resolve the fields parameter to (mode, projection)
+    - None / "full": full documents (mode "full", no projection)
+    - "summary": SUMMARY_PROJECTION
+    - "a,b,c": explicit top-level fields (id and created_at are always included)
+    """
+    if not fields or fields == "full":
+        return "full", None
+    if fields == "summary":
+        return "summary", SUMMARY_PROJECTION
+
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - SELECTABLE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    projection = {"_id": 0, "id": 1, "created_at": 1}
+    projection.update({f: 1 for f in requested})
+    return ("full" if "exercises" in requested else "summary"), projection
+
+
+def clamp_limit(limit: Optional[int], mode: str) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE[mode])
+
+
+def build_listing_pipeline(match: Dict[str, Any], cursor: Optional[str], limit: int,
+                           projection: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Aggregation pipeline for one page; fetches limit + 1 rows to detect a next page"""
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": dict(match)},
+        # ISO strings and datetimes would otherwise sort (and compare) by BSON type
+        {"$addFields": {SORT_FIELD: {"$convert": {
+            "input": "$created_at", "to": "date", "onError": None, "onNull": None
+        }}}}
+    ]
+    if cursor:
+        created_at, doc_id = decode_cursor(cursor)
+        if isinstance(created_at, str):
+            # Cursor issued before the sort key existed
+            created_at = datetime.fromisoformat(created_at)
+        pipeline.append({"$match": {"$or": [
+            {SORT_FIELD: {"$lt": created_at}},
+            {SORT_FIELD: created_at, "id": {"$lt": doc_id}}
+        ]}})
+
+    pipeline += [
+        {"$sort": {SORT_FIELD: -1, "id": -1}},
+        {"$limit": limit + 1}
+    ]
+    if projection:
+        pipeline.append({"$project": {**projection, SORT_FIELD: 1}})
+    return pipeline
+
+
+def paginate(rows: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Split the limit + 1 rows into the page and the cursor of the next page"""
+    page = rows[:limit]
+    sort_keys = [row.pop(SORT_FIELD, None) for row in page]
+    if len(rows) <= limit or not page:
+        return page, None
+    return page, encode_cursor(sort_keys[-1], page[-1].get("id"))
@@ -2,68 +2,120 @@
 # Spécialisé pour la Géographie avec cartes libres de droit
 
 import aiohttp
+import asyncio
 import json
+import os
 import re
+import time
 from typing import Dict, List, Optional, Any
+from geo_catalog import GeoCatalog, geo_catalog
+from keyword_classifier import KeywordClassifier
 from logger import get_logger
+from metrics import metrics
+from search_cache import search_cache_key
+from tracing import tracer
 
 logger = get_logger()
 
+WIKIMEDIA_API_BASE = os.environ.get('WIKIMEDIA_API_BASE', "https://commons.wikimedia.org/w/api.php")
+# Délais explicites : une API lente ne doit jamais bloquer la génération
+WIKIMEDIA_CONNECT_TIMEOUT = float(os.environ.get('WIKIMEDIA_CONNECT_TIMEOUT', '3'))
+WIKIMEDIA_READ_TIMEOUT = float(os.environ.get('WIKIMEDIA_READ_TIMEOUT', '5'))
+WIKIMEDIA_TOTAL_TIMEOUT = float(os.environ.get('WIKIMEDIA_TOTAL_TIMEOUT', '10'))
+WIKIMEDIA_POOL_SIZE = int(os.environ.get('WIKIMEDIA_POOL_SIZE', '10'))
+# Wikimedia demande un User-Agent identifiable
+USER_AGENT = "LeMaitreMot/1.0 (document search; contact via site)"
+# Nombre de résultats de recherche dont on récupère les métadonnées (en une requête)
+METADATA_RESULTS = 5
+
+search_stage_duration = metrics.histogram("document_search_stage_seconds", "Geographic document search time by stage")
+search_requests = metrics.counter("document_search_requests_total", "Geographic document searches by source")
+
+# Détection du type de carte d'après l'énoncé : toutes les régions sont comptées en un passage,
+# la plus citée l'emporte (à égalité, l'ordre ci-dessous). Les villes autrefois réservées au
+# contexte urbain (seoul, chicago, los angeles) sont rattachées à leur région ; un énoncé
+# seulement urbain retombe sur carte_monde, comme avant.
+DOCUMENT_TYPE_CLASSIFIER = KeywordClassifier({
+    # "nom*" couvre aussi les gentilés et adjectifs (japonais, marocaine, régional...)
+    "carte_france": [
+        "france", "français", "francilien", "paris*", "lyon*", "marseill*", "toulous*",
+        "région*", "départemen*", "préfecture", "hexagone", "métropol*",
+        "aquitain*", "bretagne", "breton", "normandie", "normand", "paca", "île-de-france"
+    ],
+    "carte_europe": [
+        "europe", "européen", "européenne", "union européenne", "ue", "schengen",
+        "allemagne", "allemand", "berlin*", "itali*", "rome", "espagn*", "madrid*",
+        "royaume-uni", "britannique", "londres", "londonien", "portugal", "portugais",
+        "grèce", "grec", "pologne", "polonais", "brexit"
+    ],
+    "carte_asie": [
+        "asie", "asiatique", "extrême-orient", "orient",
+        "chine", "chinois", "beijing", "pékin*", "shanghai*", "japon*", "tokyo*", "osaka",
+        "inde", "indien", "delhi", "mumbai", "coré*", "séoul", "seoul", "thaïland*", "vietnam*"
+    ],
+    "carte_amerique_nord": [
+        "amérique du nord", "nord-américain", "alena", "nafta",
+        "états-unis", "usa", "etats-unis", "américain",
+        "new york", "new-yorkais", "washington", "californi*", "texas", "texan", "floride",
+        "canad*", "toronto", "vancouver", "ottawa", "québec", "québécois",
+        "mexique", "mexicain", "mexico", "chicago", "los angeles"
+    ],
+    "carte_afrique": [
+        "afrique", "africain", "sahara*", "sahel*", "maghreb*",
+        "nil", "congo*", "niger", "nigérien", "zambèze",
+        "maroc*", "algéri*", "tunisi*", "egypte", "égypte", "égyptien", "kenya*", "nigeria", "nigérian",
+        "afrique du sud", "sud-africain", "ghan*", "sénégal*", "mali", "malien", "tchad*"
+    ],
+    "carte_monde": [
+        "monde", "mondial", "planète", "terre", "global",
+        "continents", "océans", "hémisphère", "équateur", "tropiques",
+        "mondialisation", "géographie mondiale", "planisphère"
+    ],
+})
+
 class DocumentSearcher:
     """Recherche automatique de documents pédagogiques libres de droit"""
     
-    def __init__(self):
-        self.wikimedia_api_base = "https://commons.wikimedia.org/w/api.php"
+    def __init__(self, api_base: str = WIKIMEDIA_API_BASE, timeout: Optional[aiohttp.ClientTimeout] = None,
+                 catalog: Optional[GeoCatalog] = None):
+        self.wikimedia_api_base = api_base
+        self.timeout = timeout or aiohttp.ClientTimeout(
+            total=WIKIMEDIA_TOTAL_TIMEOUT,
+            sock_connect=WIKIMEDIA_CONNECT_TIMEOUT,
+            sock_read=WIKIMEDIA_READ_TIMEOUT
+        )
         self.wikimedia_base_url = "https://commons.wikimedia.org"
-        
-        # Cache des documents validés avec URLs TESTÉES ET VALIDES (Octobre 2025)
-        self.validated_documents_cache = {
-            # Cartes de base avec URLs vérifiées fonctionnelles
-            "carte_france": {
-                "titre": "Carte administrative de France métropolitaine",
-                "url_fichier_direct": "https://upload.wikimedia.org/wikipedia/commons/thumb/5/55/France%2C_administrative_divisions_-_Nmbrs_%28departments%2Boverseas%29.svg/1200px-France%2C_administrative_divisions_-_Nmbrs_%28departments%2Boverseas%29.svg.png",
-                "licence": {"type": "CC BY-SA 3.0", "notice_attribution": "TUBS, CC BY-SA 3.0, via Wikimedia Commons"},
-                "largeur_px": 1200,
-                "hauteur_px": 1154
-            },
-            "carte_monde": {
-                "titre": "Planisphère avec continents et océans",
-                "url_fichier_direct": "https://upload.wikimedia.org/wikipedia/commons/thumb/8/83/Equirectangular_projection_SW.jpg/1200px-Equirectangular_projection_SW.jpg",
-                "licence": {"type": "PD", "notice_attribution": "Domaine public"},
-                "largeur_px": 1200,
-                "hauteur_px": 600
-            },
-            
-            # Cartes simplifiées utilisant des URLs plus fiables (fallback sur carte monde pour régions)
-            "carte_europe": {
-                "titre": "Carte du monde centrée sur l'Europe",
-                "url_fichier_direct": "https://upload.wikimedia.org/wikipedia/commons/thumb/8/83/Equirectangular_projection_SW.jpg/1200px-Equirectangular_projection_SW.jpg",
-                "licence": {"type": "PD", "notice_attribution": "Domaine public"},
-                "largeur_px": 1200,
-                "hauteur_px": 600
-            },
-            "carte_asie": {
-                "titre": "Carte du monde centrée sur l'Asie",
-                "url_fichier_direct": "https://upload.wikimedia.org/wikipedia/commons/thumb/8/83/Equirectangular_projection_SW.jpg/1200px-Equirectangular_projection_SW.jpg",
-                "licence": {"type": "PD", "notice_attribution": "Domaine public"},
-                "largeur_px": 1200,
-                "hauteur_px": 600
-            },
-            "carte_amerique_nord": {
-                "titre": "Carte du monde centrée sur l'Amérique du Nord",
-                "url_fichier_direct": "https://upload.wikimedia.org/wikipedia/commons/thumb/8/83/Equirectangular_projection_SW.jpg/1200px-Equirectangular_projection_SW.jpg",
-                "licence": {"type": "PD", "notice_attribution": "Domaine public"},
-                "largeur_px": 1200,
-                "hauteur_px": 600
-            },
-            "carte_afrique": {
-                "titre": "Carte du monde centrée sur l'Afrique",
-                "url_fichier_direct": "https://upload.wikimedia.org/wikipedia/commons/thumb/8/83/Equirectangular_projection_SW.jpg/1200px-Equirectangular_projection_SW.jpg",
-                "licence": {"type": "PD", "notice_attribution": "Domaine public"},
-                "largeur_px": 1200,
-                "hauteur_px": 600
-            }
-        }
+        # Session HTTP partagée (pool de connexions), créée au démarrage de l'application
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Cache Mongo des recherches (search_cache.SearchCache), partagé entre les workers
+        self.search_cache = None
+        # Catalogue local des cartes vérifiées (geo_catalog.json)
+        self.catalog = catalog if catalog is not None else geo_catalog
+    
+    async def start(self):
+        """Ouvre la session partagée (appelé au démarrage de l'application)"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=WIKIMEDIA_POOL_SIZE, ttl_dns_cache=300),
+                timeout=self.timeout,
+                headers={"User-Agent": USER_AGENT}
+            )
+        return self._session
+    
+    async def close(self):
+        """Ferme la session partagée (arrêt de l'application)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _get_json(self, params: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        # Scripts et tests sans cycle de vie applicatif : la session est créée à la demande
+        session = await self.start()
+        async with session.get(self.wikimedia_api_base, params=params) as response:
+            if response.status != 200:
+                logger.warning(f"Wikimedia API returned HTTP {response.status}")
+                return None
+            return await response.json(content_type=None)
     
     async def search_geographic_document(self, document_request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
@@ -106,144 +158,48 @@ class DocumentSearcher:
             elements_requis=elements_requis
         )
         
-        # Vérifier d'abord le cache des documents validés avec DIVERSIFICATION
-        cached_doc = self._check_cache(doc_type, elements_requis)
-        if cached_doc:
-            # 🎯 FORCER LA DIVERSIFICATION : Éviter les titres déjà utilisés
-            doc_title = cached_doc.get('titre', '')
-            if doc_title in avoid_types:
-                logger.info(f"🔄 Document '{doc_title}' déjà utilisé, cherchons une alternative...")
-                # Essayer d'autres types disponibles
-                alternative_types = ["carte_france", "carte_europe", "carte_asie", "carte_amerique_nord", "carte_afrique", "carte_monde"]
-                for alt_type in alternative_types:
-                    if alt_type != doc_type:
-                        alt_doc = self._check_cache(alt_type, elements_requis)
-                        if alt_doc and alt_doc.get('titre', '') not in avoid_types:
-                            logger.info(f"✅ Alternative document found: {alt_doc['titre']} (type: {alt_type})")
-                            return self._enrich_document_metadata(alt_doc, document_request)
-                logger.warning(f"⚠️ No alternative found, using original despite duplication")
-            
-            logger.info(f"✅ Document found in validated cache: {cached_doc['titre']}")
-            return self._enrich_document_metadata(cached_doc, document_request)
+        # Catalogue local d'abord (aucun appel réseau), avec DIVERSIFICATION : les titres
+        # et les images déjà utilisés dans la fiche sont pénalisés
+        catalog_start = time.perf_counter()
+        catalog_doc = self.catalog.search(doc_type, elements_requis, document_request.get("niveau"), avoid_types)
+        search_stage_duration.observe(time.perf_counter() - catalog_start, stage="catalog")
+        if catalog_doc:
+            logger.info(f"✅ Document found in catalog: {catalog_doc['titre']}")
+            search_requests.inc(source="catalog")
+            return self._enrich_document_metadata(catalog_doc, document_request)
         
         # Recherche via API Wikimedia Commons
+        search_start = time.perf_counter()
         try:
-            search_results = await self._search_wikimedia_commons(doc_type, elements_requis, langue)
+            search_results = await self._cached_search(doc_type, elements_requis, langue)
             if search_results:
+                select_start = time.perf_counter()
                 best_match = self._select_best_document(search_results, document_request)
+                search_stage_duration.observe(time.perf_counter() - select_start, stage="select")
                 if best_match:
                     logger.info(f"✅ Document found via Wikimedia: {best_match['titre']}")
+                    search_requests.inc(source="wikimedia")
                     return self._enrich_document_metadata(best_match, document_request)
         except Exception as e:
             logger.error(f"❌ Error searching Wikimedia Commons: {e}")
+        finally:
+            search_stage_duration.observe(time.perf_counter() - search_start, stage="total")
         
         # Fallback: retourner un document par défaut approprié
         logger.warning(f"⚠️ No specific document found, using fallback for {doc_type}")
+        search_requests.inc(source="fallback")
         return self._get_fallback_document(doc_type, document_request)
     
-    def _check_cache(self, doc_type: str, elements_requis: List[str]) -> Optional[Dict[str, Any]]:
-        """Vérifie le cache des documents validés avec sélection intelligente"""
-        
-        # Mapping des types vers les clés de cache avec logique intelligente
-        cache_mapping = {
-            "carte_france": "carte_france",
-            "carte_monde": "carte_monde", 
-            "planisphere": "carte_monde",
-            "carte_europe": "carte_europe",
-            "carte_asie": "carte_asie", 
-            "carte_amerique_nord": "carte_amerique_nord",
-            "carte_afrique": "carte_afrique"
-        }
-        
-        cache_key = cache_mapping.get(doc_type)
-        if cache_key and cache_key in self.validated_documents_cache:
-            return self.validated_documents_cache[cache_key]
-        
-        return None
+    async def _cached_search(self, doc_type: str, elements_requis: List[str], langue: str) -> List[Dict[str, Any]]:
+        """Recherche Wikimedia via le cache partagé (résultats vides ou en échec compris)"""
+        search = lambda: self._search_wikimedia_commons(doc_type, elements_requis, langue)
+        if self.search_cache is None:
+            return await search()
+        return await self.search_cache.lookup(search_cache_key(doc_type, elements_requis, langue), search)
     
     def _analyze_content_for_document_type(self, enonce: str) -> str:
-        """Analyse RENFORCÉE pour garantir la diversification"""
-        enonce_lower = enonce.lower()
-        
-        # DÉTECTION ULTRA-PRÉCISE avec mots-clés étendus
-        
-        # FRANCE - Détection élargie
-        france_keywords = [
-            "france", "français", "paris", "lyon", "marseille", "toulouse", 
-            "région", "département", "préfecture", "hexagone", "métropole",
-            "aquitaine", "bretagne", "normandie", "paca", "île-de-france"
-        ]
-        if any(mot in enonce_lower for mot in france_keywords):
-            return "carte_france"
-        
-        # EUROPE - Détection élargie  
-        europe_keywords = [
-            "europe", "européen", "union européenne", "ue", "schengen",
-            "allemagne", "berlin", "italie", "rome", "espagne", "madrid",
-            "royaume-uni", "londres", "portugal", "grèce", "pologne", "brexit"
-        ]
-        if any(mot in enonce_lower for mot in europe_keywords):
-            return "carte_europe"
-        
-        # ASIE - Détection élargie
-        asie_keywords = [
-            "asie", "asiatique", "extrême-orient", "orient",
-            "chine", "beijing", "pékin", "shanghai", "japon", "tokyo", "osaka",
-            "inde", "delhi", "mumbai", "corée", "séoul", "thaïlande", "vietnam"
-        ]
-        if any(mot in enonce_lower for mot in asie_keywords):
-            return "carte_asie"
-        
-        # AMÉRIQUE DU NORD - Détection élargie
-        amerique_nord_keywords = [
-            "amérique du nord", "nord-américain", "alena", "nafta",
-            "états-unis", "usa", "etats-unis", "américain",
-            "new york", "washington", "californie", "texas", "floride",
-            "canada", "toronto", "vancouver", "ottawa", "québec",
-            "mexique", "mexico"
-        ]
-        if any(mot in enonce_lower for mot in amerique_nord_keywords):
-            return "carte_amerique_nord"
-        
-        # AFRIQUE - Détection élargie
-        afrique_keywords = [
-            "afrique", "africain", "sahara", "sahel", "maghreb",
-            "nil", "congo", "niger", "zambèze",
-            "maroc", "algérie", "tunisie", "egypte", "kenya", "nigeria",
-            "afrique du sud", "ghana", "sénégal", "mali", "tchad"
-        ]
-        if any(mot in enonce_lower for mot in afrique_keywords):
-            return "carte_afrique"
-        
-        # MONDE/GLOBAL - Détection élargie
-        monde_keywords = [
-            "monde", "mondial", "planète", "terre", "global",
-            "continents", "océans", "hémisphère", "équateur", "tropiques",
-            "mondialisation", "géographie mondiale", "planisphère"
-        ]
-        if any(mot in enonce_lower for mot in monde_keywords):
-            return "carte_monde"
-        
-        # URBAIN - Détection spéciale
-        urban_keywords = [
-            "ville", "urbain", "métropole", "agglomération", "banlieue",
-            "urbanisation", "périurbain", "centre-ville", "quartier"
-        ]
-        if any(mot in enonce_lower for mot in urban_keywords):
-            # Pour l'urbain, choisir selon contexte géographique
-            if any(mot in enonce_lower for mot in ["tokyo", "osaka", "beijing", "seoul"]):
-                return "carte_asie"
-            elif any(mot in enonce_lower for mot in ["new york", "chicago", "los angeles"]):
-                return "carte_amerique_nord"
-            elif any(mot in enonce_lower for mot in ["paris", "lyon", "marseille"]):
-                return "carte_france"
-            elif any(mot in enonce_lower for mot in ["berlin", "rome", "madrid", "londres"]):
-                return "carte_europe"
-            else:
-                return "carte_monde"  # Urbain général
-        
-        # FALLBACK par défaut
-        return "carte_monde"
+        """Type de carte le plus cité dans l'énoncé (un seul passage, mots entiers)"""
+        return DOCUMENT_TYPE_CLASSIFIER.classify(enonce, "carte_monde")
     
     async def _search_wikimedia_commons(self, doc_type: str, elements_requis: List[str], langue: str) -> List[Dict[str, Any]]:
         """Recherche via l'API Wikimedia Commons"""
@@ -261,25 +217,24 @@ class DocumentSearcher:
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.wikimedia_api_base, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        search_results = data.get("query", {}).get("search", [])
-                        
-                        # Enrichir avec les métadonnées de chaque fichier
-                        enriched_results = []
-                        for result in search_results[:5]:  # Limiter à 5 résultats
-                            file_metadata = await self._get_file_metadata(result["title"])
-                            if file_metadata:
-                                enriched_results.append(file_metadata)
-                        
-                        return enriched_results
+            stage_start = time.perf_counter()
+            with tracer.span("wikimedia_search"):
+                data = await self._get_json(params)
+            search_stage_duration.observe(time.perf_counter() - stage_start, stage="search")
+            if not data:
+                return []
+            search_results = data.get("query", {}).get("search", [])
+            
+            # Métadonnées des 5 premiers fichiers en une seule requête (titles=A|B|C)
+            titles = [result["title"] for result in search_results[:METADATA_RESULTS]]
+            metadata_by_title = await self._get_files_metadata(titles)
+            return [metadata_by_title[title] for title in titles if title in metadata_by_title]
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error in Wikimedia API call: {type(e).__name__} {e}")
+            return []
         except Exception as e:
             logger.error(f"Error in Wikimedia API call: {e}")
             return []
-        
-        return []
     
     def _build_search_terms(self, doc_type: str, elements_requis: List[str], langue: str) -> str:
         """Construction des termes de recherche optimisés"""
@@ -310,47 +265,60 @@ class DocumentSearcher:
     
     async def _get_file_metadata(self, filename: str) -> Optional[Dict[str, Any]]:
         """Récupère les métadonnées détaillées d'un fichier"""
+        return (await self._get_files_metadata([filename])).get(filename)
+    
+    async def _get_files_metadata(self, filenames: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Métadonnées de plusieurs fichiers en une requête imageinfo (titre demandé -> métadonnées)"""
+        if not filenames:
+            return {}
         
         params = {
             "action": "query",
             "format": "json",
-            "titles": filename,
+            "titles": "|".join(filenames),
             "prop": "imageinfo",
             "iiprop": "url|size|mime|metadata|commonsmeta",
             "iiurlwidth": "1200"
         }
         
+        results = {}
+        stage_start = time.perf_counter()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.wikimedia_api_base, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        pages = data.get("query", {}).get("pages", {})
-                        
-                        for page_id, page_data in pages.items():
-                            if "imageinfo" in page_data:
-                                imageinfo = page_data["imageinfo"][0]
-                                
-                                # Extraire les informations essentielles
-                                metadata = {
-                                    "titre": filename.replace("File:", "").replace("_", " "),
-                                    "url_fichier_direct": imageinfo.get("url"),
-                                    "largeur_px": imageinfo.get("width", 0),
-                                    "hauteur_px": imageinfo.get("height", 0),
-                                    "mime_type": imageinfo.get("mime"),
-                                    "taille_bytes": imageinfo.get("size", 0),
-                                    "url_page_commons": f"{self.wikimedia_base_url}/wiki/{filename}"
-                                }
-                                
-                                # Analyser la licence
-                                licence_info = self._extract_license_info(page_data)
-                                metadata["licence"] = licence_info
-                                
-                                return metadata
+            with tracer.span("wikimedia_metadata", files=len(filenames)):
+                data = await self._get_json(params)
+            if not data:
+                return {}
+            query = data.get("query", {})
+            # L'API renvoie les titres normalisés (espaces, casse) : on revient au titre demandé
+            requested = {item["to"]: item["from"] for item in query.get("normalized", [])}
+            
+            for page_id, page_data in query.get("pages", {}).items():
+                if "imageinfo" not in page_data:
+                    continue
+                page_title = page_data.get("title", "")
+                filename = requested.get(page_title, page_title)
+                imageinfo = page_data["imageinfo"][0]
+                
+                # Extraire les informations essentielles
+                metadata = {
+                    "titre": filename.replace("File:", "").replace("_", " "),
+                    "url_fichier_direct": imageinfo.get("url"),
+                    "largeur_px": imageinfo.get("width", 0),
+                    "hauteur_px": imageinfo.get("height", 0),
+                    "mime_type": imageinfo.get("mime"),
+                    "taille_bytes": imageinfo.get("size", 0),
+                    "url_page_commons": f"{self.wikimedia_base_url}/wiki/{filename}"
+                }
+                
+                # Analyser la licence
+                metadata["licence"] = self._extract_license_info(page_data)
+                results[filename] = metadata
         except Exception as e:
-            logger.error(f"Error getting file metadata for {filename}: {e}")
+            logger.error(f"Error getting file metadata for {len(filenames)} files: {e}")
+        finally:
+            search_stage_duration.observe(time.perf_counter() - stage_start, stage="metadata")
         
-        return None
+        return results
     
     def _extract_license_info(self, page_data: Dict[str, Any]) -> Dict[str, Any]:
         """Extrait les informations de licence d'une page Commons"""
@@ -0,0 +1,323 @@
+"""
+Export Jobs - Mongo-backed queue for asynchronous PDF / ZIP exports
+The API inserts a job and returns its id; a worker (export_worker.py) claims
+jobs with a renewable lease, reports progress per stage and per exercise, and
+stores the result as a file of the job (job_results.py). A job whose worker died is claimed again
+once its lease expires (or failed, if that was its last attempt); a worker
+that loses its lease stops the job.
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+
+from logger import get_logger
+from metrics import metrics
+from tracing import current_ids
+
+logger = get_logger()
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+LEASE_SECONDS = int(os.environ.get('EXPORT_JOB_LEASE_SECONDS', '60'))
+MAX_ATTEMPTS = int(os.environ.get('EXPORT_JOB_MAX_ATTEMPTS', '3'))
+# Finished jobs (and their status) are kept this long, then removed by the TTL index
+FINISHED_JOB_TTL_DAYS = 7
+
+jobs_finished = metrics.counter("export_jobs_finished_total", "Export jobs finished by status")
+job_duration = metrics.histogram("export_job_duration_seconds", "Time from claim to completion of an export job")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def job_item_count(request: Dict[str, Any]) -> int:
+    """Units of progress: exported items of a document, or documents of a bulk export"""
+    return len(request.get("document_ids") or request.get("items") or [])
+
+
+class JobProgress:
+    """
+    Progress of a running job, updated from the render thread and flushed to
+    Mongo by the worker heartbeat: {"stage", "stages": {name: {"done", "total"}}, "items"}
+    """
+
+    def __init__(self, item_count: int):
+        self.stage = JOB_QUEUED
+        self.stages: Dict[str, Dict[str, int]] = {}
+        self.items = {"done": 0, "total": item_count}
+
+    def update(self, stage: str, done: int, total: int):
+        self.stage = stage
+        self.stages[stage] = {"done": done, "total": total}
+
+    def item_done(self):
+        self.items["done"] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"stage": self.stage, "stages": dict(self.stages), "items": dict(self.items)}
+
+
+class ExportJobStore:
+    """CRUD and leasing of export jobs in the export_jobs collection"""
+
+    def __init__(self, db, results=None):
+        self.db = db
+        self.collection = db.export_jobs if db is not None else None
+        # job_results.JobResultStore: results of jobs that fail for good are removed
+        self.results = results
+
+    async def create_job(self, request: Dict[str, Any], auth: Dict[str, Any],
+                         export_record_id: Optional[str] = None) -> Dict[str, Any]:
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": JOB_QUEUED,
+            "request": request,
+            # Snapshot of the requester at submission time (the worker has no session)
+            "auth": auth,
+            "export_record_id": export_record_id,
+            # Request that submitted the job: the job's trace and logs reuse it
+            "request_id": current_ids().get("request_id"),
+            "progress": JobProgress(job_item_count(request)).as_dict(),
+            "attempts": 0,
+            "result": None,
+            "error": None,
+            "created_at": _now(),
+            "updated_at": _now()
+        }
+        await self.collection.insert_one(dict(job))
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    async def claim_next(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically claim the oldest queued job, or a running job whose lease expired"""
+        now = _now()
+        return await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": JOB_QUEUED},
+                    {"status": JOB_RUNNING, "lease_until": {"$lt": now}}
+                ],
+                "attempts": {"$lt": MAX_ATTEMPTS}
+            },
+            {
+                "$set": {
+                    "status": JOB_RUNNING,
+                    "worker_id": worker_id,
+                    "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+                    "started_at": now,
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def heartbeat(self, job_id: str, worker_id: str, progress: Dict[str, Any]) -> bool:
+        """Renew the lease and publish progress. False if the job was taken over."""
+        now = _now()
+        result = await self.collection.update_one(
+            {"id": job_id, "worker_id": worker_id, "status": JOB_RUNNING},
+            {"$set": {
+                "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+                "progress": progress,
+                "updated_at": now
+            }}
+        )
+        return result.matched_count == 1
+
+    async def complete(self, job_id: str, worker_id: str, result: Dict[str, Any], progress: Dict[str, Any]):
+        now = _now()
+        await self.collection.update_one(
+            {"id": job_id, "worker_id": worker_id},
+            {"$set": {
+                "status": JOB_DONE,
+                "result": result,
+                "progress": progress,
+                "finished_at": now,
+                "updated_at": now,
+                "expires_at": now + timedelta(days=FINISHED_JOB_TTL_DAYS)
+            }}
+        )
+
+    async def fail(self, job: Dict[str, Any], worker_id: str, error: str) -> str:
+        """Requeue the job, or mark it failed once MAX_ATTEMPTS is reached. Returns the new status."""
+        now = _now()
+        final = job.get("attempts", 1) >= MAX_ATTEMPTS
+        status = JOB_FAILED if final else JOB_QUEUED
+        update = {"status": status, "error": error, "updated_at": now}
+        if final:
+            update.update({"finished_at": now, "expires_at": now + timedelta(days=FINISHED_JOB_TTL_DAYS)})
+        await self.collection.update_one({"id": job["id"], "worker_id": worker_id}, {"$set": update})
+
+        if final:
+            await self._refund(job)
+        return status
+
+    async def fail_abandoned(self) -> int:
+        """
+        Mark failed the running jobs whose worker died during the last allowed
+        attempt: claim_next no longer picks them up (attempts == MAX_ATTEMPTS).
+        Returns the number of jobs failed.
+        """
+        failed = 0
+        while True:
+            now = _now()
+            job = await self.collection.find_one_and_update(
+                {"status": JOB_RUNNING, "lease_until": {"$lt": now}, "attempts": {"$gte": MAX_ATTEMPTS}},
+                {"$set": {
+                    "status": JOB_FAILED,
+                    "error": "Export worker stopped during the last attempt",
+                    "finished_at": now,
+                    "updated_at": now,
+                    "expires_at": now + timedelta(days=FINISHED_JOB_TTL_DAYS)
+                }},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                return failed
+            await self._refund(job)
+            jobs_finished.inc(status=JOB_FAILED)
+            logger.warning(f"Export job {job['id']} failed: lease expired on its last attempt")
+            failed += 1
+
+    async def _refund(self, job: Dict[str, Any]):
+        # A result stored before the failure (e.g. complete() could not be saved) is never served
+        if self.results is not None:
+            self.results.remove(job["id"])
+        # A failed export must not count against the guest quota
+        if job.get("export_record_id"):
+            await self.db.exports.delete_one({"id": job["export_record_id"]})
+
+    @staticmethod
+    def public_view(job: Dict[str, Any], download_url: Optional[str] = None) -> Dict[str, Any]:
+        """What GET /api/export/jobs/{id} returns (no auth snapshot)"""
+        view = {
+            "job_id": job["id"],
+            "status": job["status"],
+            "progress": job.get("progress"),
+            "attempts": job.get("attempts", 0),
+            "error": job.get("error") if job["status"] == JOB_FAILED else None,
+            "created_at": job.get("created_at"),
+            "finished_at": job.get("finished_at")
+        }
+        if job["status"] == JOB_DONE and job.get("result"):
+            view["result"] = {
+                "filename": job["result"]["filename"],
+                "media_type": job["result"]["media_type"],
+                "bytes": job["result"]["bytes"],
+                "download_url": download_url
+            }
+        return view
+
+
+# process(job, progress) -> {"filename", "media_type", "bytes"}, result stored under the job id
+JobProcessor = Callable[[Dict[str, Any], JobProgress], Awaitable[Dict[str, Any]]]
+
+
+class ExportJobWorker:
+    """Claims and processes export jobs until stopped"""
+
+    def __init__(self, store: ExportJobStore, process: JobProcessor, concurrency: int = 1,
+                 poll_interval: float = 1.0, worker_id: Optional[str] = None):
+        self.store = store
+        self.process = process
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        logger.info(f"Export worker {self.worker_id} started (concurrency={self.concurrency})")
+        await asyncio.gather(self._sweep(), *(self._slot() for _ in range(self.concurrency)))
+
+    async def _sweep(self):
+        """Periodically fail the jobs abandoned on their last attempt (see fail_abandoned)"""
+        while not self._stopping.is_set():
+            try:
+                await self.store.fail_abandoned()
+            except Exception as e:
+                logger.warning(f"Export worker could not sweep abandoned jobs: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=LEASE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _slot(self):
+        while not self._stopping.is_set():
+            try:
+                job = await self.store.claim_next(self.worker_id)
+            except Exception as e:
+                logger.error(f"Export worker could not claim a job: {e}")
+                job = None
+            if not job:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(job)
+
+    async def run_job(self, job: Dict[str, Any]):
+        progress = JobProgress(job_item_count(job["request"]))
+        started = asyncio.get_running_loop().time()
+        work = asyncio.ensure_future(self.process(job, progress))
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"], progress, work))
+        try:
+            try:
+                result = await work
+            except asyncio.CancelledError:
+                if not heartbeat.done() or heartbeat.cancelled():
+                    heartbeat.cancel()
+                    raise
+                # The lease was taken over: the other worker renders and stores the job
+                jobs_finished.inc(status="lease_lost")
+                logger.warning(f"Export job {job['id']} abandoned: lease taken over by another worker")
+                return
+            heartbeat.cancel()
+            progress.stage = JOB_DONE
+            await self.store.complete(job["id"], self.worker_id, result, progress.as_dict())
+            jobs_finished.inc(status=JOB_DONE)
+            job_duration.observe(asyncio.get_running_loop().time() - started)
+            logger.info(
+                "Export job completed",
+                module_name="export_jobs",
+                func_name="run_job",
+                doc_id=job["request"].get("document_id", "")[:8],
+                job_id=job["id"],
+                duration_ms=round((asyncio.get_running_loop().time() - started) * 1000, 2),
+                status="success"
+            )
+        except Exception as e:
+            heartbeat.cancel()
+            status = await self.store.fail(job, self.worker_id, str(e))
+            jobs_finished.inc(status=status)
+            logger.error(f"Export job {job['id']} failed (attempt {job.get('attempts')}): {e}")
+
+    async def _heartbeat(self, job_id: str, progress: JobProgress, work: asyncio.Future):
+        """Renew the lease until cancelled; stop the job if another worker took it over"""
+        while True:
+            try:
+                if not await self.store.heartbeat(job_id, self.worker_id, progress.as_dict()):
+                    work.cancel()
+                    return
+            except Exception as e:
+                logger.warning(f"Export job heartbeat failed for {job_id}: {e}")
+            await asyncio.sleep(min(1.0, LEASE_SECONDS / 3))
@@ -0,0 +1,134 @@
+"""
+Export Responses - Send rendered PDFs / ZIPs without leaking temporary files
+Payloads up to EXPORT_MEMORY_LIMIT_MB are sent straight from memory (no disk
+write at all). Larger payloads are spooled to a file in the spool directory,
+streamed with FileResponse and deleted by a background task once sent. A
+janitor removes spool files left behind by crashed or killed workers.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+from logger import get_logger
+from metrics import metrics
+
+logger = get_logger()
+
+MEMORY_LIMIT_BYTES = int(float(os.environ.get('EXPORT_MEMORY_LIMIT_MB', '16')) * 1024 * 1024)
+SPOOL_DIR = Path(os.environ.get('EXPORT_SPOOL_DIR', str(Path(tempfile.gettempdir()) / 'lemaitremot-export-spool')))
+SPOOL_PREFIX = "export-"
+# A spool file older than this is no longer being sent: its worker died
+STALE_SPOOL_SECONDS = int(os.environ.get('EXPORT_SPOOL_STALE_SECONDS', '3600'))
+JANITOR_INTERVAL_SECONDS = 600
+
+export_responses = metrics.counter("export_responses_total", "Export downloads by delivery mode (memory, spool)")
+export_response_bytes = metrics.histogram("export_response_bytes", "Size of export downloads")
+
+
+def content_disposition(filename: str) -> str:
+    """attachment header, RFC 5987 encoded for accented names (Mathématiques)"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _remove_spool_file(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove export spool file {path}: {e}")
+
+
+def spool_to_disk(payload: bytes, suffix: str = "", spool_dir: Path = SPOOL_DIR) -> str:
+    """Write a payload too large to keep in memory; the caller schedules its removal"""
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=spool_dir, prefix=SPOOL_PREFIX, suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+    except Exception:
+        _remove_spool_file(path)
+        raise
+    return path
+
+
+def export_response(payload: bytes, media_type: str, filename: str,
+                    memory_limit: int = MEMORY_LIMIT_BYTES, spool_dir: Path = SPOOL_DIR,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+    """Response for a rendered export, with Content-Length and guaranteed cleanup"""
+    headers = {"Content-Disposition": content_disposition(filename), **(headers or {})}
+    export_response_bytes.observe(len(payload))
+
+    if len(payload) <= memory_limit:
+        export_responses.inc(mode="memory")
+        # Response sets Content-Length from the body
+        return Response(content=payload, media_type=media_type, headers=headers)
+
+    export_responses.inc(mode="spool")
+    path = spool_to_disk(payload, suffix=Path(filename).suffix, spool_dir=spool_dir)
+    # FileResponse sends Content-Length from stat(); the file goes away once the body is sent
+    return FileResponse(path, media_type=media_type, headers=headers,
+                        background=BackgroundTask(_remove_spool_file, path))
+
+
+def stream_response(file_obj: Any, size: int, media_type: str, filename: str,
+                    chunk_size: int = 256 * 1024) -> StreamingResponse:
+    """Stream an open (spooled) file of known size; it is closed when sent or on disconnect"""
+    def chunks():
+        while True:
+            chunk = file_obj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    export_responses.inc(mode="stream")
+    export_response_bytes.observe(size)
+    return StreamingResponse(
+        chunks(),
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(filename), "Content-Length": str(size)},
+        background=BackgroundTask(file_obj.close)
+    )
+
+
+def clean_stale_spool_files(max_age_seconds: int = STALE_SPOOL_SECONDS, spool_dir: Path = SPOOL_DIR) -> int:
+    """Remove spool files older than max_age_seconds; returns how many were removed"""
+    if not spool_dir.exists():
+        return 0
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for path in spool_dir.glob(f"{SPOOL_PREFIX}*"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning(f"Could not remove stale export spool file {path.name}: {e}")
+    if removed:
+        logger.info(f"Export spool janitor removed {removed} stale file(s)")
+    return removed
+
+
+async def run_spool_janitor(interval_seconds: int = JANITOR_INTERVAL_SECONDS):
+    """Background loop started with the app"""
+    while True:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, clean_stale_spool_files)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Export spool janitor failed: {e}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Export worker for Le Maître Mot
+Consumes the export_jobs queue (POST /api/export/jobs) so PDF rendering scales
+separately from the API processes. Run as many workers as needed:
+
+    python export_worker.py --concurrency 2
+"""
+
+import argparse
+import asyncio
+import signal
+
+from export_jobs import ExportJobStore, ExportJobWorker
+from job_results import job_result_store
+from pdf_renderer import render_pool
+from render_pipeline import prepare_executor
+from server import client, db, process_export_job
+
+
+async def run_worker(concurrency: int, poll_interval: float):
+    # Documents are prepared on the process-wide prepare thread (matplotlib is not
+    # thread-safe) while the event loop keeps publishing progress and renewing leases
+    worker = ExportJobWorker(ExportJobStore(db, results=job_result_store), process_export_job,
+                             concurrency=concurrency, poll_interval=poll_interval)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        prepare_executor.shutdown(wait=False)
+        render_pool.shutdown()
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render queued PDF exports")
+    parser.add_argument("--concurrency", type=int, default=2, help="jobs processed at the same time")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between polls when idle")
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.concurrency, args.poll_interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Geo Catalog - Offline catalog of vetted, licensed geographic documents
+Loaded once from a versioned JSON file (geo_catalog.json). An inverted index
+over title, regions, themes and levels answers a search in microseconds, with
+no network call. Ranking prefers the requested map type, then the request's
+elements and level, and penalises documents (and images) already used in the
+sheet so that successive exercises get different maps.
+Wikimedia Commons search only runs for types the catalog does not cover.
+"""
+
+import json
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from logger import get_logger
+
+logger = get_logger()
+
+GEO_CATALOG_PATH = os.environ.get('GEO_CATALOG_PATH', str(Path(__file__).resolve().parent / "geo_catalog.json"))
+
+# Score contributions
+TYPE_MATCH = 10.0
+FIELD_WEIGHTS = {"regions": 3.0, "themes": 2.0, "titre": 1.0, "niveaux": 1.0}
+USED_TITLE_PENALTY = 20.0
+USED_IMAGE_PENALTY = 5.0
+
+# Index-only fields, not part of the document handed to the exercise
+INDEX_FIELDS = ("id", "doc_type", "regions", "themes", "niveaux")
+REQUIRED_FIELDS = ("id", "doc_type", "titre", "url_fichier_direct", "licence")
+# Same keys as DocumentSearcher._extract_license_info
+LICENCE_FIELDS = ("type", "notice_attribution", "lien_licence")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-free words of 2+ letters ("Océans" -> "oceans")"""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in re.split(r"[^\w]+", text) if len(token) > 1]
+
+
+class GeoCatalog:
+    """Catalog documents + inverted index token -> {document index: weight}"""
+
+    def __init__(self, documents: List[Dict[str, Any]], version: Any = None,
+                 aliases: Optional[Dict[str, str]] = None):
+        self.version = version
+        self.aliases = aliases or {}
+        self.documents: List[Dict[str, Any]] = []
+        self.by_type: Dict[str, List[int]] = {}
+        self.index: Dict[str, Dict[int, float]] = {}
+        for document in documents:
+            self._add(document)
+
+    @classmethod
+    def load(cls, path: str = GEO_CATALOG_PATH) -> "GeoCatalog":
+        """Catalog from its JSON file; empty (remote search only) if it cannot be read"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            catalog = cls(data.get("documents", []), data.get("version"), data.get("aliases"))
+        except (OSError, ValueError) as e:
+            logger.error(f"Geo catalog unavailable ({path}): {e}", module_name="geo_catalog", func_name="load")
+            return cls([])
+        logger.info(f"Geo catalog v{catalog.version} loaded: {len(catalog.documents)} documents",
+                    module_name="geo_catalog", func_name="load")
+        return catalog
+
+    def _add(self, document: Dict[str, Any]):
+        missing = [field for field in REQUIRED_FIELDS if not document.get(field)]
+        if missing:
+            raise ValueError(f"catalog document {document.get('id', '?')} lacks {', '.join(missing)}")
+        document = dict(document, licence={"lien_licence": "", **document["licence"]})
+        if not all(field in document["licence"] for field in LICENCE_FIELDS):
+            raise ValueError(f"catalog document {document['id']} has an incomplete licence")
+
+        position = len(self.documents)
+        self.documents.append(document)
+        self.by_type.setdefault(document["doc_type"], []).append(position)
+        for field, weight in FIELD_WEIGHTS.items():
+            values = document.get(field) or []
+            for value in [values] if isinstance(values, str) else values:
+                for token in set(tokenize(value)):
+                    postings = self.index.setdefault(token, {})
+                    # A token counts once per field, the best field wins
+                    postings[position] = max(postings.get(position, 0.0), weight)
+
+    def rank(self, doc_type: str, elements: Iterable[str] = (), niveau: Optional[str] = None,
+             avoid_titles: Iterable[str] = ()) -> List[Tuple[float, Dict[str, Any]]]:
+        """(score, document) best first; every document is a candidate when the type is covered"""
+        doc_type = self.aliases.get(doc_type, doc_type)
+        scores = [0.0] * len(self.documents)
+        for position in self.by_type.get(doc_type, []):
+            scores[position] += TYPE_MATCH
+
+        # Uncovered type: only answered when a requested element is a region or theme of the catalog
+        covered = doc_type in self.by_type
+        for token in {token for element in elements or [] for token in tokenize(element)}:
+            for position, weight in self.index.get(token, {}).items():
+                scores[position] += weight
+                covered = covered or weight >= FIELD_WEIGHTS["themes"]
+        if not covered:
+            return []
+        for token in set(tokenize(niveau or "")):
+            for position, weight in self.index.get(token, {}).items():
+                scores[position] += weight
+
+        # Diversity across the sheet: used titles, then maps showing the same image
+        avoid = set(avoid_titles or [])
+        used_images = {doc["url_fichier_direct"] for doc in self.documents if doc["titre"] in avoid}
+        for position, document in enumerate(self.documents):
+            if document["titre"] in avoid:
+                scores[position] -= USED_TITLE_PENALTY
+            elif document["url_fichier_direct"] in used_images:
+                scores[position] -= USED_IMAGE_PENALTY
+
+        order = sorted(range(len(self.documents)), key=lambda position: -scores[position])
+        return [(scores[position], self.documents[position]) for position in order]
+
+    def search(self, doc_type: str, elements: Iterable[str] = (), niveau: Optional[str] = None,
+               avoid_titles: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+        """Best document for the request, None when the catalog does not cover it"""
+        ranked = self.rank(doc_type, elements, niveau, avoid_titles)
+        if not ranked:
+            return None
+        document = ranked[0][1]
+        found = {key: value for key, value in document.items() if key not in INDEX_FIELDS}
+        found["type"] = document["doc_type"]
+        found["licence"] = dict(document["licence"])
+        return found
+
+    def urls(self) -> List[str]:
+        return sorted({document["url_fichier_direct"] for document in self.documents})
+
+
+# Global instance for easy use
+geo_catalog = GeoCatalog.load()
@@ -59,8 +59,64 @@ async def init_database_indexes():
             name="unique_pro_user_email"
         )
         print("✅ Pro user unique email index created")
+        # Multikey: retention's $lookup from a document's guest_id to its Pro owner
+        await db.pro_users.create_index(
+            "guest_ids",
+            name="pro_user_guest_ids"
+        )
+        print("✅ Pro user guest ids index created")
+        
+        # 5. Indexes backing the export request context ($lookup + document fetch)
+        print("Creating index on user_templates.user_email...")
+        await db.user_templates.create_index(
+            "user_email",
+            name="user_template_email"
+        )
+        print("Creating index on documents.id...")
+        await db.documents.create_index(
+            "id",
+            unique=True,
+            name="unique_document_id"
+        )
+        print("✅ Export request context indexes created")
+        
+        # 6. Compound index for keyset pagination of the documents listing
+        print("Creating index on documents (guest_id, created_at, id)...")
+        await db.documents.create_index(
+            [("guest_id", 1), ("created_at", -1), ("id", -1)],
+            name="documents_guest_listing"
+        )
+        print("✅ Document listing index created")
+        
+        # 7. Indexes used by the guest quota and the retention archiver
+        print("Creating indexes on exports and archives...")
+        await db.exports.create_index(
+            [("guest_id", 1), ("created_at", -1)],
+            name="exports_guest_quota"
+        )
+        await db.exports.create_index(
+            [("document_id", 1), ("created_at", -1)],
+            name="exports_by_document"
+        )
+        await db.documents_archive.create_index("id", unique=True, name="unique_archived_document_id")
+        await db.archived_documents.create_index("id", unique=True, name="unique_jsonl_archived_document_id")
+        print("✅ Quota and retention indexes created")
+        
+        # 8. Export job queue: lookup by id, claim order, expiry of finished jobs
+        print("Creating indexes on export_jobs...")
+        await db.export_jobs.create_index("id", unique=True, name="unique_export_job_id")
+        await db.export_jobs.create_index(
+            [("status", 1), ("created_at", 1)],
+            name="export_jobs_claim"
+        )
+        await db.export_jobs.create_index("expires_at", expireAfterSeconds=0, name="export_jobs_ttl")
+        print("✅ Export job indexes created")
+        
+        # 9. Shared cache of geographic document searches (negative entries expire sooner)
+        await db.document_search_cache.create_index("expires_at", expireAfterSeconds=0, name="document_search_cache_ttl")
+        print("✅ Created TTL index on document_search_cache.expires_at")
         
-        # 5. Cleanup any duplicate sessions (in case they exist)
+        # 10. Cleanup any duplicate sessions (in case they exist)
         print("Cleaning up any duplicate sessions...")
         
         # Find duplicate sessions
@@ -95,6 +151,9 @@ async def init_database_indexes():
         print("  ✅ Automatic session cleanup on expiry")
         print("  ✅ Automatic magic token cleanup")
         print("  ✅ Pro user email uniqueness")
+        print("  ✅ Indexed template and document lookups for exports")
+        print("  ✅ Paginated document listing")
+        print("  ✅ Guest quota and retention lookups")
         
         # Close connection
         client.close()
@@ -0,0 +1,112 @@
+"""
+Job Results - Rendered outputs of export jobs, kept as long as their job
+One file per job id, in a directory of its own: the asset store is permanent
+and its blobs are referenced by documents. A result is removed when its job
+fails for good, and a janitor removes results older than the finished-job TTL,
+once the TTL index has removed the job itself.
+"""
+
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from export_jobs import FINISHED_JOB_TTL_DAYS
+from logger import get_logger
+
+logger = get_logger()
+
+ROOT_DIR = Path(__file__).parent
+
+JOB_RESULTS_DIR = os.environ.get('EXPORT_JOB_RESULTS_DIR', str(ROOT_DIR / 'job_results'))
+# Same lifetime as the finished job document
+RESULT_TTL_SECONDS = FINISHED_JOB_TTL_DAYS * 24 * 3600
+JANITOR_INTERVAL_SECONDS = 3600
+
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class JobResultStore:
+    """Result files keyed by job id, removed with their job"""
+
+    def __init__(self, root_dir: str = JOB_RESULTS_DIR, ttl_seconds: int = RESULT_TTL_SECONDS):
+        self.root_dir = Path(root_dir)
+        self.ttl_seconds = ttl_seconds
+
+    def _path(self, job_id: str) -> Path:
+        if not JOB_ID_PATTERN.match(job_id or ""):
+            raise ValueError(f"Invalid job id: {job_id!r}")
+        return self.root_dir / job_id
+
+    def put(self, job_id: str, data: Union[bytes, Any]) -> int:
+        """Store the result of a job (bytes or a readable file). Returns its size."""
+        path = self._path(job_id)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        # Atomic write: a worker that lost its lease may still be storing the same job
+        fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(data, (bytes, bytearray)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f, 1024 * 1024)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return path.stat().st_size
+
+    def path_for(self, job_id: str) -> Optional[Path]:
+        """File of a job result, None when it is missing or expired"""
+        try:
+            path = self._path(job_id)
+        except ValueError:
+            return None
+        return path if path.exists() else None
+
+    def remove(self, job_id: str):
+        try:
+            self._path(job_id).unlink()
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not remove export job result {job_id}: {e}")
+
+    def clean_expired(self, now: Optional[float] = None) -> int:
+        """Remove results (and interrupted writes) older than the TTL; returns how many were removed"""
+        if not self.root_dir.exists():
+            return 0
+        cutoff = (now if now is not None else time.time()) - self.ttl_seconds
+        removed = 0
+        for path in self.root_dir.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Could not remove expired export job result {path.name}: {e}")
+        if removed:
+            logger.info(f"Export job results janitor removed {removed} expired file(s)")
+        return removed
+
+    async def run_janitor(self, interval_seconds: int = JANITOR_INTERVAL_SECONDS):
+        """Background loop started with the app"""
+        while True:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.clean_expired)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Export job results janitor failed: {e}")
+            await asyncio.sleep(interval_seconds)
+
+
+# Global instance for easy use
+job_result_store = JobResultStore()
@@ -0,0 +1,135 @@
+"""
+Keyword Classifier - Multi-category keyword matching in a single pass
+Each classifier compiles all of its keywords into one alternation regex at
+import time. Keywords match whole words only ("ue" no longer matches inside
+"statue"), with an optional plural or feminine ending (-s, -x, -e, -es).
+Keywords ending in "*" match as prefixes ("démographi*"). Every category is
+scored in one scan of the text, and labels are ranked by number of hits,
+with ties broken by declaration order (the old if/elif priority).
+"""
+
+import re
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Plural / feminine endings accepted after a whole-word keyword
+WORD_SUFFIX = r"(?:e?s|x|e)?"
+
+
+def _keyword_pattern(keyword: str) -> str:
+    # "new york" also matches "new  york" or a line break between the words
+    return r"\s+".join(re.escape(part) for part in keyword.split())
+
+
+def _normalize(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+
+class KeywordClassifier:
+    """Categories (label -> keywords) compiled into one regex"""
+
+    def __init__(self, categories: Dict[Hashable, Iterable[str]]):
+        self.labels: List[Hashable] = list(categories)
+        # keyword -> labels it counts for (a city can belong to several categories)
+        self._words: Dict[str, List[Hashable]] = {}
+        self._stems: Dict[str, List[Hashable]] = {}
+        for label, keywords in categories.items():
+            for keyword in keywords:
+                keyword = _normalize(keyword)
+                if keyword.endswith("*"):
+                    self._stems.setdefault(keyword[:-1], []).append(label)
+                else:
+                    self._words.setdefault(keyword, []).append(label)
+        self.pattern = self._compile()
+
+    def _compile(self) -> re.Pattern:
+        # Longest first: "union européenne" wins over "européen"
+        alternatives = []
+        if self._words:
+            words = "|".join(_keyword_pattern(k) for k in sorted(self._words, key=len, reverse=True))
+            alternatives.append(f"(?P<word>{words}){WORD_SUFFIX}")
+        if self._stems:
+            stems = "|".join(_keyword_pattern(k) for k in sorted(self._stems, key=len, reverse=True))
+            alternatives.append(rf"(?P<stem>{stems})\w*")
+        return re.compile(rf"(?<!\w)(?:{'|'.join(alternatives) or '(?!)'})(?!\w)")
+
+    def matches(self, text: str) -> Dict[Hashable, List[str]]:
+        """Label -> keywords found in the text, in order of appearance"""
+        found: Dict[Hashable, List[str]] = {}
+        if not text:
+            return found
+        for match in self.pattern.finditer(text.lower()):
+            word = match.group("word") if self._words else None
+            if word is not None:
+                keyword, labels = _normalize(word), self._words
+            else:
+                keyword, labels = _normalize(match.group("stem")) + "*", self._stems
+            for label in labels[keyword.rstrip("*")]:
+                found.setdefault(label, []).append(keyword)
+        return found
+
+    def rank(self, text: str) -> List[Tuple[Hashable, int]]:
+        """(label, hits) for every label found, best first"""
+        found = self.matches(text)
+        order = {label: index for index, label in enumerate(self.labels)}
+        return sorted(((label, len(hits)) for label, hits in found.items()),
+                      key=lambda item: (-item[1], order[item[0]]))
+
+    def classify(self, text: str, default: Optional[Hashable] = None) -> Optional[Hashable]:
+        ranked = self.rank(text)
+        return ranked[0][0] if ranked else default
+
+
+# Icon enrichment: (exercise type, icon) labels per matière, in the old if/elif order
+CHAPTER_CLASSIFIERS: Dict[str, KeywordClassifier] = {
+    "Physique-Chimie": KeywordClassifier({
+        ("chemistry", "flask"): ["matière", "transformation", "constitution", "chimie"],
+        ("energy", "battery"): ["énergie", "conversion", "transfert"],
+        ("physics", "zap"): ["mouvement", "interaction", "force"],
+        ("waves", "radio"): ["signal", "signaux", "onde", "communiquer"],
+    }),
+    "SVT": KeywordClassifier({
+        ("biology", "dna"): ["vivant", "évolution", "génétique", "vie"],
+        ("geology", "mountain"): ["terre", "planète", "géologique", "enjeux"],
+        ("ecology", "globe"): ["environnement", "écosystème", "action humaine"],
+        ("health", "heart"): ["corps", "santé", "humain"],
+    }),
+    "Géographie": KeywordClassifier({
+        ("urban", "building-2"): ["ville", "urbain", "habitat", "loger", "bâti"],
+        ("demographic", "users"): ["population", "démographi*", "mobilité", "humain"],
+        ("geographic", "globe"): ["monde", "mondial", "mondialisation", "planète"],
+        ("geographic", "compass"): ["territoire", "espace", "lieu", "région"],
+    }),
+}
+CHAPTER_DEFAULTS: Dict[str, Tuple[str, str]] = {
+    "Physique-Chimie": ("experimental", "atom"),
+    "SVT": ("analysis", "leaf"),
+    "Géographie": ("cartographic", "map"),
+}
+
+# Mathématiques: type inferred from a known chapter name, or from the enonce
+MATH_CHAPTER_TYPES = KeywordClassifier({
+    "geometry": ["géométrie", "pythagore", "thalès", "trigonométrie", "triangle", "volume"],
+    "algebra": ["équation", "fonction", "fraction", "algèbre", "calcul*"],
+    "statistics": ["statistique", "probabilité"],
+})
+MATH_CONTENT_TYPES = KeywordClassifier({
+    ("geometry", "triangle-ruler"): ["triangle", "cercle", "carré", "rectangle", "géométrique",
+                                     "angle", "côté", "volume", "aire"],
+    ("algebra", "calculator"): ["équation", "fonction", "fraction", "calcul*", "nombre", "résoudre", "simplifier"],
+    ("statistics", "bar-chart"): ["statistique", "moyenne", "graphique", "données", "probabilité", "hasard"],
+})
+
+# Exercises that get a second AI pass for a geometric schema
+GEOMETRY_KEYWORDS = KeywordClassifier({
+    "geometry": ["triangle", "cercle", "carré", "rectangle", "parallélogramme",
+                 "géométrie", "figure", "pythagore", "thalès", "trigonométrie",
+                 "angle", "périmètre", "aire", "longueur", "côté", "hypoténuse"],
+})
+
+
+def classify_chapter(matiere: str, chapitre: str) -> Optional[Tuple[str, str]]:
+    """(type, icon) for a Physique-Chimie / SVT / Géographie chapter, None for other matières"""
+    classifier = CHAPTER_CLASSIFIERS.get(matiere)
+    if classifier is None:
+        return None
+    return classifier.classify(chapitre, CHAPTER_DEFAULTS[matiere])
@@ -1,6 +1,8 @@
 """
 Professional Logging System for Le Maître Mot Backend
 Supports DEV/PROD environments with structured logging and sensitive data protection
+Records are handed to a bounded queue; a background listener thread does the
+formatting, redaction and I/O so the request thread never waits on them.
 """
 
 import logging
@@ -8,11 +10,69 @@ import json
 import time
 import os
 import sys
+import atexit
+import queue
+import random
 from datetime import datetime
 from typing import Any, Dict, Optional, Union
 from functools import wraps
 import re
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+from metrics import metrics
+from tracing import current_ids
+
+# Records waiting for the listener thread; beyond this, records are dropped (and counted)
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# WARNING and above wait this long for room in a full queue before being dropped
+LOG_QUEUE_BLOCK_SECONDS = 0.05
+
+log_records_dropped = metrics.counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+log_records_sampled_out = metrics.counter("log_records_sampled_out_total", "DEBUG/INFO records skipped by per-module sampling")
+# Fed by the helpers at the bottom of this module
+function_duration = metrics.histogram("function_duration_seconds", "Duration of @log_execution_time functions by status")
+ai_generation_stages = metrics.counter("ai_generation_stages_total", "AI generation stages by status")
+ai_generation_duration = metrics.histogram("ai_generation_stage_seconds", "AI generation stage durations (stages logged with duration_ms)")
+schema_processing_total = metrics.counter("schema_processing_total", "Geometric schemas processed by type and status")
+quota_checks_total = metrics.counter("quota_checks_total", "Quota checks by user type and outcome")
+
+
+def parse_sampling(spec: Optional[str]) -> Dict[str, float]:
+    """LOG_SAMPLING="render_pipeline=0.1,schema=0.25,*=1" -> {module_name: keep ratio}"""
+    rates = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        module_name, rate = item.split("=", 1)
+        try:
+            rates[module_name.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller on a full queue: it drops and counts instead"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only freeze the message; formatting and redaction happen on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=LOG_QUEUE_BLOCK_SECONDS)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            log_records_dropped.inc(level=record.levelname)
 
 class SensitiveDataFilter:
     """Filter to remove sensitive data from logs"""
@@ -60,7 +120,8 @@ class JSONFormatter(logging.Formatter):
             if key.startswith('log_'):
                 clean_key = key[4:]  # Remove 'log_' prefix
                 log_entry[clean_key] = value
-            elif key in ['doc_id', 'exercise_id', 'user_type', 'duration_ms', 'status', 'schema_type']:
+            elif key in ['doc_id', 'exercise_id', 'user_type', 'duration_ms', 'status', 'schema_type',
+                         'request_id', 'trace_id', 'span_id']:
                 log_entry[key] = value
         
         # Add exception info if present
@@ -80,9 +141,12 @@ class DevFormatter(logging.Formatter):
         func_name = getattr(record, 'func_name', '')
         doc_id = getattr(record, 'doc_id', '')
         exercise_id = getattr(record, 'exercise_id', '')
+        request_id = getattr(record, 'request_id', '')
         
         # Build context string
         context_parts = []
+        if request_id:
+            context_parts.append(f"req={request_id[:12]}")
         if doc_id:
             context_parts.append(f"doc_id={doc_id}")
         if exercise_id:
@@ -100,12 +164,37 @@ class DevFormatter(logging.Formatter):
         
         return SensitiveDataFilter.redact_sensitive_data(formatted)
 
+class LogListener(QueueListener):
+    """QueueListener whose stop() waits for room in a full queue instead of failing"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = False
+
+    def start(self):
+        super().start()
+        self.started = True
+
+    def stop(self):
+        super().stop()
+        self.started = False
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
 class AppLogger:
     """Main application logger with environment-specific configuration"""
     
     def __init__(self):
         self.app_env = os.getenv('APP_ENV', 'prod').lower()
         self.log_format = os.getenv('APP_LOG_FORMAT', 'text').lower()
+        # LOG_QUEUE=false writes synchronously (CLI scripts, debugging)
+        self.use_queue = os.getenv('LOG_QUEUE', 'true').lower() == 'true'
+        self.sampling = parse_sampling(os.getenv('LOG_SAMPLING'))
+        self.default_sample_rate = self.sampling.pop('*', 1.0)
+        self.queue_handler: Optional[DroppingQueueHandler] = None
+        self.listener: Optional[LogListener] = None
         self.logger = self._setup_logger()
     
     def _setup_logger(self) -> logging.Logger:
@@ -142,13 +231,54 @@ class AppLogger:
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
 
+        if self.use_queue:
+            # The handlers move to the listener thread; the logger only enqueues
+            handlers = list(logger.handlers)
+            logger.handlers.clear()
+            log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            self.queue_handler = DroppingQueueHandler(log_queue)
+            logger.addHandler(self.queue_handler)
+            self.listener = LogListener(log_queue, *handlers, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.flush, restart=False)
+
         # Prevent propagation to avoid duplicate logs
         logger.propagate = False
 
         return logger
     
+    def flush(self, restart: bool = True):
+        """Write every queued record (process exit, tests, benchmarks)"""
+        if self.listener is None or not self.listener.started:
+            return
+        self.listener.stop()
+        if restart:
+            self.listener.start()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue_handler.queue.qsize() if self.queue_handler else 0,
+            "queue_size": LOG_QUEUE_SIZE if self.queue_handler else 0,
+            "dropped": self.queue_handler.dropped if self.queue_handler else 0,
+            "sampling": dict(self.sampling, **{"*": self.default_sample_rate})
+        }
+
+    def _sampled_out(self, levelno: int, module_name: Optional[str]) -> bool:
+        """Per-module sampling of DEBUG/INFO (warnings and errors are always kept)"""
+        if levelno > logging.INFO:
+            return False
+        rate = self.sampling.get(module_name, self.default_sample_rate) if module_name else self.default_sample_rate
+        if rate >= 1.0 or random.random() < rate:
+            return False
+        log_records_sampled_out.inc(module=module_name or "unknown")
+        return True
+
     def _create_log_record(self, level: str, message: str, **kwargs) -> None:
         """Create a log record with custom fields"""
+        levelno = getattr(logging, level)
+        # Cheap exits before any record is built (DEBUG in prod, sampled modules)
+        if not self.logger.isEnabledFor(levelno) or self._sampled_out(levelno, kwargs.get('module_name')):
+            return
         extra = {}
         
         # Handle exc_info separately (it's a special logging parameter)
@@ -161,6 +291,8 @@ class AppLogger:
                 extra[key] = value
             else:
                 extra[f'log_{key}'] = value
+        # Ids of the current request / span (captured here, on the calling thread)
+        extra.update(current_ids())
         
         # Log the message with exc_info as a parameter, not in extra
         getattr(self.logger, level.lower())(message, extra=extra, exc_info=exc_info)
@@ -213,6 +345,7 @@ def log_execution_time(func_name: str = None):
                 result = await func(*args, **kwargs)
                 
                 duration_ms = int((time.time() - start_time) * 1000)
+                function_duration.observe(time.time() - start_time, function=func_name_final, module=module_name, status="success")
                 logger.info(
                     f"Completed {func_name_final} successfully",
                     module_name=module_name,
@@ -225,6 +358,7 @@ def log_execution_time(func_name: str = None):
                 
             except Exception as e:
                 duration_ms = int((time.time() - start_time) * 1000)
+                function_duration.observe(time.time() - start_time, function=func_name_final, module=module_name, status="error")
                 logger.error(
                     f"Failed {func_name_final}: {str(e)}",
                     module_name=module_name,
@@ -253,6 +387,7 @@ def log_execution_time(func_name: str = None):
                 result = func(*args, **kwargs)
                 
                 duration_ms = int((time.time() - start_time) * 1000)
+                function_duration.observe(time.time() - start_time, function=func_name_final, module=module_name, status="success")
                 logger.info(
                     f"Completed {func_name_final} successfully",
                     module_name=module_name,
@@ -265,6 +400,7 @@ def log_execution_time(func_name: str = None):
                 
             except Exception as e:
                 duration_ms = int((time.time() - start_time) * 1000)
+                function_duration.observe(time.time() - start_time, function=func_name_final, module=module_name, status="error")
                 logger.error(
                     f"Failed {func_name_final}: {str(e)}",
                     module_name=module_name,
@@ -299,6 +435,7 @@ def log_quota_check(user_type: str, current_count: int, limit: int, **kwargs):
     """Log quota checking"""
     logger = get_logger()
     status = "within_limit" if current_count < limit else "exceeded"
+    quota_checks_total.inc(user_type=user_type, status=status)
     logger.info(
         f"Quota check: {current_count}/{limit}",
         module_name="quota",
@@ -314,6 +451,7 @@ def log_schema_processing(schema_type: str, success: bool, doc_id: str = None, e
     """Log schema processing results"""
     logger = get_logger()
     status = "success" if success else "failed"
+    schema_processing_total.inc(schema_type=schema_type, status=status)
     logger.info(
         f"Schema processing {status}: {schema_type}",
         module_name="schema",
@@ -329,6 +467,9 @@ def log_ai_generation(stage: str, success: bool, doc_id: str = None, **kwargs):
     """Log AI generation stages"""
     logger = get_logger()
     status = "success" if success else "failed"
+    ai_generation_stages.inc(stage=stage, status=status)
+    if kwargs.get('duration_ms') is not None:
+        ai_generation_duration.observe(kwargs['duration_ms'] / 1000, stage=stage)
     logger.info(
         f"AI generation {stage} {status}",
         module_name="ai_generation",
@@ -0,0 +1,255 @@
+"""
+Map Mirror - Local copies of the geographic map images used by exercises
+Each map referenced by DocumentSearcher (validated cache and fallbacks) is
+downloaded once and stored as a print-resolution and a web-resolution variant.
+WeasyPrint then reads the print variant from disk through url_fetcher instead of
+fetching Wikimedia on every export. The mirror can be seeded from a local
+directory so exports work with no network at all.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import unquote, urlparse
+
+from logger import get_logger
+
+logger = get_logger()
+
+# Longest side of each variant in pixels (print ~300 dpi on a half A4 page)
+VARIANT_SIZES = {
+    "print": 2400,
+    "web": 800
+}
+JPEG_QUALITY = {"print": 90, "web": 80}
+CONTENT_TYPES = {"png": "image/png", "jpg": "image/jpeg"}
+
+DOWNLOAD_TIMEOUT_SECONDS = 30
+DOWNLOAD_CONCURRENCY = 4
+USER_AGENT = "LeMaitreMot/1.0 (map mirror; educational use)"
+
+
+def map_id_for(url: str) -> str:
+    """Stable id of a source URL"""
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:24]
+
+
+def source_filename(url: str) -> str:
+    """Decoded file name of a source URL (1200px-Equirectangular_projection_SW.jpg)"""
+    return unquote(os.path.basename(urlparse(url).path))
+
+
+def build_variants(data: bytes) -> Dict[str, tuple]:
+    """Resize the source image into every variant: {variant: (bytes, ext, width, height)}"""
+    from PIL import Image
+
+    variants = {}
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        # Keep PNG for line art with transparency, JPEG for photos/relief maps
+        keep_png = source.format == "PNG"
+        for variant, max_side in VARIANT_SIZES.items():
+            image = source.copy()
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            buffer = io.BytesIO()
+            if keep_png:
+                image.save(buffer, format="PNG", optimize=True)
+                ext = "png"
+            else:
+                image.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY[variant],
+                                          optimize=True, progressive=True)
+                ext = "jpg"
+            variants[variant] = (buffer.getvalue(), ext, image.width, image.height)
+    return variants
+
+
+def referenced_map_urls() -> List[str]:
+    """Every map URL DocumentSearcher can hand out (geo catalog + fallbacks)"""
+    from document_search import document_searcher
+
+    urls = list(document_searcher.catalog.urls())
+    for doc_type in document_searcher.catalog.by_type:
+        urls.append(document_searcher._get_fallback_document(doc_type, {}).get("url_fichier_direct"))
+    return sorted({url for url in urls if url})
+
+
+class MapMirror:
+    """On-disk mirror: <root>/<map_id>/{print,web}.<ext> + meta.json"""
+
+    def __init__(self, root_dir: str, public_base_url: str = "",
+                 fallback_fetcher: Optional[Callable] = None):
+        self.root_dir = Path(root_dir)
+        self.public_base_url = public_base_url.rstrip('/')
+        self.fallback_fetcher = fallback_fetcher
+        self._meta_cache: Dict[str, Optional[dict]] = {}
+
+    # ------------------------------------------------------------------ storage
+
+    def _meta_path(self, map_id: str) -> Path:
+        return self.root_dir / map_id / "meta.json"
+
+    def metadata(self, url: str) -> Optional[dict]:
+        """Stored metadata of a mirrored URL, None when not mirrored"""
+        map_id = map_id_for(url)
+        if map_id not in self._meta_cache or self._meta_cache[map_id] is None:
+            path = self._meta_path(map_id)
+            self._meta_cache[map_id] = json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+        return self._meta_cache[map_id]
+
+    def is_mirrored(self, url: str) -> bool:
+        return self.metadata(url) is not None
+
+    def store(self, url: str, data: bytes) -> dict:
+        """Build and store every variant of a source image (idempotent)"""
+        map_id = map_id_for(url)
+        target = self.root_dir / map_id
+        target.mkdir(parents=True, exist_ok=True)
+
+        meta = {"url": url, "map_id": map_id, "source_bytes": len(data), "variants": {}}
+        for variant, (payload, ext, width, height) in build_variants(data).items():
+            filename = f"{variant}.{ext}"
+            self._atomic_write(target / filename, payload)
+            meta["variants"][variant] = {"file": filename, "content_type": CONTENT_TYPES[ext],
+                                         "width": width, "height": height, "bytes": len(payload)}
+        # meta.json is written last: its presence means the map is complete
+        self._atomic_write(self._meta_path(map_id), json.dumps(meta, indent=2).encode("utf-8"))
+        self._meta_cache[map_id] = meta
+        return meta
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def variant_path(self, url: str, variant: str = "print") -> Optional[Path]:
+        meta = self.metadata(url)
+        if not meta or variant not in meta["variants"]:
+            return None
+        path = self.root_dir / meta["map_id"] / meta["variants"][variant]["file"]
+        return path if path.exists() else None
+
+    def path_for_id(self, map_id: str, variant: str) -> Optional[tuple]:
+        """(path, content_type) for the /api/maps endpoint"""
+        if not map_id.isalnum() or variant not in VARIANT_SIZES:
+            return None
+        meta_path = self._meta_path(map_id)
+        if not meta_path.exists():
+            return None
+        info = json.loads(meta_path.read_text(encoding="utf-8"))["variants"].get(variant)
+        if not info:
+            return None
+        path = self.root_dir / map_id / info["file"]
+        return (path, info["content_type"]) if path.exists() else None
+
+    def web_url_for(self, url: str) -> Optional[str]:
+        """Local URL of the web variant, None when the map is not mirrored"""
+        if not url or not self.is_mirrored(url):
+            return None
+        return f"{self.public_base_url}/api/maps/{map_id_for(url)}/web"
+
+    # ------------------------------------------------------------------ population
+
+    def seed_from_directory(self, directory: str, urls: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Import maps from a local directory (offline setup). Files are matched to
+        source URLs by their decoded file name, e.g. 1200px-Equirectangular_projection_SW.jpg
+        """
+        directory = Path(directory)
+        seeded = []
+        for url in (urls if urls is not None else referenced_map_urls()):
+            candidate = directory / source_filename(url)
+            if candidate.exists() and not self.is_mirrored(url):
+                self.store(url, candidate.read_bytes())
+                seeded.append(url)
+        logger.info(f"Map mirror seeded from {directory}: {len(seeded)} map(s)")
+        return seeded
+
+    async def sync(self, urls: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Download every referenced map that is not mirrored yet"""
+        import aiohttp
+
+        missing = [url for url in (urls if urls is not None else referenced_map_urls())
+                   if not self.is_mirrored(url)]
+        if not missing:
+            return {}
+
+        semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+        loop = asyncio.get_running_loop()
+        results: Dict[str, str] = {}
+        timeout = aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT_SECONDS)
+
+        async def download(session, url):
+            async with semaphore:
+                try:
+                    async with session.get(url) as response:
+                        response.raise_for_status()
+                        data = await response.read()
+                    # Resizing is CPU bound
+                    await loop.run_in_executor(None, self.store, url, data)
+                    results[url] = "mirrored"
+                except Exception as e:
+                    logger.warning(f"Map mirror download failed for {source_filename(url)}: {e}")
+                    results[url] = f"error: {e}"
+
+        async with aiohttp.ClientSession(timeout=timeout, headers={"User-Agent": USER_AGENT}) as session:
+            await asyncio.gather(*(download(session, url) for url in missing))
+        return results
+
+    # ------------------------------------------------------------------ WeasyPrint
+
+    def url_fetcher(self, url: str, *args, **kwargs) -> dict:
+        """WeasyPrint url_fetcher serving mirrored maps (print variant) from disk"""
+        if url.startswith(("http://", "https://")):
+            meta = self.metadata(url)
+            if meta:
+                path = self.variant_path(url, "print")
+                if path:
+                    return {
+                        'string': path.read_bytes(),
+                        'mime_type': meta["variants"]["print"]["content_type"],
+                        'redirected_url': url
+                    }
+        if self.fallback_fetcher:
+            return self.fallback_fetcher(url, *args, **kwargs)
+        import weasyprint
+        return weasyprint.default_url_fetcher(url, *args, **kwargs)
+
+
+def _create_map_mirror() -> MapMirror:
+    from asset_store import asset_store
+
+    return MapMirror(
+        os.environ.get('MAP_MIRROR_DIR', str(Path(__file__).parent / 'map_mirror')),
+        os.environ.get('PUBLIC_ASSET_BASE_URL', ''),
+        fallback_fetcher=asset_store.url_fetcher
+    )
+
+
+# Global instance for easy use
+map_mirror = _create_map_mirror()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Populate the local map mirror")
+    parser.add_argument("--seed-dir", help="import maps from this directory instead of downloading")
+    args = parser.parse_args()
+
+    if args.seed_dir:
+        map_mirror.seed_from_directory(args.seed_dir)
+    else:
+        for url, status in asyncio.run(map_mirror.sync()).items():
+            print(f"{status:<10} {source_filename(url)}")
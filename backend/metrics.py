@@ -0,0 +1,229 @@
+"""
+Application Metrics - In-process registry of counters, gauges and histograms
+Thread-safe: metrics are updated from the event loop, executor threads and
+pymongo monitoring threads alike.
+With METRICS_MULTIPROC_DIR set, every process (uvicorn workers, render pool
+workers) also writes its snapshot to <dir>/<pid>.json so one scrape can
+aggregate all of them (metrics_export). The directory must be emptied on deploy.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from typing import Dict, Optional, Sequence, Tuple
+
+MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+SYNC_INTERVAL_SECONDS = float(os.environ.get('METRICS_SYNC_INTERVAL_SECONDS', '5'))
+
+# Latency buckets in seconds, from cache hits to full PDF renders
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    if not labels:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, object] = {}
+
+    def snapshot(self) -> Dict[LabelKey, object]:
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(_Metric):
+    """Monotonic counter"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram (Prometheus semantics)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @staticmethod
+    def _copy(value):
+        return {"counts": list(value["counts"]), "sum": value["sum"], "count": value["count"]}
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Approximate quantile (upper bound of the bucket holding it)"""
+        with self._lock:
+            state = self._values.get(_label_key(labels))
+            if not state or not state["count"]:
+                return None
+            target = q * state["count"]
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state["counts"]):
+                running += count
+                if running >= target:
+                    return bound
+        return None
+
+
+class MetricsRegistry:
+    """Holds every metric of the process, get-or-create by name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls, name: str, description: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, description, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def state(self) -> Dict[str, dict]:
+        """{name: {type, description, buckets?, series: {LabelKey: value}}} for every metric"""
+        result = {}
+        for metric in self.metrics():
+            entry = {"type": metric.kind, "description": metric.description, "series": metric.snapshot()}
+            if isinstance(metric, Histogram):
+                entry["buckets"] = list(metric.buckets)
+            result[metric.name] = entry
+        return result
+
+    def as_dict(self) -> Dict[str, dict]:
+        """JSON-friendly view of every metric"""
+        result = self.state()
+        for entry in result.values():
+            entry["series"] = [{"labels": dict(key), "value": value} for key, value in entry["series"].items()]
+        return result
+
+
+def encode_state(state: Dict[str, dict]) -> str:
+    """JSON form of MetricsRegistry.state() (label keys become lists of pairs)"""
+    return json.dumps({
+        name: {**entry, "series": [[list(map(list, key)), value] for key, value in entry["series"].items()]}
+        for name, entry in state.items()
+    })
+
+
+def decode_state(payload: str) -> Dict[str, dict]:
+    result = json.loads(payload)
+    for entry in result.values():
+        entry["series"] = {tuple(tuple(pair) for pair in key): value for key, value in entry["series"]}
+    return result
+
+
+class SnapshotWriter:
+    """Periodically writes the registry of this process to <directory>/<pid>.json"""
+
+    def __init__(self, registry: MetricsRegistry, directory: str, interval: float = SYNC_INTERVAL_SECONDS):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f"{os.getpid()}.json")
+        self._stop = threading.Event()
+
+    def write(self):
+        # Atomic replace: a scrape never reads a half-written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".metrics-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(encode_state(self.registry.state()))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._run, name="metrics-snapshot", daemon=True).start()
+        # Last values of a worker that exits (counters of dead processes stay in the totals)
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        self.write()
+
+
+# Global registry for easy use
+metrics = MetricsRegistry()
+snapshot_writer: Optional[SnapshotWriter] = None
+if MULTIPROC_DIR:
+    snapshot_writer = SnapshotWriter(metrics, MULTIPROC_DIR)
+    snapshot_writer.start()
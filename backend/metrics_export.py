@@ -0,0 +1,184 @@
+"""
+Metrics Export - Prometheus text exposition of the metrics registry
+Merges the snapshots of every process when METRICS_MULTIPROC_DIR is set
+(counters and histograms are summed, gauges get a pid label and disappear
+with their process), adds cache hit ratios derived from the hit/miss
+counters and measures the event-loop lag of the API process.
+"""
+
+import asyncio
+import glob
+import math
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from metrics import MULTIPROC_DIR, MetricsRegistry, decode_state, metrics
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# How often the event loop is asked to wake up; the lateness is the lag
+LOOP_LAG_INTERVAL_SECONDS = 0.5
+
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+event_loop_lag = metrics.histogram("event_loop_lag_seconds", "Delay of the event loop waking up a sleeping task", buckets=LOOP_LAG_BUCKETS)
+event_loop_lag_last = metrics.gauge("event_loop_lag_last_seconds", "Last measured event-loop lag")
+
+# cache -> (hits counter, hit label filter, misses counter, miss label filter)
+CacheRatio = Tuple[str, Optional[Dict[str, Sequence[str]]], str, Optional[Dict[str, Sequence[str]]]]
+CACHE_RATIOS: Dict[str, CacheRatio] = {
+    "render_stage": ("render_pipeline_cache_hits_total", None, "render_pipeline_cache_misses_total", None),
+    "render_fragment": ("render_pipeline_fragment_hits_total", None, "render_pipeline_fragment_misses_total", None),
+    "pdf_resource": ("pdf_resource_cache_hits_total", None, "pdf_resource_cache_misses_total", None),
+    "pdf_export": ("pdf_cache_lookups_total", {"result": ("hit", "speculative_hit")},
+                   "pdf_cache_lookups_total", {"result": ("miss",)}),
+}
+
+
+def register_cache_ratio(cache: str, hits: str, misses: str,
+                         hits_where: Optional[Dict[str, Sequence[str]]] = None,
+                         misses_where: Optional[Dict[str, Sequence[str]]] = None):
+    """Expose cache_hit_ratio{cache=...} computed from two counters at scrape time"""
+    CACHE_RATIOS[cache] = (hits, hits_where, misses, misses_where)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshots(directory: str, own_pid: int) -> List[Tuple[int, dict, bool]]:
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        name = os.path.basename(path)[:-len(".json")]
+        if not name.isdigit() or int(name) == own_pid:
+            continue
+        try:
+            with open(path) as f:
+                state = decode_state(f.read())
+        except (OSError, ValueError):
+            continue
+        snapshots.append((int(name), state, _pid_alive(int(name))))
+    return snapshots
+
+
+def _add_histogram(total: dict, value: dict) -> dict:
+    if total is None:
+        return {"counts": list(value["counts"]), "sum": value["sum"], "count": value["count"]}
+    total["counts"] = [a + b for a, b in zip(total["counts"], value["counts"])]
+    total["sum"] += value["sum"]
+    total["count"] += value["count"]
+    return total
+
+
+def merge_states(snapshots: Iterable[Tuple[int, dict, bool]], label_gauges: bool = True) -> Dict[str, dict]:
+    """Merge (pid, state, alive) snapshots into a single registry state"""
+    merged: Dict[str, dict] = {}
+    for pid, state, alive in snapshots:
+        for name, entry in state.items():
+            target = merged.setdefault(name, {**entry, "series": {}})
+            if target["type"] != entry["type"] or target.get("buckets") != entry.get("buckets"):
+                continue
+            series = target["series"]
+            for key, value in entry["series"].items():
+                if entry["type"] == "gauge":
+                    # A gauge is a current value: only meaningful while its process lives
+                    if not alive:
+                        continue
+                    if label_gauges:
+                        key = tuple(sorted(key + (("pid", str(pid)),)))
+                    series[key] = value
+                elif entry["type"] == "histogram":
+                    series[key] = _add_histogram(series.get(key), value)
+                else:
+                    series[key] = series.get(key, 0.0) + value
+    return merged
+
+
+def collect(registry: MetricsRegistry = metrics, directory: Optional[str] = MULTIPROC_DIR) -> Dict[str, dict]:
+    """State of this process, merged with the other processes' snapshots when multiprocess"""
+    own = (os.getpid(), registry.state(), True)
+    if not directory:
+        return merge_states([own], label_gauges=False)
+    return merge_states([own] + _read_snapshots(directory, os.getpid()))
+
+
+def _matching_total(state: Dict[str, dict], name: str, where: Optional[Dict[str, Sequence[str]]]) -> float:
+    entry = state.get(name)
+    if not entry:
+        return 0.0
+    total = 0.0
+    for key, value in entry["series"].items():
+        labels = dict(key)
+        if where and any(labels.get(label) not in allowed for label, allowed in where.items()):
+            continue
+        total += value
+    return total
+
+
+def add_cache_ratios(state: Dict[str, dict]) -> Dict[str, dict]:
+    series = {}
+    for cache, (hits_name, hits_where, misses_name, misses_where) in CACHE_RATIOS.items():
+        hits = _matching_total(state, hits_name, hits_where)
+        misses = _matching_total(state, misses_name, misses_where)
+        if hits + misses:
+            series[(("cache", cache),)] = round(hits / (hits + misses), 4)
+    if series:
+        state["cache_hit_ratio"] = {"type": "gauge", "description": "Hits / lookups per cache, all processes", "series": series}
+    return state
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: Iterable[Tuple[str, str]]) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in key)
+    return "{" + pairs + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render_prometheus(state: Dict[str, dict]) -> str:
+    """Prometheus text format 0.0.4"""
+    lines = []
+    for name in sorted(state):
+        entry = state[name]
+        if entry["description"]:
+            lines.append(f"# HELP {name} {_escape(entry['description'])}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        for key in sorted(entry["series"]):
+            value = entry["series"][key]
+            if entry["type"] != "histogram":
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+                continue
+            running = 0
+            for bound, count in zip(entry["buckets"] + [float("inf")], value["counts"]):
+                running += count
+                lines.append(f"{name}_bucket{_labels(key + (('le', _number(bound)),))} {running}")
+            lines.append(f"{name}_sum{_labels(key)} {_number(value['sum'])}")
+            lines.append(f"{name}_count{_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_latest(registry: MetricsRegistry = metrics, directory: Optional[str] = MULTIPROC_DIR) -> str:
+    """Body of GET /api/metrics"""
+    return render_prometheus(add_cache_ratios(collect(registry, directory)))
+
+
+async def monitor_event_loop_lag(interval: float = LOOP_LAG_INTERVAL_SECONDS):
+    """Background task: how late the loop wakes up (blocking calls on the loop show here)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0.0)
+        event_loop_lag.observe(lag)
+        event_loop_lag_last.set(lag)
@@ -0,0 +1,273 @@
+"""
+Mongo Monitoring - pymongo command monitoring for the motor client
+Records per-collection, per-operation latency histograms and returned document
+counts, writes a sampled slow-query log with the command shape, and, when
+enabled, explains a sample of slow reads on a background thread to get
+documents examined and to flag collection scans. Explains are off by default and
+use queryPlanner verbosity unless configured otherwise: executionStats re-runs
+the query against the database.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pymongo import MongoClient, monitoring
+
+from logger import get_logger
+from metrics import metrics
+
+logger = get_logger()
+
+# Commands that target a collection, and the key holding the collection name
+COLLECTION_COMMANDS = {
+    "find": "find", "aggregate": "aggregate", "count": "count", "distinct": "distinct",
+    "insert": "insert", "update": "update", "delete": "delete",
+    "findAndModify": "findAndModify", "getMore": "collection", "createIndexes": "createIndexes"
+}
+# Reads that can be explained without side effects
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct"}
+# Driver bookkeeping that never appears in the shape
+IGNORED_KEYS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "signature", "apiVersion"}
+
+command_duration = metrics.histogram(
+    "mongo_command_duration_seconds", "Mongo command latency by collection and operation")
+documents_returned = metrics.counter(
+    "mongo_documents_returned_total", "Documents returned (or affected) by collection and operation")
+documents_examined = metrics.counter(
+    "mongo_documents_examined_total", "Documents examined by explained slow queries")
+command_errors = metrics.counter(
+    "mongo_command_errors_total", "Failed Mongo commands by collection and operation")
+collection_scans = metrics.counter(
+    "mongo_collection_scans_total", "Explained slow queries that used a COLLSCAN")
+slow_queries = metrics.counter(
+    "mongo_slow_queries_total", "Commands slower than the slow-query threshold")
+
+
+def command_shape(value: Any, depth: int = 0) -> Any:
+    """Replace literal values by their type so queries group by shape, not by data"""
+    if depth > 6:
+        return "..."
+    if isinstance(value, dict):
+        return {k: command_shape(v, depth + 1) for k, v in value.items() if k not in IGNORED_KEYS}
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return []
+        # Pipelines keep every stage, value lists collapse to one element
+        if all(isinstance(v, dict) for v in value):
+            return [command_shape(v, depth + 1) for v in value[:20]]
+        return [command_shape(value[0], depth + 1)]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        # Sort directions, projections and limits are part of the shape
+        return value if depth <= 2 or value in (-1, 0, 1) else "<number>"
+    return f"<{type(value).__name__}>"
+
+
+def _find_stats(explain: Any, stats: Dict[str, Any]):
+    """Walk an explain document for examined counts and COLLSCAN stages"""
+    if isinstance(explain, dict):
+        if explain.get("stage") == "COLLSCAN":
+            stats["collscan"] = True
+        if "totalDocsExamined" in explain:
+            stats["docs_examined"] = max(stats["docs_examined"], int(explain["totalDocsExamined"]))
+        if "nReturned" in explain and "executionStages" not in explain:
+            stats["n_returned"] = max(stats["n_returned"], int(explain["nReturned"]))
+        for value in explain.values():
+            _find_stats(value, stats)
+    elif isinstance(explain, list):
+        for value in explain:
+            _find_stats(value, stats)
+
+
+ROOT_DIR = Path(__file__).parent
+
+SLOW_LOG_DIR = os.environ.get('MONGO_SLOW_LOG_DIR', str(ROOT_DIR / 'logs'))
+EXPLAIN_VERBOSITIES = ("queryPlanner", "executionStats", "allPlansExecution")
+
+
+class MongoCommandInstrumentation(monitoring.CommandListener):
+    """CommandListener passed to AsyncIOMotorClient(event_listeners=[...])"""
+
+    def __init__(self, slow_ms: float = 100.0, slow_sample_rate: float = 1.0,
+                 explain_sample_rate: float = 0.0, explain_verbosity: str = "queryPlanner",
+                 log_dir: str = SLOW_LOG_DIR, keep_recent: int = 200):
+        if explain_verbosity not in EXPLAIN_VERBOSITIES:
+            raise ValueError(f"Invalid explain verbosity: {explain_verbosity!r}")
+        self.slow_seconds = slow_ms / 1000.0
+        self.slow_sample_rate = slow_sample_rate
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_verbosity = explain_verbosity
+        self.recent_slow_queries = deque(maxlen=keep_recent)
+
+        self._inflight: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+        self._explain_queue: "queue.Queue" = queue.Queue(maxsize=100)
+        self._explain_client: Optional[MongoClient] = None
+        self._explain_thread: Optional[threading.Thread] = None
+        self._slow_log = self._setup_slow_log(log_dir)
+
+    @staticmethod
+    def _setup_slow_log(log_dir: str) -> logging.Logger:
+        slow_log = logging.getLogger('lemaitremot.mongo_slow')
+        slow_log.setLevel(logging.INFO)
+        slow_log.propagate = False
+        if not slow_log.handlers:
+            os.makedirs(log_dir, exist_ok=True)
+            handler = RotatingFileHandler(os.path.join(log_dir, "mongo_slow_queries.log"),
+                                          maxBytes=10_000_000, backupCount=3, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            slow_log.addHandler(handler)
+        return slow_log
+
+    def start_explainer(self, mongo_url: str, db_name: str):
+        """Explain sampled slow reads with a separate, unmonitored client"""
+        if self.explain_sample_rate <= 0 or self._explain_thread:
+            return
+        self._explain_client = MongoClient(mongo_url, maxPoolSize=1, serverSelectionTimeoutMS=2000)
+        self._explain_db = db_name
+        self._explain_thread = threading.Thread(target=self._explain_loop, name="mongo-explain", daemon=True)
+        self._explain_thread.start()
+
+    # ------------------------------------------------------------------ listener
+
+    def started(self, event):
+        key_name = COLLECTION_COMMANDS.get(event.command_name)
+        if not key_name:
+            return
+        collection = str(event.command.get(key_name))
+        # The command is only kept while in flight, for the slow-query log
+        command = event.command if self.slow_sample_rate > 0 else None
+        with self._lock:
+            self._inflight[(event.connection_id, event.request_id)] = (
+                collection, event.database_name, command
+            )
+
+    def succeeded(self, event):
+        with self._lock:
+            inflight = self._inflight.pop((event.connection_id, event.request_id), None)
+        if inflight is None:
+            return
+        collection, database, command = inflight
+        operation = event.command_name
+        duration = event.duration_micros / 1_000_000
+
+        command_duration.observe(duration, collection=collection, operation=operation)
+        returned = self._returned_count(event.reply)
+        if returned:
+            documents_returned.inc(returned, collection=collection, operation=operation)
+
+        if duration >= self.slow_seconds:
+            slow_queries.inc(collection=collection, operation=operation)
+            if command is not None and random.random() < self.slow_sample_rate:
+                self._record_slow_query(collection, database, operation, command, duration, returned)
+
+    def failed(self, event):
+        with self._lock:
+            inflight = self._inflight.pop((event.connection_id, event.request_id), None)
+        if inflight is None:
+            return
+        command_errors.inc(collection=inflight[0], operation=event.command_name)
+
+    @staticmethod
+    def _returned_count(reply: Dict[str, Any]) -> int:
+        cursor = reply.get("cursor")
+        if isinstance(cursor, dict):
+            return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+        if "n" in reply:
+            return int(reply.get("n") or 0)
+        if "values" in reply:
+            return len(reply["values"])
+        return 0
+
+    # ------------------------------------------------------------------ slow queries
+
+    def _record_slow_query(self, collection: str, database: str, operation: str,
+                           command: Dict[str, Any], duration: float, returned: int):
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "collection": collection,
+            "operation": operation,
+            "duration_ms": round(duration * 1000, 2),
+            "returned": returned,
+            "shape": command_shape(command)
+        }
+        self.recent_slow_queries.append(entry)
+        self._slow_log.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+        if (operation in EXPLAINABLE_COMMANDS and self._explain_thread
+                and random.random() < self.explain_sample_rate):
+            try:
+                self._explain_queue.put_nowait((entry, database, command))
+            except queue.Full:
+                pass
+
+    def _explain_loop(self):
+        while True:
+            entry, database, command = self._explain_queue.get()
+            try:
+                explain_command = {k: v for k, v in command.items() if k not in IGNORED_KEYS}
+                explain = self._explain_client[database or self._explain_db].command(
+                    {"explain": explain_command, "verbosity": self.explain_verbosity})
+                stats = {"collscan": False, "docs_examined": 0, "n_returned": 0}
+                _find_stats(explain, stats)
+
+                entry["collscan"] = stats["collscan"]
+                # queryPlanner only plans the query: there are no execution counts
+                if self.explain_verbosity != "queryPlanner":
+                    entry["docs_examined"] = stats["docs_examined"]
+                    documents_examined.inc(stats["docs_examined"], collection=entry["collection"],
+                                           operation=entry["operation"])
+                if stats["collscan"]:
+                    collection_scans.inc(collection=entry["collection"], operation=entry["operation"])
+                    logger.warning(
+                        "Collection scan detected",
+                        module_name="mongo",
+                        func_name="explain",
+                        collection=entry["collection"],
+                        operation=entry["operation"],
+                        docs_examined=entry.get("docs_examined"),
+                        returned=entry["returned"],
+                        duration_ms=entry["duration_ms"]
+                    )
+                self._slow_log.info(json.dumps({**entry, "explained": True}, ensure_ascii=False, default=str))
+            except Exception as e:
+                logger.debug(f"Explain of slow query failed: {e}")
+
+    def summary(self) -> Dict[str, Any]:
+        """Recent slow queries, most recent first"""
+        return {
+            "slow_threshold_ms": self.slow_seconds * 1000,
+            "recent_slow_queries": list(reversed(self.recent_slow_queries))
+        }
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def create_instrumentation() -> Optional[MongoCommandInstrumentation]:
+    """Instrumentation configured from the environment (None when disabled)"""
+    if os.environ.get("MONGO_INSTRUMENTATION", "true").lower() != "true":
+        return None
+    explain_verbosity = os.environ.get("MONGO_EXPLAIN_VERBOSITY", "queryPlanner")
+    if explain_verbosity not in EXPLAIN_VERBOSITIES:
+        explain_verbosity = "queryPlanner"
+    return MongoCommandInstrumentation(
+        slow_ms=_env_float("MONGO_SLOW_QUERY_MS", 100.0),
+        slow_sample_rate=_env_float("MONGO_SLOW_QUERY_SAMPLE_RATE", 1.0),
+        explain_sample_rate=_env_float("MONGO_EXPLAIN_SAMPLE_RATE", 0.0),
+        explain_verbosity=explain_verbosity
+    )
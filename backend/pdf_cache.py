@@ -0,0 +1,191 @@
+"""
+PDF Cache - Rendered export PDFs keyed by the hash of their HTML, and the
+opt-in speculative renderer that fills it right after a document is generated
+The key is the final HTML (document content, style, Pro personalization, date),
+so a varied exercise or another template can never be served a stale PDF.
+Speculative renders run one at a time, back off while the render pool is busy
+and are cancelled when their document changes.
+"""
+
+import asyncio
+import copy
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from logger import get_logger
+from metrics import metrics
+
+logger = get_logger()
+
+PDF_CACHE_BYTES = int(os.environ.get('PDF_CACHE_MB', '128')) * 1024 * 1024
+SPECULATIVE_ENABLED = os.environ.get('PDF_SPECULATIVE_RENDER', 'false').lower() == 'true'
+SPECULATIVE_CONCURRENCY = int(os.environ.get('PDF_SPECULATIVE_CONCURRENCY', '1'))
+# Documents waiting for a speculative render; beyond this, new documents are not speculated
+SPECULATIVE_MAX_PENDING = int(os.environ.get('PDF_SPECULATIVE_MAX_PENDING', '16'))
+# Let the /generate response go out before starting
+SPECULATIVE_DELAY_SECONDS = 0.5
+# How long a speculative render waits for the render pool to free up before giving up
+SPECULATIVE_MAX_WAIT_SECONDS = 30
+
+ORIGIN_EXPORT = "export"
+ORIGIN_SPECULATIVE = "speculative"
+
+cache_lookups = metrics.counter("pdf_cache_lookups_total", "Export PDF cache lookups by result (hit, speculative_hit, miss)")
+speculative_renders = metrics.counter("pdf_speculative_renders_total", "Speculative renders by outcome")
+speculative_hit_ratio = metrics.gauge("pdf_speculative_hit_ratio", "Share of export lookups served by a speculative render")
+
+
+def html_cache_key(html_content: str, **write_options) -> str:
+    payload = html_content + repr(sorted(write_options.items()))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PDFCache:
+    """LRU of rendered PDFs bounded by total bytes; remembers who rendered each entry"""
+
+    def __init__(self, max_bytes: int = PDF_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.speculative_hits = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            self.lookups += 1
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry[1] == ORIGIN_SPECULATIVE:
+                    self.speculative_hits += 1
+                    # Served once: from now on it is an ordinary cache entry
+                    self._entries[key] = (entry[0], ORIGIN_EXPORT)
+            ratio = self.speculative_hits / self.lookups
+
+        result = "miss" if entry is None else ("speculative_hit" if entry[1] == ORIGIN_SPECULATIVE else "hit")
+        cache_lookups.inc(result=result)
+        speculative_hit_ratio.set(round(ratio, 4))
+        return entry[0] if entry is not None else None
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key: str, pdf_bytes: bytes, origin: str = ORIGIN_EXPORT):
+        if len(pdf_bytes) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous[0])
+            self._entries[key] = (pdf_bytes, origin)
+            self.current_bytes += len(pdf_bytes)
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "lookups": self.lookups,
+                "speculative_hits": self.speculative_hits,
+                "speculative_hit_ratio": round(self.speculative_hits / self.lookups, 4) if self.lookups else 0.0
+            }
+
+
+# build(doc) -> [(html, log_context), ...] for the exports worth pre-rendering
+HtmlBuilder = Callable[[dict], Awaitable[List[Tuple[str, Dict[str, Any]]]]]
+
+
+class SpeculativeRenderer:
+    """Pre-render the likely first exports of a freshly generated document"""
+
+    def __init__(self, cache: PDFCache, renderer, build_html: HtmlBuilder,
+                 enabled: bool = SPECULATIVE_ENABLED, concurrency: int = SPECULATIVE_CONCURRENCY,
+                 max_pending: int = SPECULATIVE_MAX_PENDING, delay: float = SPECULATIVE_DELAY_SECONDS):
+        # renderer: pdf_renderer.RenderPool (render coroutine, busy())
+        self.cache = cache
+        self.renderer = renderer
+        self.build_html = build_html
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.delay = delay
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._concurrency = max(1, concurrency)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def schedule(self, document_id: str, doc: dict) -> bool:
+        """Start pre-rendering a document (replaces a pending render of the same document)"""
+        if not self.enabled:
+            return False
+        self.cancel(document_id)
+        if len(self._tasks) >= self.max_pending:
+            speculative_renders.inc(outcome="skipped_pending")
+            return False
+
+        task = asyncio.create_task(self._run(document_id, copy.deepcopy(doc)))
+        self._tasks[document_id] = task
+        task.add_done_callback(lambda finished: self._forget(document_id, finished))
+        return True
+
+    def cancel(self, document_id: str) -> bool:
+        """Drop the pending render of a document (it was varied or deleted)"""
+        task = self._tasks.pop(document_id, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        speculative_renders.inc(outcome="cancelled")
+        return True
+
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def _forget(self, document_id: str, finished: asyncio.Task):
+        if self._tasks.get(document_id) is finished:
+            del self._tasks[document_id]
+
+    async def _wait_for_idle_pool(self) -> bool:
+        waited = 0.0
+        while self.renderer.busy():
+            if waited >= SPECULATIVE_MAX_WAIT_SECONDS:
+                return False
+            await asyncio.sleep(0.25)
+            waited += 0.25
+        return True
+
+    async def _run(self, document_id: str, doc: dict):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        await asyncio.sleep(self.delay)
+        async with self._semaphore:
+            try:
+                exports = await self.build_html(doc)
+                for html_content, log_context in exports:
+                    key = html_cache_key(html_content)
+                    if self.cache.contains(key):
+                        continue
+                    # Exports asked for by users always go first
+                    if not await self._wait_for_idle_pool():
+                        speculative_renders.inc(outcome="skipped_busy")
+                        return
+                    pdf_bytes = await self.renderer.render(
+                        html_content, log_context={**log_context, "speculative": True}
+                    )
+                    self.cache.put(key, pdf_bytes, origin=ORIGIN_SPECULATIVE)
+                    speculative_renders.inc(outcome="rendered")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                speculative_renders.inc(outcome="failed")
+                logger.warning(f"Speculative render failed for {document_id[:8]}: {e}")
+
+
+# Global instance for easy use
+pdf_cache = PDFCache()
@@ -0,0 +1,115 @@
+"""
+PDF Optimizer - Size reductions applied to export HTML before WeasyPrint lays it out
+Inline SVG from matplotlib (formulas, schemas) is minified: metadata, comments,
+invisible background patches and unreferenced ids are dropped and path data is
+compacted. A formula repeated on a page becomes one shared image that WeasyPrint
+parses and embeds once. Raster images (logos, maps) are downsampled by WeasyPrint
+to the target DPI and recompressed, and fonts are subset (render_options).
+"""
+
+import base64
+import os
+import re
+from typing import Any, Dict, Tuple
+
+OPTIMIZE_ENABLED = os.environ.get('PDF_OPTIMIZE', 'true').lower() == 'true'
+IMAGE_DPI = int(os.environ.get('PDF_IMAGE_DPI', '200'))
+JPEG_QUALITY = int(os.environ.get('PDF_JPEG_QUALITY', '85'))
+# Decimals kept in path coordinates (matplotlib writes up to 6; 1/100 pt is invisible)
+PATH_PRECISION = 2
+# Same formula at least this many times on a page: render it as a shared image
+SHARE_MIN_OCCURRENCES = 2
+
+INLINE_SVG_RE = re.compile(r'<svg\b.*?</svg>', re.DOTALL)
+XML_PROLOG_RE = re.compile(r'<\?xml[^>]*\?>|<!DOCTYPE[^>]*>')
+METADATA_RE = re.compile(r'<metadata>.*?</metadata>', re.DOTALL)
+COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+# Transparent figure background written by matplotlib (patch_1)
+INVISIBLE_PATCH_RE = re.compile(r'<path d="[^"]*"\s+style="fill:\s*none;\s*opacity:\s*0"\s*/>')
+PATH_DATA_RE = re.compile(r'(\sd=")([^"]*)(")')
+DECIMAL_RE = re.compile(r'-?\d+\.\d+')
+ID_ATTR_RE = re.compile(r'\sid="([^"]+)"')
+REFERENCE_RE = re.compile(r'href="#([^"]+)"|url\(#([^)]+)\)')
+EMPTY_GROUP_RE = re.compile(r'<g>\s*</g>')
+BETWEEN_TAGS_RE = re.compile(r'>\s+<')
+# matplotlib keeps the LaTeX source as a comment: it identifies formulas (not schemas)
+MATH_MARKER = '<!-- $'
+
+
+def _round_decimal(match: re.Match) -> str:
+    value = f"{float(match.group(0)):.{PATH_PRECISION}f}".rstrip('0').rstrip('.')
+    return "0" if value in ("-0", "") else value
+
+
+def _compact_path_data(match: re.Match) -> str:
+    data = " ".join(match.group(2).split())
+    return match.group(1) + DECIMAL_RE.sub(_round_decimal, data) + match.group(3)
+
+
+def minify_svg(svg: str) -> str:
+    """Drop what does not change the drawing and compact the path data of one SVG fragment"""
+    svg = XML_PROLOG_RE.sub('', svg)
+    svg = METADATA_RE.sub('', svg)
+    svg = COMMENT_RE.sub('', svg)
+    svg = INVISIBLE_PATCH_RE.sub('', svg)
+    svg = PATH_DATA_RE.sub(_compact_path_data, svg)
+
+    # Glyphs (<use href="#DejaVuSans-31">) and clip paths keep their ids, group names go
+    referenced = {a or b for a, b in REFERENCE_RE.findall(svg)}
+    svg = ID_ATTR_RE.sub(lambda m: m.group(0) if m.group(1) in referenced else '', svg)
+
+    previous = None
+    while previous != svg:
+        previous = svg
+        svg = EMPTY_GROUP_RE.sub('', svg)
+    return BETWEEN_TAGS_RE.sub('><', svg).strip()
+
+
+def _as_shared_image(svg: str) -> str:
+    # Same markup as the asset store references, styled by img.math-asset in pdf_shared.css
+    data = base64.b64encode(svg.encode('utf-8')).decode('ascii')
+    return f'<img class="math-asset" src="data:image/svg+xml;base64,{data}" alt="" style="vertical-align: middle;"/>'
+
+
+def optimize_html(html_content: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Minify every inline SVG and share repeated formulas.
+    Returns the new HTML and a report (bytes before / after, fragment counts).
+    """
+    fragments = INLINE_SVG_RE.findall(html_content)
+    counts: Dict[str, int] = {}
+    for fragment in fragments:
+        counts[fragment] = counts.get(fragment, 0) + 1
+
+    replacements: Dict[str, str] = {}
+    shared = 0
+    for fragment, count in counts.items():
+        minified = minify_svg(fragment)
+        # WeasyPrint draws each inline <svg> as its own tree (no cross-SVG <use>):
+        # an identical data URI is parsed once per document instead
+        if count >= SHARE_MIN_OCCURRENCES and MATH_MARKER in fragment:
+            replacements[fragment] = _as_shared_image(minified)
+            shared += 1
+        else:
+            replacements[fragment] = minified
+
+    optimized = INLINE_SVG_RE.sub(lambda m: replacements[m.group(0)], html_content) if fragments else html_content
+    report = {
+        "html_bytes_before": len(html_content.encode('utf-8')),
+        "html_bytes_after": len(optimized.encode('utf-8')),
+        "svg_fragments": len(fragments),
+        "svg_shared": shared
+    }
+    return optimized, report
+
+
+def render_options() -> Dict[str, Any]:
+    """WeasyPrint render options: raster downsampling / recompression (fonts are subset by default)"""
+    if not OPTIMIZE_ENABLED:
+        return {}
+    return {
+        "optimize_images": True,
+        "jpeg_quality": JPEG_QUALITY,
+        "dpi": IMAGE_DPI,
+        "full_fonts": False
+    }
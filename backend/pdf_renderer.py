@@ -0,0 +1,365 @@
+"""
+PDF Renderer - Shared WeasyPrint rendering for every export
+Resources (logos, mirrored maps, assets, fonts) go through one caching
+url_fetcher (in-memory LRU bounded by bytes, keyed by URL and mtime, or by
+content hash for asset store blobs), the
+FontConfiguration and the shared stylesheet are built once per process, the
+HTML goes through pdf_optimizer first, and each export logs its fetch / layout /
+write breakdown with the bytes saved.
+"""
+
+import asyncio
+import html
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from asset_store import ASSET_URL_PATTERN
+from logger import get_logger
+from metrics import metrics
+from pdf_optimizer import OPTIMIZE_ENABLED, optimize_html, render_options
+
+logger = get_logger()
+
+ROOT_DIR = Path(__file__).parent
+SHARED_CSS_PATH = ROOT_DIR / 'templates' / 'pdf_shared.css'
+
+DEFAULT_CACHE_BYTES = int(os.environ.get('PDF_RESOURCE_CACHE_MB', '64')) * 1024 * 1024
+# Resources larger than this are never cached (a single map must not evict everything)
+MAX_ENTRY_FRACTION = 0.25
+# Remote resources have no mtime: cache them for a limited time
+REMOTE_TTL_SECONDS = 3600
+
+fetch_cache_hits = metrics.counter("pdf_resource_cache_hits_total", "PDF resources served from the fetch cache")
+fetch_cache_misses = metrics.counter("pdf_resource_cache_misses_total", "PDF resources fetched from source")
+render_stage_duration = metrics.histogram("pdf_render_stage_seconds", "PDF render time by stage (fetch, layout, write)")
+html_bytes_saved = metrics.counter("pdf_optimizer_html_bytes_saved_total", "HTML/SVG bytes removed before layout")
+
+# Merged exports with bookmarks: one top-level entry per part, template headings below it
+PART_HEADINGS_CSS = " ".join(f"h{level} {{ bookmark-level: {level + 1} }}" for level in range(1, 6))
+BODY_TAG_RE = re.compile(r"<body[^>]*>", re.IGNORECASE)
+
+
+def with_part_bookmark(html_content: str, label: str) -> str:
+    """Insert an invisible level-1 bookmark named `label` at the start of the body"""
+    css_label = label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+    marker = (f'<div style="bookmark-level: 1; bookmark-label: &quot;{html.escape(css_label)}&quot;;'
+              f' height: 0; margin: 0; overflow: hidden"></div>')
+    match = BODY_TAG_RE.search(html_content)
+    if not match:
+        return marker + html_content
+    return html_content[:match.end()] + marker + html_content[match.end():]
+
+
+class CachingURLFetcher:
+    """LRU (bounded by total bytes) around a WeasyPrint url_fetcher"""
+
+    def __init__(self, inner_fetcher: Callable, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.inner_fetcher = inner_fetcher
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[Tuple[str, Any], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(url: str) -> Optional[Tuple[str, Any]]:
+        """(url, version) - version is the mtime for files, a time bucket for remote URLs"""
+        if url.startswith('data:'):
+            return None  # Already in memory, nothing to save
+        # Asset store blobs are immutable and named by their content hash. Their relative
+        # /api/assets/ references resolve against base_url to file:///api/assets/...,
+        # which cannot be stat-ed: the asset id is the key, whatever the URL form.
+        asset = ASSET_URL_PATTERN.search(url)
+        if asset:
+            return f"asset:{asset.group(1)}", 0
+        if url.startswith('file://'):
+            try:
+                return url, os.stat(unquote(urlparse(url).path)).st_mtime_ns
+            except OSError:
+                return None
+        return url, int(time.time() // REMOTE_TTL_SECONDS)
+
+    def __call__(self, url: str, *args, **kwargs) -> Dict[str, Any]:
+        key = self._cache_key(url)
+        if key is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+            if entry is not None:
+                fetch_cache_hits.inc()
+                return dict(entry)
+
+        fetch_cache_misses.inc()
+        result = self.inner_fetcher(url, *args, **kwargs)
+        if key is None:
+            return result
+
+        # Normalize file objects to bytes so the entry can be replayed
+        if result.get('string') is None and result.get('file_obj') is not None:
+            file_obj = result.pop('file_obj')
+            try:
+                result['string'] = file_obj.read()
+            finally:
+                file_obj.close()
+        self._store(key, result)
+        return dict(result)
+
+    def _store(self, key: Tuple[str, Any], result: Dict[str, Any]):
+        payload = result.get('string')
+        if payload is None:
+            return
+        size = len(payload)
+        if size > self.max_bytes * MAX_ENTRY_FRACTION:
+            return
+        with self._lock:
+            # Drop stale versions of the same URL (file modified since)
+            for stale in [k for k in self._entries if k[0] == key[0] and k != key]:
+                self.current_bytes -= len(self._entries.pop(stale)['string'])
+            if key not in self._entries:
+                self._entries[key] = result
+                self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted['string'])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.current_bytes, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+class _TimedFetcher:
+    """Per-render wrapper accumulating the time spent fetching resources"""
+
+    def __init__(self, fetcher: Callable):
+        self.fetcher = fetcher
+        self.seconds = 0.0
+        self.count = 0
+
+    def __call__(self, url: str, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.fetcher(url, *args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class PDFRenderer:
+    """Process-wide WeasyPrint state: fetch cache, font configuration, shared CSS"""
+
+    def __init__(self, url_fetcher: Callable, shared_css_path: Path = SHARED_CSS_PATH,
+                 base_url: str = str(ROOT_DIR), optimize: bool = OPTIMIZE_ENABLED):
+        self.url_fetcher = CachingURLFetcher(url_fetcher)
+        self.shared_css_path = shared_css_path
+        self.base_url = base_url
+        self.optimize = optimize
+        self._font_config = None
+        self._shared_stylesheets: Optional[List[Any]] = None
+        self._init_lock = threading.Lock()
+
+    def _ensure_initialized(self):
+        if self._shared_stylesheets is not None:
+            return
+        with self._init_lock:
+            if self._shared_stylesheets is not None:
+                return
+            from weasyprint import CSS
+            from weasyprint.text.fonts import FontConfiguration
+
+            self._font_config = FontConfiguration()
+            stylesheets = []
+            if self.shared_css_path.exists():
+                stylesheets.append(CSS(
+                    string=self.shared_css_path.read_text(encoding='utf-8'),
+                    base_url=self.base_url,
+                    url_fetcher=self.url_fetcher,
+                    font_config=self._font_config
+                ))
+            self._shared_stylesheets = stylesheets
+
+    def _optimize(self, html_content: str) -> Tuple[str, Dict[str, Any]]:
+        if not self.optimize:
+            return html_content, {}
+        html_content, report = optimize_html(html_content)
+        html_bytes_saved.inc(report["html_bytes_before"] - report["html_bytes_after"])
+        return html_content, report
+
+    def render_pdf(self, html_content: str, stylesheets: Optional[List[Any]] = None,
+                   log_context: Optional[Dict[str, Any]] = None, **write_options) -> bytes:
+        """Render HTML to PDF bytes and log the fetch / layout / write breakdown"""
+        from weasyprint import HTML
+
+        self._ensure_initialized()
+        fetcher = _TimedFetcher(self.url_fetcher)
+
+        optimize_start = time.perf_counter()
+        html_content, optimization = self._optimize(html_content)
+        if self.optimize:
+            render_stage_duration.observe(time.perf_counter() - optimize_start, stage="optimize")
+
+        start = time.perf_counter()
+        document = HTML(string=html_content, base_url=self.base_url, url_fetcher=fetcher).render(
+            stylesheets=self._shared_stylesheets + list(stylesheets or []),
+            font_config=self._font_config,
+            **(render_options() if self.optimize else {})
+        )
+        layout_done = time.perf_counter()
+        pdf_bytes = document.write_pdf(**write_options)
+        write_done = time.perf_counter()
+
+        # Resources are fetched during layout: report them separately
+        fetch_seconds = fetcher.seconds
+        layout_seconds = max(layout_done - start - fetch_seconds, 0.0)
+        write_seconds = write_done - layout_done
+        render_stage_duration.observe(fetch_seconds, stage="fetch")
+        render_stage_duration.observe(layout_seconds, stage="layout")
+        render_stage_duration.observe(write_seconds, stage="write")
+
+        logger.info(
+            "PDF rendered",
+            module_name="pdf",
+            func_name="render_pdf",
+            duration_ms=round((write_done - start) * 1000, 2),
+            fetch_ms=round(fetch_seconds * 1000, 2),
+            layout_ms=round(layout_seconds * 1000, 2),
+            write_ms=round(write_seconds * 1000, 2),
+            resources=fetcher.count,
+            pages=len(document.pages),
+            pdf_bytes=len(pdf_bytes),
+            **optimization,
+            **(log_context or {})
+        )
+        return pdf_bytes
+
+    def render_merged_pdf(self, html_parts: List[str], log_context: Optional[Dict[str, Any]] = None,
+                          bookmarks: Optional[List[str]] = None, **write_options) -> bytes:
+        """
+        Lay out several HTML documents and write their pages as a single PDF.
+        With `bookmarks` (one label per part), the PDF outline gets one entry per part.
+        """
+        from weasyprint import CSS, HTML
+
+        self._ensure_initialized()
+        fetcher = _TimedFetcher(self.url_fetcher)
+        stylesheets = self._shared_stylesheets
+        if bookmarks:
+            html_parts = [with_part_bookmark(part, label) for part, label in zip(html_parts, bookmarks)]
+            stylesheets = stylesheets + [CSS(string=PART_HEADINGS_CSS, font_config=self._font_config)]
+
+        start = time.perf_counter()
+        optimization = {"html_bytes_before": 0, "html_bytes_after": 0}
+        documents = []
+        for part in html_parts:
+            part, report = self._optimize(part)
+            for key in optimization:
+                optimization[key] += report.get(key, 0)
+            documents.append(HTML(string=part, base_url=self.base_url, url_fetcher=fetcher).render(
+                stylesheets=stylesheets, font_config=self._font_config,
+                **(render_options() if self.optimize else {})
+            ))
+        layout_done = time.perf_counter()
+        pages = [page for document in documents for page in document.pages]
+        pdf_bytes = documents[0].copy(pages).write_pdf(**write_options)
+        write_done = time.perf_counter()
+
+        logger.info(
+            "Merged PDF rendered",
+            module_name="pdf",
+            func_name="render_merged_pdf",
+            duration_ms=round((write_done - start) * 1000, 2),
+            fetch_ms=round(fetcher.seconds * 1000, 2),
+            layout_ms=round(max(layout_done - start - fetcher.seconds, 0.0) * 1000, 2),
+            write_ms=round((write_done - layout_done) * 1000, 2),
+            parts=len(html_parts),
+            pages=len(pages),
+            pdf_bytes=len(pdf_bytes),
+            **(optimization if self.optimize else {}),
+            **(log_context or {})
+        )
+        return pdf_bytes
+
+
+def _render_job(html_content: str, log_context: Optional[Dict[str, Any]], write_options: Dict[str, Any]) -> bytes:
+    """Render pool entry point (runs in a worker process)"""
+    return pdf_renderer.render_pdf(html_content, log_context=log_context, **write_options)
+
+
+def _render_merged_job(html_parts: List[str], log_context: Optional[Dict[str, Any]],
+                       bookmarks: Optional[List[str]], write_options: Dict[str, Any]) -> bytes:
+    return pdf_renderer.render_merged_pdf(html_parts, log_context=log_context, bookmarks=bookmarks, **write_options)
+
+
+class RenderPool:
+    """
+    Process pool for WeasyPrint layout (CPU bound, holds the GIL).
+    Each worker keeps its own fetch cache, fonts and shared CSS.
+    PDF_RENDER_WORKERS=0 renders in the default thread executor instead.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Renders submitted and not finished yet (background work backs off when busy)
+        self.in_flight = 0
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a process that already runs motor / asyncio threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def busy(self) -> bool:
+        return self.in_flight >= max(self.workers, 1)
+
+    async def _submit(self, func: Callable, *args) -> bytes:
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def render(self, html_content: str, log_context: Optional[Dict[str, Any]] = None,
+                     **write_options) -> bytes:
+        return await self._submit(_render_job, html_content, log_context, write_options)
+
+    async def render_merged(self, html_parts: List[str], log_context: Optional[Dict[str, Any]] = None,
+                            bookmarks: Optional[List[str]] = None, **write_options) -> bytes:
+        return await self._submit(_render_merged_job, html_parts, log_context, bookmarks, write_options)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def _create_pdf_renderer() -> PDFRenderer:
+    from map_mirror import map_mirror
+
+    # map mirror -> asset store -> weasyprint default fetcher
+    return PDFRenderer(map_mirror.url_fetcher)
+
+
+# Global instances for easy use
+pdf_renderer = _create_pdf_renderer()
+render_pool = RenderPool(int(os.environ.get('PDF_RENDER_WORKERS', min(4, os.cpu_count() or 1))))
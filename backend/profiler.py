@@ -0,0 +1,268 @@
+"""
+Request Profiler - On-demand statistical profiles of slow requests
+A background thread samples the Python stacks of the process every few
+milliseconds while a selected request runs (admin header X-Profile, or a
+sampling rate). Profiles of requests over the latency threshold are saved as
+speedscope JSON (https://www.speedscope.app) with the share of time spent in
+each library (matplotlib, latex2mathml, jinja2, weasyprint...).
+WeasyPrint layout runs in the render pool processes: it is only sampled with
+PDF_RENDER_WORKERS=0; otherwise the profile shows the wait for the pool.
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import metrics
+from tracing import current_ids
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', '1000'))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_INTERVAL_MS', '5')) / 1000
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '50'))
+# A runaway request stops being sampled after this many samples
+MAX_SAMPLES = 20000
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# Leaf frames of threads that are waiting, not working (executor idle, event loop select)
+IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"), ("queue.py", "get"), ("thread.py", "_worker"),
+    ("connection.py", "wait"), ("socket.py", "readinto")
+}
+
+profiles_captured = metrics.counter("profiles_captured_total", "Request profiles by outcome (saved, below_threshold, busy)")
+
+Frame = Tuple[str, str, int]
+
+
+def _package(filename: str) -> str:
+    """matplotlib for .../site-packages/matplotlib/..., the module name for app code"""
+    parts = filename.replace("\\", "/").split("/")
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            index = parts.index(marker)
+            if index + 1 < len(parts):
+                return parts[index + 1].split(".")[0]
+    return os.path.splitext(parts[-1])[0]
+
+
+class StackSampler:
+    """Samples every thread but its own until stopped"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS, max_samples: int = MAX_SAMPLES):
+        self.interval = interval
+        self.max_samples = max_samples
+        self.frames: List[Frame] = []
+        self._frame_index: Dict[Frame, int] = {}
+        # thread name -> [(stack as frame indexes, weight in ms)]
+        self.samples: Dict[str, List[Tuple[List[int], float]]] = {}
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = 0.0
+        self._start_perf = 0.0
+        self.duration_ms = 0.0
+
+    def _intern(self, code) -> int:
+        frame = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+        index = self._frame_index.get(frame)
+        if index is None:
+            index = len(self.frames)
+            self.frames.append(frame)
+            self._frame_index[frame] = index
+        return index
+
+    def _sample(self, weight_ms: float):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            leaf = frame.f_code
+            if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_LEAVES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._intern(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.setdefault(names.get(ident, str(ident)), []).append((stack, weight_ms))
+        self.sample_count += 1
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval) and self.sample_count < self.max_samples:
+            now = time.perf_counter()
+            self._sample((now - last) * 1000)
+            last = now
+
+    def start(self):
+        self.started_at = time.time()
+        self._start_perf = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration_ms = (time.perf_counter() - self._start_perf) * 1000
+
+    def package_shares(self) -> Dict[str, float]:
+        """Share of sampled time with each package somewhere on the stack (inclusive)"""
+        total = 0.0
+        inclusive: Dict[str, float] = {}
+        for stacks in self.samples.values():
+            for stack, weight in stacks:
+                total += weight
+                for package in {_package(self.frames[index][1]) for index in stack}:
+                    inclusive[package] = inclusive.get(package, 0.0) + weight
+        if not total:
+            return {}
+        ranked = sorted(inclusive.items(), key=lambda item: item[1], reverse=True)
+        return {package: round(weight / total, 4) for package, weight in ranked}
+
+    def to_speedscope(self, name: str) -> Dict[str, Any]:
+        profiles = []
+        for thread_name, stacks in sorted(self.samples.items(), key=lambda item: -len(item[1])):
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weight for _, weight in stacks), 3),
+                "samples": [stack for stack, _ in stacks],
+                "weights": [round(weight, 3) for _, weight in stacks]
+            })
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "lemaitremot-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": fn, "file": file, "line": line} for fn, file, line in self.frames]},
+            "profiles": profiles
+        }
+
+
+class RequestProfiler:
+    """Decides which requests to profile, runs one sampler at a time and keeps recent profiles"""
+
+    def __init__(self, directory: str = PROFILE_DIR, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 threshold_ms: float = PROFILE_THRESHOLD_MS, interval: float = PROFILE_INTERVAL_SECONDS,
+                 keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.recent: deque = deque(maxlen=keep)
+        # Sampling sees every thread: two concurrent profiles would only blur each other
+        self._active = threading.Lock()
+
+    def should_profile(self, forced: bool) -> bool:
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self) -> Optional[StackSampler]:
+        if not self._active.acquire(blocking=False):
+            profiles_captured.inc(outcome="busy")
+            return None
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler: StackSampler, name: str, forced: bool,
+               metadata: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Stop sampling; save the profile if the request was slow (or explicitly profiled)"""
+        sampler.stop()
+        self._active.release()
+        if not forced and sampler.duration_ms < self.threshold_ms:
+            profiles_captured.inc(outcome="below_threshold")
+            return None
+
+        profile_id = uuid.uuid4().hex[:16]
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{profile_id}.speedscope.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(sampler.to_speedscope(name), f)
+
+        entry = {
+            "id": profile_id,
+            "name": name,
+            "started_at": sampler.started_at,
+            "duration_ms": round(sampler.duration_ms, 1),
+            "samples": sampler.sample_count,
+            "packages": dict(list(sampler.package_shares().items())[:10]),
+            "path": path,
+            **(metadata or {})
+        }
+        if len(self.recent) == self.recent.maxlen:
+            self._remove_file(self.recent[0]["path"])
+        self.recent.append(entry)
+        profiles_captured.inc(outcome="saved")
+        return entry
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in entry.items() if k != "path"} for entry in reversed(self.recent)]
+
+    def path_for(self, profile_id: str) -> Optional[str]:
+        for entry in self.recent:
+            if entry["id"] == profile_id:
+                return entry["path"]
+        return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: profile requests sent with X-Profile: 1 + X-Admin-Key, or sampled ones"""
+
+    def __init__(self, app, profiler: RequestProfiler, admin_key: Optional[str] = None):
+        self.app = app
+        self.profiler = profiler
+        self.admin_key = admin_key
+
+    def _forced(self, headers: Dict[bytes, bytes]) -> bool:
+        if not self.admin_key or headers.get(b"x-profile") != b"1":
+            return False
+        return hmac.compare_digest(headers.get(b"x-admin-key", b""), self.admin_key.encode())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        forced = self._forced(dict(scope.get("headers") or []))
+        if not self.profiler.should_profile(forced):
+            await self.app(scope, receive, send)
+            return
+        sampler = self.profiler.start()
+        if sampler is None:
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{scope.get('method', '')} {scope.get('path', '')}"
+        metadata = {"request_id": current_ids().get("request_id")}
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Writing the profile is file I/O: keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.profiler.finish, sampler, name, forced, metadata
+            )
+
+
+# Global instance for easy use
+request_profiler = RequestProfiler()
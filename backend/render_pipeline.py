@@ -0,0 +1,371 @@
+"""
+Document Render Pipeline - Single pass over a stored document before display or export
+Stages: normalize -> math -> schemas -> documents -> template.
+The per-exercise stages (math, schemas, documents) are memoized by the content
+hash of the exercise entering the stage, so a fragment is rendered at most once
+per process for a given content, and every stage is timed. Inside a stage,
+identical text fragments (same LaTeX) and identical schemas are rendered once
+too, even when they belong to different exercises or documents.
+"""
+
+import asyncio
+import copy
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from curriculum_complete import process_math_content_for_pdf
+from geometry_renderer import geometry_renderer
+from latex_to_svg import latex_renderer
+from logger import get_logger, log_schema_processing
+from metrics import metrics
+from render_schema import schema_renderer
+
+logger = get_logger()
+
+# Memo shared by every request of the process, bounded by the approximate size of its values
+STAGE_CACHE_BYTES = int(os.environ.get('STAGE_CACHE_MB', '64')) * 1024 * 1024
+
+TARGETS = ("web", "pdf")
+STAGES = ("normalize", "math", "schemas", "documents", "template")
+EXERCISE_STAGES = ("math", "schemas", "documents")
+
+stage_duration = metrics.histogram("render_pipeline_stage_seconds", "Document render pipeline time by stage and target")
+stage_cache_hits = metrics.counter("render_pipeline_cache_hits_total", "Exercise stages served from the memo cache")
+stage_cache_misses = metrics.counter("render_pipeline_cache_misses_total", "Exercise stages actually computed")
+fragment_cache_hits = metrics.counter("render_pipeline_fragment_hits_total", "Fragments and schemas served from the memo cache")
+fragment_cache_misses = metrics.counter("render_pipeline_fragment_misses_total", "Fragments and schemas actually rendered")
+
+
+def content_hash(value: Any) -> str:
+    """Stable hash of a JSON-like value (exercise, schema)"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def render_fragment(content: str, target: str = "web") -> str:
+    """
+    Render one text fragment: legacy geometric schemas, then LaTeX to SVG,
+    then (PDF only) the remaining fractions/roots to MathML.
+    """
+    if not content or not isinstance(content, str):
+        return content if isinstance(content, str) else ""
+
+    # 1. Legacy geometric schemas embedded in the text (PNG for web, vector SVG for print)
+    try:
+        if target == "pdf":
+            content = geometry_renderer.process_geometric_schemas(content)
+        else:
+            content = geometry_renderer.process_geometric_schemas_for_web(content)
+    except Exception as e:
+        logger.error(f"Error processing legacy geometric schemas: {e}")
+
+    # 2. LaTeX formulas
+    try:
+        content = latex_renderer.convert_latex_to_svg(content)
+    except Exception as e:
+        logger.error(f"Error processing LaTeX: {e}")
+
+    # 3. MathML for what WeasyPrint still has to typeset
+    if target == "pdf":
+        content = process_math_content_for_pdf(content)
+    return content
+
+
+def approximate_size(value: Any) -> int:
+    """Approximate memory footprint of a cached value: its serialized length"""
+    if isinstance(value, str):
+        return len(value)
+    return len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+class StageCache:
+    """Thread-safe LRU of stage results keyed by (stage, target, content hash), bounded by total bytes"""
+
+    def __init__(self, max_bytes: int = STAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[tuple, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        # Callers mutate their exercises: never hand out the cached object
+        return copy.deepcopy(entry[0]) if entry is not None else None
+
+    def put(self, key: tuple, value: Any):
+        size = approximate_size(value)
+        if size > self.max_bytes:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class DocumentRenderPipeline:
+    """
+    Prepare a stored document for one target:
+    - "web": display in the app (get_documents)
+    - "pdf": export templates (export_pdf, export_pdf_advanced)
+    """
+
+    def __init__(self, target: str, cache: Optional["StageCache"] = None,
+                 model: Optional[Callable[..., Any]] = None,
+                 url_rewriter: Optional[Callable[[str], Optional[str]]] = None,
+                 progress: Optional[Callable[[str, int, int], None]] = None):
+        if target not in TARGETS:
+            raise ValueError(f"Unknown render target: {target}")
+        self.target = target
+        self.cache = cache if cache is not None else stage_cache
+        # Pydantic model used to validate and fill defaults (server.Document)
+        self.model = model
+        # Web only: maps the source URL of a geographic document to a local one
+        self.url_rewriter = url_rewriter
+        # Called as progress(stage, exercises_done, exercises_total) - export jobs report it
+        self.progress = progress
+        self.timings: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+
+    # ------------------------------------------------------------------ driver
+
+    def prepare(self, doc: Dict[str, Any], doc_id: Optional[str] = None) -> Dict[str, Any]:
+        """Run normalize -> math -> schemas -> documents on a document dict (in place)"""
+        doc_id = doc_id or str(doc.get("id", "unknown"))[:8]
+        self.timings = {stage: 0.0 for stage in STAGES}
+        self.cache_hits = self.cache_misses = 0
+        self.fragment_hits = self.fragment_misses = 0
+        with self._timed("normalize"):
+            doc = self.normalize(doc)
+
+        exercises = doc.get("exercises")
+        if isinstance(exercises, list):
+            for stage in EXERCISE_STAGES:
+                with self._timed(stage):
+                    for index, exercise in enumerate(exercises):
+                        exercises[index] = self._run_exercise_stage(stage, exercise, doc_id)
+                        if self.progress:
+                            self.progress(stage, index + 1, len(exercises))
+
+        self._log(doc_id, exercise_count=len(exercises) if isinstance(exercises, list) else 0)
+        return doc
+
+    async def prepare_async(self, doc: Dict[str, Any], doc_id: Optional[str] = None) -> Dict[str, Any]:
+        """prepare() on the prepare executor (see run_prepare)"""
+        return await run_prepare(functools.partial(self.prepare, doc, doc_id))
+
+    def render_template(self, template, **context) -> str:
+        """Template stage: render the prepared document with a compiled Jinja2 template"""
+        with self._timed("template"):
+            return template.render(**context)
+
+    def _run_exercise_stage(self, stage: str, exercise: Dict[str, Any], doc_id: str) -> Dict[str, Any]:
+        if not isinstance(exercise, dict):
+            return exercise
+        if stage == "documents" and self.url_rewriter:
+            # Not memoized: local map URLs depend on the mirror state, not only on the exercise
+            return self._stage_documents(exercise, doc_id)
+        key = (stage, self.target, content_hash(exercise))
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            stage_cache_hits.inc(stage=stage, target=self.target)
+            return cached
+
+        self.cache_misses += 1
+        stage_cache_misses.inc(stage=stage, target=self.target)
+        result = getattr(self, f"_stage_{stage}")(exercise, doc_id)
+        self.cache.put(key, result)
+        return result
+
+    def _memoized(self, kind: str, value: Any, render: Callable[[], Any]) -> Any:
+        """Fragment-level memo: the same formula or schema is rendered once across exercises"""
+        key = (kind, self.target, content_hash(value))
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.fragment_hits += 1
+            fragment_cache_hits.inc(kind=kind, target=self.target)
+            return cached
+
+        self.fragment_misses += 1
+        fragment_cache_misses.inc(kind=kind, target=self.target)
+        result = render()
+        if result is not None:
+            self.cache.put(key, result)
+        return result
+
+    def _fragment(self, content: Any) -> Any:
+        if not content or not isinstance(content, str):
+            return render_fragment(content, self.target)
+        return self._memoized("fragment", content, lambda: render_fragment(content, self.target))
+
+    # ------------------------------------------------------------------ stages
+
+    def normalize(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse created_at, validate through the model and give every exercise its defaults"""
+        doc.pop("_id", None)
+        if isinstance(doc.get("created_at"), str):
+            doc["created_at"] = datetime.fromisoformat(doc["created_at"])
+        if self.model is not None:
+            doc = self.model(**doc).dict()
+
+        for exercise in doc.get("exercises") or []:
+            if not isinstance(exercise, dict):
+                continue
+            if self.target == "pdf":
+                exercise.setdefault("schema_svg", "")
+            if exercise.get("solution") is None:
+                exercise["solution"] = {}
+        return doc
+
+    def _stage_math(self, exercise: Dict[str, Any], doc_id: str) -> Dict[str, Any]:
+        """LaTeX / legacy schemas / MathML of every text fragment of the exercise"""
+        exercise = copy.deepcopy(exercise)
+        if exercise.get("enonce"):
+            exercise["enonce"] = self._fragment(exercise["enonce"])
+
+        donnees = exercise.get("donnees")
+        if (self.target == "pdf" and exercise.get("type") == "qcm"
+                and isinstance(donnees, dict) and isinstance(donnees.get("options"), list)):
+            donnees["options"] = [self._fragment(option) for option in donnees["options"]]
+
+        solution = exercise.get("solution")
+        if isinstance(solution, dict):
+            if solution.get("resultat"):
+                solution["resultat"] = self._fragment(solution["resultat"])
+            if isinstance(solution.get("etapes"), list):
+                solution["etapes"] = [self._fragment(step) for step in solution["etapes"]]
+        return exercise
+
+    def _stage_schemas(self, exercise: Dict[str, Any], doc_id: str) -> Dict[str, Any]:
+        """Render donnees.schema to schema_svg for print (web uses schema_img from generation)"""
+        if self.target != "pdf":
+            return exercise
+        donnees = exercise.get("donnees")
+        schema_data = donnees.get("schema") if isinstance(donnees, dict) else None
+        if not schema_data:
+            exercise["schema_svg"] = ""
+            return exercise
+
+        schema_type = schema_data.get("type", "unknown") if isinstance(schema_data, dict) else "unknown"
+        svg_content = self._memoized("schema", schema_data, lambda: self._render_schema(schema_data))
+        exercise["schema_svg"] = svg_content or ""
+        log_schema_processing(schema_type, bool(svg_content), doc_id=doc_id, exercise_id=exercise.get("id"))
+        return exercise
+
+    @staticmethod
+    def _render_schema(schema_data: Any) -> Optional[str]:
+        try:
+            return schema_renderer.render_to_svg(schema_data)
+        except Exception as e:
+            logger.error(f"Error rendering schema for PDF: {e}")
+            return None
+
+    def _stage_documents(self, exercise: Dict[str, Any], doc_id: str) -> Dict[str, Any]:
+        """Geographic documents: attribution checks for print, local map URL for web"""
+        geo_document = exercise.get("document")
+        if not isinstance(geo_document, dict):
+            return exercise
+
+        if self.target == "pdf":
+            if not geo_document.get("url_fichier_direct"):
+                logger.warning(
+                    "⚠️ Geographic document missing image URL",
+                    module_name="render_pipeline",
+                    func_name="documents",
+                    doc_id=doc_id,
+                    document_title=geo_document.get("titre", "Unknown")
+                )
+            if not (geo_document.get("licence") or {}).get("notice_attribution"):
+                logger.warning(
+                    "⚠️ Geographic document missing attribution",
+                    module_name="render_pipeline",
+                    func_name="documents",
+                    doc_id=doc_id,
+                    document_title=geo_document.get("titre", "Unknown")
+                )
+        elif self.url_rewriter:
+            local_url = self.url_rewriter(geo_document.get("url_fichier_direct"))
+            if local_url:
+                geo_document["url_fichier_source"] = geo_document["url_fichier_direct"]
+                geo_document["url_fichier_direct"] = local_url
+        return exercise
+
+    # ------------------------------------------------------------------ timing
+
+    def _timed(self, stage: str):
+        return _StageTimer(self, stage)
+
+    def _log(self, doc_id: str, exercise_count: int):
+        # Listing pages prepare many documents: web timings only at debug level
+        log = logger.info if self.target == "pdf" else logger.debug
+        log(
+            "Document render pipeline",
+            module_name="render_pipeline",
+            func_name="prepare",
+            doc_id=doc_id,
+            target=self.target,
+            exercise_count=exercise_count,
+            cache_hits=self.cache_hits,
+            cache_misses=self.cache_misses,
+            fragment_hits=self.fragment_hits,
+            fragment_misses=self.fragment_misses,
+            duration_ms=round(sum(self.timings.values()) * 1000, 2),
+            **{f"{stage}_ms": round(seconds * 1000, 2) for stage, seconds in self.timings.items()}
+        )
+
+    def timings_ms(self) -> Dict[str, float]:
+        return {stage: round(seconds * 1000, 2) for stage, seconds in self.timings.items()}
+
+
+class _StageTimer:
+    def __init__(self, pipeline: DocumentRenderPipeline, stage: str):
+        self.pipeline = pipeline
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.pipeline.timings[self.stage] += elapsed
+        stage_duration.observe(elapsed, stage=self.stage, target=self.pipeline.target)
+        return False
+
+
+# Global memo shared by every request of the process
+stage_cache = StageCache()
+
+# Every preparation of the process (exports, display, speculative and bulk exports)
+# runs on this one thread: matplotlib (schemas) is not thread-safe, and the event
+# loop stays free meanwhile.
+prepare_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render-prepare")
+
+
+async def run_prepare(func: Callable[..., Any], *args) -> Any:
+    """Run func(*args) on the prepare executor; anything that renders schemas goes through here"""
+    return await asyncio.get_running_loop().run_in_executor(prepare_executor, func, *args)
@@ -0,0 +1,173 @@
+"""
+Request Context Loader - Resolve auth, Pro status, template config and document
+lookups of an export request concurrently, memoized for the request lifetime
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_TEMPLATE_CONFIG = {'template_style': 'minimaliste'}
+
+
+@dataclass
+class AuthContext:
+    """Authentication state resolved from the X-Session-Token header"""
+    email: Optional[str] = None
+    is_pro: bool = False
+    user: Optional[dict] = None
+    template_config: Dict[str, Any] = field(default_factory=dict)
+
+
+def _as_utc(value: Any) -> Optional[datetime]:
+    """Normalize a stored datetime (ISO string or naive datetime) to UTC"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def is_subscription_active(user: Optional[dict]) -> bool:
+    """Same rule as check_user_pro_status: subscription_expires must be in the future"""
+    if not user or not user.get("subscription_expires"):
+        return False
+    return _as_utc(user["subscription_expires"]) > datetime.now(timezone.utc)
+
+
+def build_template_config(template_doc: Optional[dict]) -> Dict[str, Any]:
+    """Map a user_templates document to the render config used by the export templates"""
+    if not template_doc:
+        return dict(DEFAULT_TEMPLATE_CONFIG)
+    return {
+        'template_style': template_doc.get('template_style', 'minimaliste'),
+        'professor_name': template_doc.get('professor_name'),
+        'school_name': template_doc.get('school_name'),
+        'school_year': template_doc.get('school_year'),
+        'footer_text': template_doc.get('footer_text'),
+        'logo_url': template_doc.get('logo_url'),
+        'logo_filename': template_doc.get('logo_filename')
+    }
+
+
+class RequestContextLoader:
+    """
+    Loads the data an export needs in as few round trips as possible:
+    - session + pro user + template config in a single $lookup aggregation
+    - the document fetched concurrently with the auth lookup
+    Every lookup is memoized, so calling it twice in one request costs nothing.
+    """
+
+    def __init__(self, db, session_token: Optional[str] = None):
+        self.db = db
+        self.session_token = session_token
+        self._tasks: Dict[Any, asyncio.Task] = {}
+
+    def _memoize(self, key: Any, factory: Callable[[], Awaitable[Any]]) -> "asyncio.Task":
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+        return task
+
+    async def auth(self) -> AuthContext:
+        """Resolve the session token to an AuthContext (anonymous if missing or invalid)"""
+        return await self._memoize("auth", self._load_auth)
+
+    async def document(self, document_id: str) -> Optional[dict]:
+        """Fetch a document by id"""
+        return await self._memoize(("document", document_id),
+                                   lambda: self.db.documents.find_one({"id": document_id}))
+
+    async def load(self, document_id: str) -> Tuple[AuthContext, Optional[dict]]:
+        """Resolve auth and document concurrently"""
+        return await asyncio.gather(self.auth(), self.document(document_id))
+
+    async def _load_auth(self) -> AuthContext:
+        if not self.session_token:
+            return AuthContext()
+
+        pipeline = [
+            {"$match": {"session_token": self.session_token}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "pro_users",
+                "localField": "user_email",
+                "foreignField": "email",
+                "as": "pro_user"
+            }},
+            {"$lookup": {
+                "from": "user_templates",
+                "localField": "user_email",
+                "foreignField": "user_email",
+                "as": "user_template"
+            }}
+        ]
+
+        try:
+            rows = await self.db.login_sessions.aggregate(pipeline).to_list(length=1)
+        except Exception as e:
+            logger.error(f"Error loading request context for session: {e}")
+            return AuthContext()
+
+        if not rows:
+            return AuthContext()
+
+        session = rows[0]
+        expires_at = _as_utc(session.get('expires_at'))
+        if expires_at and expires_at < datetime.now(timezone.utc):
+            # Session expired, clean it up without holding the export on it
+            self._memoize("delete_session", self._delete_session)
+            return AuthContext()
+
+        # last_used is bookkeeping only - don't hold the export on it
+        self._memoize("touch_session", self._touch_session)
+
+        email = session.get('user_email')
+        user = (session.get('pro_user') or [None])[0]
+        is_pro = is_subscription_active(user)
+        template_doc = (session.get('user_template') or [None])[0]
+
+        logger.info(
+            "Request context resolved",
+            module_name="request_context",
+            func_name="load_auth",
+            user_type="pro" if is_pro else "authenticated",
+            has_template=bool(template_doc)
+        )
+
+        return AuthContext(
+            email=email,
+            is_pro=is_pro,
+            user=user if is_pro else None,
+            template_config=build_template_config(template_doc) if is_pro else {}
+        )
+
+    async def _delete_session(self):
+        try:
+            await self.db.login_sessions.delete_one({"session_token": self.session_token})
+        except Exception as e:
+            logger.warning(f"Could not delete expired session: {e}")
+
+    async def _touch_session(self):
+        try:
+            await self.db.login_sessions.update_one(
+                {"session_token": self.session_token},
+                {"$set": {"last_used": datetime.now(timezone.utc)}}
+            )
+        except Exception as e:
+            logger.warning(f"Could not update session last_used: {e}")
+
+
+def get_request_context(db, http_request) -> RequestContextLoader:
+    """Return the loader attached to this request, creating it on first use"""
+    loader = getattr(http_request.state, "context_loader", None)
+    if loader is None:
+        loader = RequestContextLoader(db, http_request.headers.get("X-Session-Token"))
+        http_request.state.context_loader = loader
+    return loader
@@ -0,0 +1,217 @@
+"""
+Response Encoding - orjson responses and gzip/brotli compression for API payloads
+Documents returned by /api/documents and /api/generate carry inline SVG math
+and base64 schema images (often hundreds of KB). OrjsonResponse serializes them
+with orjson, skipping FastAPI's jsonable_encoder pass when returned directly.
+CompressionMiddleware compresses responses above a minimum size whose content
+type is text-like (JSON, HTML, SVG...). It picks brotli when the client accepts
+it, otherwise gzip. PDFs, images and zips are already compressed and go through
+untouched.
+"""
+
+import asyncio
+import gzip
+import os
+import zlib
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+from metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+# Dynamic content: quality 4 compresses better than gzip -6 at a similar speed
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+# Larger bodies are compressed in the default executor to keep the event loop free
+COMPRESSION_EXECUTOR_SIZE = 256 * 1024
+
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/javascript", "application/xml", "image/svg+xml",
+    "text/html", "text/plain", "text/css", "text/csv", "text/xml",
+)
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+compressed_bytes = metrics.counter("http_compression_bytes_total", "Bytes before/after response compression by encoding")
+
+
+def _orjson_default(value: Any) -> Any:
+    """Types orjson does not know natively, encoded as jsonable_encoder would"""
+    if isinstance(value, BaseModel):
+        # pydantic's own JSON mode, as FastAPI does (UTC datetimes as "Z")
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    # bson.ObjectId and other identifiers
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_orjson_default, option=ORJSON_OPTIONS)
+
+
+class OrjsonResponse(JSONResponse):
+    """JSONResponse rendered by orjson (datetimes as ISO 8601, pydantic models dumped)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {encoding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted_encodings(accept_encoding)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    ranked = [(accepted.get(name, accepted.get("*", 0.0)), -index, name) for index, name in enumerate(candidates)]
+    q, _, name = max(ranked)
+    return name if q > 0 else None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = COMPRESSION_GZIP_LEVEL,
+             brotli_quality: int = COMPRESSION_BROTLI_QUALITY) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class _StreamCompressor:
+    """Incremental compressor for responses sent in several chunks"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def chunk(self, data: bytes, last: bool) -> bytes:
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if last else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+class CompressionMiddleware:
+    """ASGI middleware: gzip / brotli for text-like responses of at least minimum_size bytes"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE,
+                 content_types: Iterable[str] = COMPRESSIBLE_TYPES,
+                 gzip_level: int = COMPRESSION_GZIP_LEVEL, brotli_quality: int = COMPRESSION_BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = tuple(content_types)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[dict] = None
+        compressor: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = list(message.get("headers") or [])
+                content_type = (_header(headers, b"content-type") or b"").decode("latin-1").split(";")[0].strip()
+                passthrough = (
+                    message["status"] in (204, 206, 304)
+                    or _header(headers, b"content-encoding") is not None
+                    or content_type not in self.content_types
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body:
+                    # Whole body at once (JSON, HTML): compress in one call
+                    if len(body) < self.minimum_size:
+                        await send(start_message)
+                        await send(message)
+                        return
+                    if len(body) >= COMPRESSION_EXECUTOR_SIZE:
+                        compressed = await asyncio.get_running_loop().run_in_executor(
+                            None, compress, body, encoding, self.gzip_level, self.brotli_quality
+                        )
+                    else:
+                        compressed = compress(body, encoding, self.gzip_level, self.brotli_quality)
+                    compressed_bytes.inc(len(body), encoding=encoding, stage="raw")
+                    compressed_bytes.inc(len(compressed), encoding=encoding, stage="wire")
+                    await send(self._start(start_message, encoding, len(compressed)))
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                compressor = _StreamCompressor(encoding, self.gzip_level, self.brotli_quality)
+                await send(self._start(start_message, encoding, None))
+
+            chunk = compressor.chunk(body, last=not more_body)
+            compressed_bytes.inc(len(body), encoding=encoding, stage="raw")
+            compressed_bytes.inc(len(chunk), encoding=encoding, stage="wire")
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _start(message: dict, encoding: str, length: Optional[int]) -> dict:
+        headers = [(key, value) for key, value in message.get("headers") or []
+                   if key.lower() not in (b"content-length", b"vary")]
+        vary = _header(list(message.get("headers") or []), b"vary")
+        vary_values = [v.strip() for v in vary.decode("latin-1").split(",") if v.strip()] if vary else []
+        if not any(v.lower() == "accept-encoding" for v in vary_values):
+            vary_values.append("Accept-Encoding")
+        headers.append((b"content-encoding", encoding.encode()))
+        headers.append((b"vary", ", ".join(vary_values).encode("latin-1")))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        return {**message, "headers": headers}
@@ -0,0 +1,340 @@
+"""
+Retention - TTL policy and compacting archiver for abandoned guest documents
+Guest documents with no recent export are moved out of the hot `documents`
+collection, either to a cold collection or to compressed local JSONL files,
+and can be restored on demand.
+"""
+
+import asyncio
+import gzip
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from bson import json_util
+from pymongo import ReplaceOne
+
+from asset_store import asset_store
+from logger import get_logger
+from metrics import metrics
+
+logger = get_logger()
+
+ROOT_DIR = Path(__file__).parent
+
+# Guest exports older than this are never read (quota window is 30 days)
+QUOTA_WINDOW_DAYS = 30
+
+# Archive lines keep datetimes timezone-aware so restored documents compare like live ones
+ARCHIVE_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(tz_aware=True, tzinfo=timezone.utc)
+
+MONITORED_COLLECTIONS = ["documents", "exports", "documents_archive", "exports_archive"]
+
+archived_documents_total = metrics.counter(
+    "retention_archived_documents_total", "Documents moved out of the documents collection")
+archived_bytes_total = metrics.counter(
+    "retention_archived_bytes_total", "Bytes written to the archive, by target")
+restored_documents_total = metrics.counter(
+    "retention_restored_documents_total", "Archived documents restored")
+archived_exports_total = metrics.counter(
+    "retention_archived_exports_total", "Guest export records moved out of the exports collection")
+collection_size_bytes = metrics.gauge(
+    "mongo_collection_size_bytes", "Uncompressed data size per collection")
+collection_documents = metrics.gauge(
+    "mongo_collection_documents", "Document count per collection")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+@dataclass
+class RetentionPolicy:
+    """Retention settings, read from the environment"""
+    guest_document_ttl_days: int = 90      # 0 disables document archival
+    guest_export_ttl_days: int = 180       # 0 disables export archival
+    archive_mode: str = "collection"       # "collection" or "jsonl"
+    archive_dir: str = str(ROOT_DIR / "archive")
+    batch_size: int = 200
+    interval_hours: int = 24
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            guest_document_ttl_days=_env_int('GUEST_DOCUMENT_TTL_DAYS', 90),
+            guest_export_ttl_days=_env_int('GUEST_EXPORT_TTL_DAYS', 180),
+            archive_mode=os.environ.get('ARCHIVE_MODE', 'collection').lower(),
+            archive_dir=os.environ.get('ARCHIVE_DIR', str(ROOT_DIR / "archive")),
+            batch_size=_env_int('ARCHIVE_BATCH_SIZE', 200),
+            interval_hours=_env_int('RETENTION_INTERVAL_HOURS', 24)
+        )
+
+
+class DocumentArchiver:
+    """Moves abandoned guest documents and stale guest export records to cold storage"""
+
+    LOCK_ID = "retention"
+
+    def __init__(self, db, policy: Optional[RetentionPolicy] = None):
+        self.db = db
+        self.policy = policy or RetentionPolicy.from_env()
+
+    # ------------------------------------------------------------------ selection
+
+    def _abandoned_pipeline(self, now: datetime) -> List[Dict[str, Any]]:
+        cutoff = now - timedelta(days=self.policy.guest_document_ttl_days)
+        return [
+            # created_at is an ISO string for new documents, a datetime for older ones.
+            # Pro documents are never abandoned: they carry user_id when generated while
+            # logged in, otherwise their guest id is linked to the account (pro_users.guest_ids)
+            {"$match": {
+                "guest_id": {"$nin": [None, ""]},
+                "user_id": None,
+                "$or": [
+                    {"created_at": {"$lt": cutoff.isoformat()}},
+                    {"created_at": {"$lt": cutoff}}
+                ]
+            }},
+            {"$lookup": {
+                "from": "pro_users",
+                "localField": "guest_id",
+                "foreignField": "guest_ids",
+                "as": "pro_owner"
+            }},
+            {"$match": {"pro_owner": {"$size": 0}}},
+            {"$lookup": {
+                "from": "exports",
+                "let": {"doc_id": "$id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$and": [
+                        {"$eq": ["$document_id", "$$doc_id"]},
+                        {"$gte": ["$created_at", cutoff]}
+                    ]}}},
+                    {"$limit": 1}
+                ],
+                "as": "recent_exports"
+            }},
+            {"$match": {"recent_exports": {"$size": 0}}},
+            {"$project": {"pro_owner": 0, "recent_exports": 0}},
+            {"$limit": self.policy.batch_size}
+        ]
+
+    # ------------------------------------------------------------------ archival
+
+    @staticmethod
+    def _compact(doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Drop the Mongo _id and move any inline heavy assets to the asset store"""
+        doc.pop('_id', None)
+        doc['exercises'] = [asset_store.externalize_exercise(ex) for ex in doc.get('exercises', [])]
+        return doc
+
+    def _write_jsonl(self, docs: List[Dict[str, Any]], now: datetime) -> Dict[str, int]:
+        """Append documents to today's gzip JSONL archive; returns id -> bytes written"""
+        archive_dir = Path(self.policy.archive_dir)
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        archive_file = archive_dir / f"documents-{now.strftime('%Y%m%d')}.jsonl.gz"
+
+        sizes = {}
+        lines = []
+        for doc in docs:
+            line = json_util.dumps(doc, json_options=ARCHIVE_JSON_OPTIONS) + "\n"
+            sizes[doc['id']] = len(line.encode('utf-8'))
+            lines.append(line)
+
+        # Each run appends a new gzip member - concatenated members are a valid gzip stream
+        with gzip.open(archive_file, 'at', encoding='utf-8') as f:
+            f.writelines(lines)
+        return sizes
+
+    async def archive_abandoned_documents(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Archive one batch of abandoned guest documents"""
+        if self.policy.guest_document_ttl_days <= 0:
+            return {"documents": 0, "bytes": 0}
+
+        now = now or datetime.now(timezone.utc)
+        docs = await self.db.documents.aggregate(self._abandoned_pipeline(now)).to_list(length=self.policy.batch_size)
+        if not docs:
+            return {"documents": 0, "bytes": 0}
+
+        docs = [self._compact(doc) for doc in docs]
+        ids = [doc['id'] for doc in docs]
+
+        if self.policy.archive_mode == "jsonl":
+            archive_file = f"documents-{now.strftime('%Y%m%d')}.jsonl.gz"
+            sizes = await asyncio.get_running_loop().run_in_executor(None, self._write_jsonl, docs, now)
+            await self.db.archived_documents.bulk_write([
+                ReplaceOne({"id": doc['id']}, {"id": doc['id'], "guest_id": doc.get('guest_id'),
+                                               "archive_file": archive_file, "bytes": sizes[doc['id']],
+                                               "archived_at": now}, upsert=True)
+                for doc in docs
+            ], ordered=False)
+        else:
+            for doc in docs:
+                doc['archived_at'] = now
+            sizes = {doc['id']: len(json_util.dumps(doc).encode('utf-8')) for doc in docs}
+            # Upsert so a pass interrupted before the delete can safely run again
+            await self.db.documents_archive.bulk_write(
+                [ReplaceOne({"id": doc['id']}, doc, upsert=True) for doc in docs], ordered=False)
+
+        # Only delete once the archive write succeeded
+        await self.db.documents.delete_many({"id": {"$in": ids}})
+
+        total_bytes = sum(sizes.values())
+        archived_documents_total.inc(len(ids))
+        archived_bytes_total.inc(total_bytes, target=self.policy.archive_mode)
+        logger.info(
+            "Archived abandoned guest documents",
+            module_name="retention",
+            func_name="archive_abandoned_documents",
+            archived=len(ids),
+            archived_bytes=total_bytes,
+            archive_mode=self.policy.archive_mode,
+            status="success"
+        )
+        return {"documents": len(ids), "bytes": total_bytes}
+
+    async def archive_guest_exports(self, now: Optional[datetime] = None) -> int:
+        """Move guest export records that fell out of every quota window"""
+        if self.policy.guest_export_ttl_days <= 0:
+            return 0
+
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(days=max(self.policy.guest_export_ttl_days, QUOTA_WINDOW_DAYS))
+        query = {"is_pro": {"$ne": True}, "created_at": {"$lt": cutoff}}
+
+        records = await self.db.exports.find(query).limit(self.policy.batch_size).to_list(length=self.policy.batch_size)
+        if not records:
+            return 0
+
+        await self.db.exports_archive.bulk_write(
+            [ReplaceOne({"_id": r['_id']}, r, upsert=True) for r in records], ordered=False)
+        await self.db.exports.delete_many({"_id": {"$in": [r['_id'] for r in records]}})
+        archived_exports_total.inc(len(records))
+        return len(records)
+
+    # ------------------------------------------------------------------ restore
+
+    def _read_from_jsonl(self, archive_file: str, document_id: str) -> Optional[Dict[str, Any]]:
+        path = Path(self.policy.archive_dir) / archive_file
+        if not path.exists():
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                # Cheap prefilter before parsing the whole line
+                if document_id not in line:
+                    continue
+                doc = json_util.loads(line, json_options=ARCHIVE_JSON_OPTIONS)
+                if doc.get('id') == document_id:
+                    return doc
+        return None
+
+    async def restore_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Bring an archived document back into the documents collection"""
+        doc = await self.db.documents_archive.find_one({"id": document_id})
+        source = "collection"
+        if doc is None:
+            entry = await self.db.archived_documents.find_one({"id": document_id})
+            if entry is None:
+                return None
+            doc = await asyncio.get_running_loop().run_in_executor(
+                None, self._read_from_jsonl, entry['archive_file'], document_id)
+            source = "jsonl"
+            if doc is None:
+                logger.error(f"Archived document {document_id} missing from {entry['archive_file']}")
+                return None
+
+        doc.pop('_id', None)
+        doc.pop('archived_at', None)
+        await self.db.documents.replace_one({"id": document_id}, doc, upsert=True)
+        if source == "collection":
+            await self.db.documents_archive.delete_one({"id": document_id})
+        else:
+            await self.db.archived_documents.delete_one({"id": document_id})
+
+        restored_documents_total.inc(source=source)
+        logger.info(
+            "Archived document restored",
+            module_name="retention",
+            func_name="restore_document",
+            doc_id=document_id,
+            source=source
+        )
+        return await self.db.documents.find_one({"id": document_id})
+
+    # ------------------------------------------------------------------ metrics
+
+    async def refresh_collection_metrics(self) -> Dict[str, Dict[str, int]]:
+        """Update the collection size gauges from collStats"""
+        stats = {}
+        for name in MONITORED_COLLECTIONS:
+            try:
+                result = await self.db.command("collStats", name)
+            except Exception:
+                # Collection does not exist yet
+                continue
+            stats[name] = {"size": int(result.get("size", 0)), "count": int(result.get("count", 0)),
+                           "storage_size": int(result.get("storageSize", 0))}
+            collection_size_bytes.set(stats[name]["size"], collection=name)
+            collection_documents.set(stats[name]["count"], collection=name)
+
+        archive_dir = Path(self.policy.archive_dir)
+        if archive_dir.exists():
+            stats["jsonl_archive"] = {
+                "size": sum(p.stat().st_size for p in archive_dir.glob("*.jsonl.gz")),
+                "count": await self.db.archived_documents.count_documents({})
+            }
+            collection_size_bytes.set(stats["jsonl_archive"]["size"], collection="jsonl_archive")
+        return stats
+
+    # ------------------------------------------------------------------ scheduling
+
+    async def _acquire_lock(self, now: datetime) -> bool:
+        """Lease lock so only one uvicorn worker runs a retention pass"""
+        lease_until = now + timedelta(hours=max(self.policy.interval_hours, 1))
+        try:
+            result = await self.db.maintenance_locks.update_one(
+                {"_id": self.LOCK_ID, "lease_until": {"$lt": now}},
+                {"$set": {"lease_until": lease_until, "holder": os.getpid()}},
+                upsert=True
+            )
+            return result.modified_count > 0 or result.upserted_id is not None
+        except Exception:
+            # Duplicate key on upsert: another worker holds the lease
+            return False
+
+    async def run_once(self) -> Dict[str, Any]:
+        """One full retention pass: archive documents in batches, then exports"""
+        now = datetime.now(timezone.utc)
+        totals = {"documents": 0, "bytes": 0, "exports": 0}
+        while True:
+            batch = await self.archive_abandoned_documents(now)
+            totals["documents"] += batch["documents"]
+            totals["bytes"] += batch["bytes"]
+            if batch["documents"] < self.policy.batch_size:
+                break
+        while True:
+            archived = await self.archive_guest_exports(now)
+            totals["exports"] += archived
+            if archived < self.policy.batch_size:
+                break
+        totals["collections"] = await self.refresh_collection_metrics()
+        return totals
+
+    async def run_periodically(self):
+        """Background loop started with the app"""
+        while True:
+            try:
+                if await self._acquire_lock(datetime.now(timezone.utc)):
+                    await self.run_once()
+                else:
+                    await self.refresh_collection_metrics()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Retention pass failed: {e}")
+            await asyncio.sleep(self.policy.interval_hours * 3600)
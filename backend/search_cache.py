@@ -0,0 +1,133 @@
+"""
+Search Cache - Geographic document searches cached in Mongo, shared by every worker
+Keyed by (doc_type, sorted elements_requis, langue). Found candidates are kept
+SEARCH_CACHE_TTL_HOURS; empty or failed searches are cached too (negative
+entries, shorter TTL) so a broken search is not retried on every exercise.
+Entries in the last part of their life are still served and refreshed in the
+background by a single worker (atomic claim on refresh_after).
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from logger import get_logger
+from metrics import metrics
+from metrics_export import register_cache_ratio
+
+logger = get_logger()
+
+SEARCH_CACHE_ENABLED = os.environ.get('SEARCH_CACHE_ENABLED', 'true').lower() == 'true'
+SEARCH_CACHE_TTL = timedelta(hours=float(os.environ.get('SEARCH_CACHE_TTL_HOURS', '168')))
+SEARCH_CACHE_NEGATIVE_TTL = timedelta(minutes=float(os.environ.get('SEARCH_CACHE_NEGATIVE_TTL_MINUTES', '60')))
+# Refreshed in the background once this share of the TTL has elapsed
+REFRESH_AFTER_FRACTION = 0.8
+# A worker that claimed a refresh and died: another may retry after this
+REFRESH_LEASE = timedelta(minutes=5)
+
+cache_lookups = metrics.counter("document_search_cache_lookups_total", "Search cache lookups by result (hit, negative_hit, miss, error)")
+cache_refreshes = metrics.counter("document_search_cache_refreshes_total", "Background refreshes of search cache entries by outcome")
+register_cache_ratio("document_search", "document_search_cache_lookups_total", "document_search_cache_lookups_total",
+                     hits_where={"result": ("hit", "negative_hit")}, misses_where={"result": ("miss",)})
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # pymongo returns naive UTC datetimes unless the client is tz_aware
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def search_cache_key(doc_type: str, elements_requis: Optional[List[str]], langue: str) -> str:
+    elements = ",".join(sorted({str(element).strip().lower() for element in elements_requis or [] if element}))
+    return f"{doc_type}|{elements}|{langue}"
+
+
+class SearchCache:
+    """document_search_cache collection: {_id: key, results, negative, expires_at, refresh_after}"""
+
+    def __init__(self, db, ttl: timedelta = SEARCH_CACHE_TTL, negative_ttl: timedelta = SEARCH_CACHE_NEGATIVE_TTL):
+        self.collection = db.document_search_cache if db is not None else None
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Live entry for a key, or None (the TTL index only sweeps once a minute)"""
+        try:
+            entry = await self.collection.find_one({"_id": key, "expires_at": {"$gt": _now()}})
+        except Exception as e:
+            cache_lookups.inc(result="error")
+            logger.warning(f"Search cache unavailable: {e}", module_name="search_cache", func_name="get")
+            return None
+        if entry is None:
+            cache_lookups.inc(result="miss")
+            return None
+        cache_lookups.inc(result="negative_hit" if entry.get("negative") else "hit")
+        return entry
+
+    async def put(self, key: str, results: List[Dict[str, Any]]):
+        """Store a search outcome; no candidates means a negative entry with the short TTL"""
+        now = _now()
+        negative = not results
+        ttl = self.negative_ttl if negative else self.ttl
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {
+                    "results": results,
+                    "negative": negative,
+                    "created_at": now,
+                    "expires_at": now + ttl,
+                    "refresh_after": now + ttl * REFRESH_AFTER_FRACTION
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Search cache write failed: {e}", module_name="search_cache", func_name="put")
+
+    async def claim_refresh(self, entry: Dict[str, Any]) -> bool:
+        """True for the one worker that gets to refresh an entry close to expiry"""
+        now = _now()
+        if _as_utc(entry["refresh_after"]) > now:
+            return False
+        try:
+            claimed = await self.collection.find_one_and_update(
+                {"_id": entry["_id"], "refresh_after": {"$lte": now}},
+                {"$set": {"refresh_after": now + REFRESH_LEASE}},
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception:
+            return False
+        return claimed is not None
+
+    async def lookup(self, key: str, search: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """Cached candidates for a key, searching (and caching the outcome) on a miss"""
+        entry = await self.get(key)
+        if entry is not None:
+            if key not in self._refreshing and await self.claim_refresh(entry):
+                task = asyncio.create_task(self._refresh(key, search))
+                self._refreshing[key] = task
+                task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+            return entry.get("results") or []
+
+        results = await search()
+        await self.put(key, results)
+        return results
+
+    async def _refresh(self, key: str, search: Callable[[], Awaitable[List[Dict[str, Any]]]]):
+        try:
+            results = await search()
+        except Exception as e:
+            cache_refreshes.inc(outcome="failed")
+            logger.warning(f"Search cache refresh failed for {key}: {e}", module_name="search_cache", func_name="refresh")
+            return
+        # A failed refresh of a positive entry keeps serving it until it expires
+        if results or (await self.collection.find_one({"_id": key, "negative": True})) is not None:
+            await self.put(key, results)
+        cache_refreshes.inc(outcome="refreshed" if results else "empty")
@@ -10,14 +10,17 @@ from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict
 import uuid
+import asyncio
+import hmac
+import time
 from datetime import datetime, timezone, timedelta
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 import json
 import re
-import tempfile
+import io
+import zipfile
 import weasyprint
-from jinja2 import Template
 from latex_to_svg import latex_renderer
 from geometry_renderer import geometry_renderer
 from render_schema import schema_renderer
@@ -44,21 +47,37 @@ from curriculum_complete import (
     log_feature_flag_access,
     process_math_content_for_pdf
 )
-from document_search import search_educational_document
+from document_search import document_searcher, search_educational_document
+from request_context import get_request_context
+from asset_store import asset_store
+from document_listing import DEFAULT_PAGE_SIZE, parse_fields, clamp_limit, build_listing_pipeline, paginate
+from retention import DocumentArchiver
+from metrics import metrics
+from mongo_monitoring import create_instrumentation
+from template_env import template_registry
+from map_mirror import map_mirror
+from pdf_renderer import render_pool
+from render_pipeline import DocumentRenderPipeline, render_fragment, run_prepare
+from pdf_cache import SpeculativeRenderer, html_cache_key, pdf_cache
+from keyword_classifier import GEOMETRY_KEYWORDS, MATH_CHAPTER_TYPES, MATH_CONTENT_TYPES, classify_chapter
+from search_cache import SEARCH_CACHE_ENABLED, SearchCache
+from export_jobs import ExportJobStore, ExportJobWorker, JobProgress, JOB_DONE
+from job_results import job_result_store
+from export_response import export_response, stream_response, run_spool_janitor
+from metrics_export import CONTENT_TYPE as METRICS_CONTENT_TYPE, generate_latest, monitor_event_loop_lag
+from tracing import TracingMiddleware, tracer
+from response_encoding import CompressionMiddleware, OrjsonResponse
+from profiler import ProfilingMiddleware, request_profiler
+from bulk_export import BulkExporter, MAX_BULK_DOCUMENTS, build_owner_query, order_by_ids, bulk_base_name
 
 ROOT_DIR = Path(__file__).parent
 TEMPLATES_DIR = ROOT_DIR / 'templates'
 load_dotenv(ROOT_DIR / '.env')
 
 # Template loading function
-def load_template(template_name: str) -> str:
-    """Load HTML template from templates directory"""
-    template_path = TEMPLATES_DIR / f"{template_name}.html"
-    if not template_path.exists():
-        raise FileNotFoundError(f"Template {template_name}.html not found in {TEMPLATES_DIR}")
-    
-    with open(template_path, 'r', encoding='utf-8') as f:
-        return f.read()
+def load_template(template_name: str):
+    """Return the compiled template from the process-wide Jinja2 environment"""
+    return template_registry.get_template(template_name)
 
 # Icon mapping for exercises - Professional cascading logic
 EXERCISE_ICON_MAPPING = {
@@ -154,64 +173,10 @@ def enrich_exercise_with_icon(exercise_data: dict, chapitre: str, matiere: str =
     logger = get_logger()
     
     # Priority 1: Matiere-specific logic FIRST
-    if matiere == "Physique-Chimie":
-        logger.info(f"🧪 Enriching Physique-Chimie exercise for chapter: {chapitre}")
-        if any(word in chapitre.lower() for word in ["matière", "transformation", "constitution", "chimie"]):
-            exercise_data["type"] = "chemistry"
-            exercise_data["icone"] = "flask"
-        elif any(word in chapitre.lower() for word in ["énergie", "conversion", "transfert"]):
-            exercise_data["type"] = "energy"  
-            exercise_data["icone"] = "battery"
-        elif any(word in chapitre.lower() for word in ["mouvement", "interaction", "force"]):
-            exercise_data["type"] = "physics"
-            exercise_data["icone"] = "zap"
-        elif any(word in chapitre.lower() for word in ["signal", "onde", "communiquer"]):
-            exercise_data["type"] = "waves"
-            exercise_data["icone"] = "radio"
-        else:
-            exercise_data["type"] = "experimental"
-            exercise_data["icone"] = "atom"
-        logger.info(f"🧪 Assigned type: {exercise_data['type']}, icon: {exercise_data['icone']}")
-        return exercise_data
-            
-    elif matiere == "SVT":
-        logger.info(f"🌱 Enriching SVT exercise for chapter: {chapitre}")
-        if any(word in chapitre.lower() for word in ["vivant", "évolution", "génétique", "vie"]):
-            exercise_data["type"] = "biology"
-            exercise_data["icone"] = "dna"
-        elif any(word in chapitre.lower() for word in ["terre", "planète", "géologique", "enjeux"]):
-            exercise_data["type"] = "geology"
-            exercise_data["icone"] = "mountain"
-        elif any(word in chapitre.lower() for word in ["environnement", "écosystème", "action humaine"]):
-            exercise_data["type"] = "ecology"
-            exercise_data["icone"] = "globe"
-        elif any(word in chapitre.lower() for word in ["corps", "santé", "humain"]):
-            exercise_data["type"] = "health"
-            exercise_data["icone"] = "heart"
-        else:
-            exercise_data["type"] = "analysis"
-            exercise_data["icone"] = "leaf"
-        logger.info(f"🌱 Assigned type: {exercise_data['type']}, icon: {exercise_data['icone']}")
-        return exercise_data
-    
-    elif matiere == "Géographie":
-        logger.info(f"🗺️ Enriching Géographie exercise for chapter: {chapitre}")
-        if any(word in chapitre.lower() for word in ["ville", "urbain", "habitat", "loger", "bâti"]):
-            exercise_data["type"] = "urban"
-            exercise_data["icone"] = "building-2"
-        elif any(word in chapitre.lower() for word in ["population", "démographi", "mobilité", "humain"]):
-            exercise_data["type"] = "demographic"
-            exercise_data["icone"] = "users"
-        elif any(word in chapitre.lower() for word in ["monde", "mondial", "mondialisation", "planète"]):
-            exercise_data["type"] = "geographic"
-            exercise_data["icone"] = "globe"
-        elif any(word in chapitre.lower() for word in ["territoire", "espace", "lieu", "région"]):
-            exercise_data["type"] = "geographic"
-            exercise_data["icone"] = "compass"
-        else:
-            exercise_data["type"] = "cartographic"
-            exercise_data["icone"] = "map"
-        logger.info(f"🗺️ Assigned type: {exercise_data['type']}, icon: {exercise_data['icone']}")
+    chapter_type = classify_chapter(matiere, chapitre)
+    if chapter_type is not None:
+        exercise_data["type"], exercise_data["icone"] = chapter_type
+        logger.info(f"Enriched {matiere} exercise for chapter: {chapitre}, assigned type: {exercise_data['type']}, icon: {exercise_data['icone']}")
         return exercise_data
     
     # Priority 2: Use type from AI if provided and valid (existing logic for Mathématiques)
@@ -226,32 +191,14 @@ def enrich_exercise_with_icon(exercise_data: dict, chapitre: str, matiere: str =
         exercise_data["icone"] = EXERCISE_ICON_MAPPING[chapitre]
         # Infer type from chapter for Mathématiques
         if matiere == "Mathématiques":
-            if any(geo_word in chapitre.lower() for geo_word in ["géométrie", "pythagore", "thalès", "trigonométrie", "triangle", "volume"]):
-                exercise_data["type"] = "geometry"
-            elif any(alg_word in chapitre.lower() for alg_word in ["équation", "fonction", "fraction", "algèbre", "calcul"]):
-                exercise_data["type"] = "algebra"
-            elif any(stat_word in chapitre.lower() for stat_word in ["statistique", "probabilité"]):
-                exercise_data["type"] = "statistics"
-            else:
-                exercise_data["type"] = "text"
+            exercise_data["type"] = MATH_CHAPTER_TYPES.classify(chapitre, "text")
         return exercise_data
     
     # Priority 4: Content-based detection (for unknown chapters) - mainly for Mathématiques
-    enonce = exercise_data.get("enonce", "").lower()
     if matiere == "Mathématiques":
-        if any(geo_word in enonce for geo_word in ["triangle", "cercle", "carré", "rectangle", "géométrique", "angle", "côté", "volume", "aire"]):
-            exercise_data["type"] = "geometry"
-            exercise_data["icone"] = "triangle-ruler"
-        elif any(alg_word in enonce for alg_word in ["équation", "fonction", "fraction", "calcul", "nombre", "résoudre", "simplifier"]):
-            exercise_data["type"] = "algebra" 
-            exercise_data["icone"] = "calculator"
-        elif any(stat_word in enonce for stat_word in ["statistique", "moyenne", "graphique", "données", "probabilité", "hasard"]):
-            exercise_data["type"] = "statistics"
-            exercise_data["icone"] = "bar-chart"
-        else:
-            # Priority 5: Default fallback
-            exercise_data["type"] = "text"
-            exercise_data["icone"] = EXERCISE_ICON_MAPPING["default"]
+        # Priority 5: Default fallback
+        default = ("text", EXERCISE_ICON_MAPPING["default"])
+        exercise_data["type"], exercise_data["icone"] = MATH_CONTENT_TYPES.classify(exercise_data.get("enonce", ""), default)
     else:
         # For non-math subjects, use matiere fallback
         fallback_icon = EXERCISE_ICON_MAPPING.get(matiere, EXERCISE_ICON_MAPPING["default"])
@@ -325,28 +272,28 @@ def process_exercise_content(content: str) -> str:
     Processes the exercise content to render both LaTeX and geometric schemas.
     This centralizes all content processing logic for consistency.
     """
-    if not content or not isinstance(content, str):
-        return content if isinstance(content, str) else ""
-    
-    # 1. Process legacy geometric schemas (for backward compatibility)
-    try:
-        content = geometry_renderer.process_geometric_schemas_for_web(content)
-    except Exception as e:
-        logger.error(f"Error processing legacy geometric schemas: {e}")
-    
-    # 2. Process LaTeX formulas
-    try:
-        content = latex_renderer.convert_latex_to_svg(content)
-    except Exception as e:
-        logger.error(f"Error processing LaTeX: {e}")
-    
-    return content
+    return render_fragment(content, "web")
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Command monitoring: per-collection latency, slow-query log, sampled explains
+mongo_instrumentation = create_instrumentation()
+client = AsyncIOMotorClient(
+    mongo_url,
+    event_listeners=[mongo_instrumentation] if mongo_instrumentation else []
+)
 db = client[os.environ['DB_NAME']]
 
+# Retention of abandoned guest documents (archival + restore)
+document_archiver = DocumentArchiver(db)
+
+# Asynchronous export jobs (rendered by export_worker.py)
+export_job_store = ExportJobStore(db, results=job_result_store)
+
+# Geographic document searches cached in Mongo, shared by every worker
+if SEARCH_CACHE_ENABLED:
+    document_searcher.search_cache = SearchCache(db)
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -542,6 +489,34 @@ class ExportRequest(BaseModel):
     guest_id: Optional[str] = None
     template_style: Optional[str] = "classique"  # Style d'export choisi
 
+class BundleExportItem(BaseModel):
+    export_type: str  # "sujet" or "corrige"
+    template_style: Optional[str] = "classique"
+
+class BundleExportRequest(BaseModel):
+    document_id: str
+    guest_id: Optional[str] = None
+    items: List[BundleExportItem] = Field(default_factory=lambda: [
+        BundleExportItem(export_type="sujet"), BundleExportItem(export_type="corrige")
+    ])
+    format: str = "zip"  # "zip" (one PDF per item) or "pdf" (single merged PDF)
+
+class BulkExportFilter(BaseModel):
+    matiere: Optional[str] = None
+    niveau: Optional[str] = None
+    chapitre: Optional[str] = None
+    type_doc: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+class BulkExportRequest(BaseModel):
+    document_ids: Optional[List[str]] = None  # Explicit selection, kept in this order
+    filter: Optional[BulkExportFilter] = None  # Or every matching document of the user (oldest first)
+    guest_id: Optional[str] = None  # Documents created on this device before logging in
+    export_type: str = "sujet"  # "sujet" or "corrige"
+    template_style: Optional[str] = "classique"
+    format: str = "zip"  # "zip" (one PDF per document) or "pdf" (single merged PDF with bookmarks)
+
 class AdvancedPDFOptions(BaseModel):
     page_format: str = "A4"  # A4, A4_compact, US_Letter
     margin_preset: str = "standard"  # standard, compact, generous
@@ -995,6 +970,19 @@ async def require_pro_user(request: Request):
     
     return email
 
+async def require_admin(request: Request):
+    """Require the X-Admin-Key header to match ADMIN_API_KEY (admin endpoints disabled if unset)"""
+    admin_key = os.environ.get("ADMIN_API_KEY")
+    provided = request.headers.get("X-Admin-Key", "")
+    
+    if not admin_key:
+        raise HTTPException(status_code=403, detail="Administration désactivée")
+    
+    if not hmac.compare_digest(provided.encode(), admin_key.encode()):
+        raise HTTPException(status_code=401, detail="Clé d'administration invalide")
+    
+    return True
+
 # ReportLab-dependent functions commented out due to import removal
 # These functions were using ReportLab for PDF generation with personalized templates
 
@@ -1797,7 +1785,7 @@ RÉSULTAT ATTENDU CRITIQUE :
             module_name="generation",
             func_name="geography_activation",
             features_enabled=["specialized_prompts", "document_search", "cartographic_exercises"],
-            document_sources=["wikimedia_commons", "validated_cache", "fallback_system"],
+            document_sources=["geo_catalog", "wikimedia_commons", "fallback_system"],
             supported_document_types=["carte_france", "carte_monde", "carte_europe", "planisphere", "carte_thematique"]
         )
         system_msg = instruction
@@ -1922,10 +1910,13 @@ JSON OBLIGATOIRE:
         log_ai_generation("first_pass_start", True)
         
         import asyncio
-        response = await asyncio.wait_for(
-            chat.send_message(user_message), 
-            timeout=20.0  # 20 seconds max
-        )
+        first_pass_start = time.time()
+        with tracer.span("llm_first_pass", nb_exercices=nb_exercices):
+            response = await asyncio.wait_for(
+                chat.send_message(user_message), 
+                timeout=20.0  # 20 seconds max
+            )
+        log_ai_generation("first_pass_complete", True, duration_ms=int((time.time() - first_pass_start) * 1000))
         
         logger.debug(f"First AI pass completed, response length: {len(response)} chars")
         
@@ -1950,22 +1941,21 @@ JSON OBLIGATOIRE:
             # SECOND PASS: Generate geometric schema if this is a geometry exercise
             if matiere.lower() == "mathématiques":
                 # Check if the exercise might need a geometric schema
-                geometry_keywords = ["triangle", "cercle", "carré", "rectangle", "parallélogramme", 
-                                   "géométrie", "figure", "pythagore", "thalès", "trigonométrie", 
-                                   "angle", "périmètre", "aire", "longueur", "côté", "hypoténuse"]
+                detected_keywords = GEOMETRY_KEYWORDS.matches(enonce).get("geometry")
                 
-                if any(keyword in enonce.lower() for keyword in geometry_keywords):
+                if detected_keywords:
                     logger.info(
                         "Geometry keywords detected, starting schema generation",
                         module_name="generation",
                         func_name="schema_detection",
                         enonce_preview=enonce[:100],
-                        detected_keywords=[kw for kw in geometry_keywords if kw in enonce.lower()]
+                        detected_keywords=sorted(set(detected_keywords))
                     )
                     
                     # Generate schema with second AI call
                     log_ai_generation("second_pass_start", True)
-                    schema_json_str = await generate_geometry_schema_with_ai(enonce)
+                    with tracer.span("schema_pass", exercise=i + 1):
+                        schema_json_str = await generate_geometry_schema_with_ai(enonce)
                     
                     # Add schema to separate field (CLEAN DESIGN - no more JSON in text!)
                     if len(schema_json_str.strip()) > 10:  # More robust check for content
@@ -2038,7 +2028,8 @@ JSON OBLIGATOIRE:
                     document_request["enonce"] = enonce_clean  # Ajouter l'énoncé pour analyse
                     document_request["avoid_types"] = generate_exercises_with_ai.used_document_types.copy()  # Force diversification
                     
-                    document_metadata = await search_educational_document(document_request)
+                    with tracer.span("document_search", exercise=i + 1):
+                        document_metadata = await search_educational_document(document_request)
                     if document_metadata:
                         # Add document to exercise data
                         ex_data["document"] = document_metadata
@@ -2074,44 +2065,45 @@ JSON OBLIGATOIRE:
                         exercise_id=i+1
                     )
             
-            # Process the CLEANED enonce with centralized content processing
-            processed_enonce = process_exercise_content(enonce_clean)
+            with tracer.span("render", exercise=i + 1):
+                # Process the CLEANED enonce with centralized content processing
+                processed_enonce = process_exercise_content(enonce_clean)
             
-            # Process solution steps and result
-            solution = ex_data.get("solution", {"etapes": ["Étape 1", "Étape 2"], "resultat": "Résultat"})
+                # Process solution steps and result
+                solution = ex_data.get("solution", {"etapes": ["Étape 1", "Étape 2"], "resultat": "Résultat"})
             
-            # Process each solution step
-            if "etapes" in solution and isinstance(solution["etapes"], list):
-                solution["etapes"] = [
-                    process_exercise_content(step) for step in solution["etapes"]
-                ]
+                # Process each solution step
+                if "etapes" in solution and isinstance(solution["etapes"], list):
+                    solution["etapes"] = [
+                        process_exercise_content(step) for step in solution["etapes"]
+                    ]
             
-            # Process solution result
-            if "resultat" in solution:
-                solution["resultat"] = process_exercise_content(solution["resultat"])
+                # Process solution result
+                if "resultat" in solution:
+                    solution["resultat"] = process_exercise_content(solution["resultat"])
             
-            # CRITICAL FIX: Preserve geometric schema data and generate Base64 image
-            schema_data = ex_data.get("geometric_schema", None)
-            donnees_to_store = None
-            schema_img_base64 = None
+                # CRITICAL FIX: Preserve geometric schema data and generate Base64 image
+                schema_data = ex_data.get("geometric_schema", None)
+                donnees_to_store = None
+                schema_img_base64 = None
             
-            if schema_data is not None:
-                # Store schema in donnees for PDF processing
-                donnees_to_store = {"schema": schema_data}
-                logger.info(f"✅ Geometric schema data preserved in donnees field: {schema_data.get('type', 'unknown')}")
+                if schema_data is not None:
+                    # Store schema in donnees for PDF processing
+                    donnees_to_store = {"schema": schema_data}
+                    logger.info(f"✅ Geometric schema data preserved in donnees field: {schema_data.get('type', 'unknown')}")
                 
-                # CRITICAL: Generate Base64 image for frontend immediately
-                schema_img_base64 = process_schema_to_base64(schema_data)
-                if schema_img_base64:
-                    schema_img_base64 = f"data:image/png;base64,{schema_img_base64}"
-                    logger.info(
-                        "Schema Base64 generated during exercise creation",
-                        module_name="generation",
-                        func_name="create_exercise",
-                        exercise_id=i+1,
-                        schema_type=schema_data.get('type'),
-                        base64_length=len(schema_img_base64)
-                    )
+                    # CRITICAL: Generate Base64 image for frontend immediately
+                    schema_img_base64 = await run_prepare(process_schema_to_base64, schema_data)
+                    if schema_img_base64:
+                        schema_img_base64 = f"data:image/png;base64,{schema_img_base64}"
+                        logger.info(
+                            "Schema Base64 generated during exercise creation",
+                            module_name="generation",
+                            func_name="create_exercise",
+                            exercise_id=i+1,
+                            schema_type=schema_data.get('type'),
+                            base64_length=len(schema_img_base64)
+                        )
             
             exercise = Exercise(
                 type=ex_data.get("type", "ouvert"),
@@ -2454,11 +2446,11 @@ async def generate_advanced_pdf(document: dict, content: str, export_type: str,
         template_colors = get_template_colors_and_fonts(template_config)
         
         if export_type == "sujet":
-            template_content = load_template("sujet_pro")
+            template = load_template("sujet_pro")
         else:
-            template_content = load_template("corrige_pro")
+            template = load_template("corrige_pro")
         
-        html_content = Template(template_content).render(
+        html_content = template.render(
             document={
                 **document,
                 'exercices': content,
@@ -2497,7 +2489,10 @@ async def generate_advanced_pdf(document: dict, content: str, export_type: str,
         """
     
     # Generate PDF
-    pdf_bytes = weasyprint.HTML(string=html_content).write_pdf()
+    pdf_bytes = await render_pool.render(
+        html_content,
+        log_context={"doc_id": str(document.get('id', ''))[:8], "export_type": export_type, "template": "advanced"}
+    )
     return pdf_bytes
 
 # API Routes
@@ -2814,8 +2809,8 @@ async def get_usage_analytics(request: Request, days: int = 30):
         logger.error(f"Error fetching usage analytics: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération des analytics d'usage")
 
-@api_router.post("/generate")
-async def generate_document(request: GenerateRequest):
+@api_router.post("/generate", response_class=OrjsonResponse)
+async def generate_document(request: GenerateRequest, http_request: Request):
     """Generate a document with exercises - CORRECTED feature flag validation"""
     try:
         logger = get_logger()
@@ -2912,17 +2907,25 @@ async def generate_document(request: GenerateRequest):
         
         logger.info(f"🚀 Document generation started - {request.matiere} {request.niveau} {request.chapitre} - {request.type_doc} - {request.difficulte} - {request.nb_exercices} exercises - guest_id: {request.guest_id}")
         
-        exercises = await generate_exercises_with_ai(
-            request.matiere,
-            request.niveau,
-            request.chapitre,
-            request.type_doc,
-            request.difficulte,
-            request.nb_exercices
-        )
+        with tracer.span("generate", matiere=request.matiere, nb_exercices=request.nb_exercices):
+            exercises = await generate_exercises_with_ai(
+                request.matiere,
+                request.niveau,
+                request.chapitre,
+                request.type_doc,
+                request.difficulte,
+                request.nb_exercices
+            )
+        
+        # Pro documents record their owner, and this device's guest id is linked to the account
+        # (bulk export filters and retention rely on it)
+        auth = await get_request_context(db, http_request).auth()
+        if auth.is_pro and request.guest_id and request.guest_id not in (auth.user.get("guest_ids") or []):
+            await db.pro_users.update_one({"email": auth.email}, {"$addToSet": {"guest_ids": request.guest_id}})
         
         # Create document
         document = Document(
+            user_id=auth.email if auth.is_pro else None,
             guest_id=request.guest_id,
             matiere=request.matiere,
             niveau=request.niveau,
@@ -2933,14 +2936,21 @@ async def generate_document(request: GenerateRequest):
             exercises=exercises
         )
         
-        # Save to database
+        # Save to database - schema images and rendered math go to the asset store,
+        # the document only keeps /api/assets/ references
         doc_dict = document.dict()
+        doc_dict['exercises'] = [asset_store.externalize_exercise(ex) for ex in doc_dict['exercises']]
+        document = Document(**doc_dict)
         # Convert datetime for MongoDB
         doc_dict['created_at'] = doc_dict['created_at'].isoformat()
-        await db.documents.insert_one(doc_dict)
+        with tracer.span("mongo_insert", collection="documents"):
+            await db.documents.insert_one(doc_dict)
+        
+        # Opt-in: pre-render the default sujet/corrigé while the teacher reads the document
+        speculative_renderer.schedule(document.id, doc_dict)
         
         # Return the document (already processed during generation)
-        return {"document": document}
+        return OrjsonResponse({"document": document})
         
     except HTTPException:
         raise
@@ -3566,6 +3576,197 @@ async def serve_logo(filename: str):
         logger.error(f"Error serving logo {filename}: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors du chargement du logo")
 
+@api_router.get("/assets/{asset_id}")
+@api_router.head("/assets/{asset_id}")
+async def serve_asset(asset_id: str):
+    """Serve content-addressed exercise assets (schema images, rendered math)"""
+    asset_path = asset_store.path_for(asset_id)
+    if not asset_path:
+        raise HTTPException(status_code=404, detail="Ressource non trouvée")
+    
+    # Content-addressed: the URL changes whenever the content does
+    return FileResponse(
+        path=str(asset_path),
+        media_type=asset_store.content_type_for(asset_id),
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{asset_id.split(".")[0]}"'
+        }
+    )
+
+@api_router.get("/maps/{map_id}/{variant}")
+async def serve_map(map_id: str, variant: str):
+    """Serve a mirrored geographic map (print or web variant)"""
+    found = map_mirror.path_for_id(map_id, variant)
+    if not found:
+        raise HTTPException(status_code=404, detail="Carte non trouvée")
+    
+    map_path, content_type = found
+    return FileResponse(
+        path=str(map_path),
+        media_type=content_type,
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
+
+async def resolve_export_access(http_request: Request, document_id: str, guest_id: Optional[str]):
+    """
+    Resolve auth and the document for an export, enforcing the guest quota.
+    Error precedence: 400 (no guest id) / 402 (quota) before 404 (document).
+    """
+    logger = get_logger()
+    
+    # Check authentication - ONLY session token method (no legacy email fallback)
+    # Auth, Pro status, template config and the document are resolved concurrently
+    context_loader = get_request_context(db, http_request)
+    session_token = context_loader.session_token
+    
+    # Guests without a session also need their quota - fetch it in the same round trip
+    lookups = [context_loader.load(document_id)]
+    if not session_token and guest_id:
+        lookups.append(check_guest_quota(guest_id))
+    results = await asyncio.gather(*lookups)
+    auth, doc = results[0]
+    quota_status = results[1] if len(results) > 1 else None
+    
+    is_pro_user = auth.is_pro
+    user_email = auth.email
+    template_config = dict(auth.template_config) if auth.is_pro else {}
+    
+    if session_token:
+        if user_email:
+            logger.info(f"Session token validated - is_pro: {is_pro_user}, template_style: {template_config.get('template_style')}")
+        else:
+            logger.info("Session token validation failed - treating as guest")
+    else:
+        logger.info("No session token provided - treating as guest user")
+    
+    # Pro users have unlimited exports
+    if not is_pro_user:
+        # Check guest quota
+        if not guest_id:
+            raise HTTPException(status_code=400, detail="Guest ID required for non-Pro users")
+            
+        if quota_status is None:
+            quota_status = await check_guest_quota(guest_id)
+        
+        if quota_status["quota_exceeded"]:
+            raise HTTPException(status_code=402, detail={
+                "error": "quota_exceeded", 
+                "message": "Limite de 3 exports gratuits atteinte. Passez à l'abonnement Pro pour continuer.",
+                "action": "upgrade_required"
+            })
+    
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+    
+    return auth, doc
+
+def build_export_html(pipeline: DocumentRenderPipeline, document_dict: dict, export_type: str,
+                      requested_style: Optional[str], is_pro_user: bool, template_config: dict):
+    """Choose the export template for a style and render it (template stage of the pipeline)"""
+    logger = get_logger()
+    template_config = dict(template_config or {})
+    
+    # NEW TEMPLATE STYLE SYSTEM - Choose template based on requested style
+    requested_style = requested_style or "classique"
+    logger.info(f"🎨 TEMPLATE STYLE EXPORT - Requested style: {requested_style}, Pro user: {is_pro_user}")
+    
+    # Validate style permission
+    if requested_style not in EXPORT_TEMPLATE_STYLES:
+        logger.warning(f"Invalid template style: {requested_style}, falling back to classique")
+        requested_style = "classique"
+    
+    style_config = EXPORT_TEMPLATE_STYLES[requested_style]
+    
+    # Check if user has permission for this style
+    if "free" not in style_config["available_for"] and not is_pro_user:
+        logger.info(f"Style {requested_style} is Pro-only, user is not Pro. Using classique instead.")
+        requested_style = "classique"
+        style_config = EXPORT_TEMPLATE_STYLES["classique"]
+    
+    # Choose the correct template file
+    if export_type == "sujet":
+        template_name = style_config["sujet_template"]
+    else:
+        template_name = style_config["corrige_template"]
+    
+    logger.info(f"📄 Using template: {template_name} for style: {requested_style}")
+    template = load_template(template_name)
+    
+    # Prepare render context
+    render_context = {
+        'document': document_dict,
+        'date_creation': datetime.now(timezone.utc).strftime("%d/%m/%Y"),
+    }
+    
+    # Add Pro personalization if available
+    if is_pro_user and template_config:
+        render_context['template_config'] = template_config
+        render_context['school_name'] = template_config.get('school_name')
+        render_context['professor_name'] = template_config.get('professor_name')
+        render_context['school_year'] = template_config.get('school_year')
+        render_context['footer_text'] = template_config.get('footer_text')
+        render_context['logo_filename'] = template_config.get('logo_filename')
+        
+        # Convert logo URL to absolute file path for WeasyPrint
+        logo_url = template_config.get('logo_url')
+        if logo_url and logo_url.startswith('/uploads/'):
+            logo_file_path = ROOT_DIR / logo_url[1:]  # Remove leading slash
+            if logo_file_path.exists():
+                absolute_logo_url = f"file://{logo_file_path}"
+                render_context['logo_url'] = absolute_logo_url
+                template_config['logo_url'] = absolute_logo_url
+                logger.info(f"✅ Logo converted for WeasyPrint: {logo_file_path}")
+            else:
+                logger.warning(f"⚠️ Logo file not found: {logo_file_path}")
+                render_context['logo_url'] = None
+                template_config['logo_url'] = None
+        else:
+            render_context['logo_url'] = logo_url
+        
+        logger.info(f"🔍 FINAL RENDER CONTEXT FOR PRO USER:")
+        logger.info(f"   school_name: {render_context.get('school_name')}")
+        logger.info(f"   professor_name: {render_context.get('professor_name')}")
+        logger.info(f"   logo_url: {render_context.get('logo_url')}")
+    
+    # Render HTML using Jinja2 (template stage of the pipeline)
+    html_content = pipeline.render_template(template, **render_context)
+    return html_content, template_name, requested_style
+
+async def render_export_pdf(html_content: str, log_context: Optional[dict] = None) -> bytes:
+    """Render an export on the render pool, unless the same HTML was rendered already (or speculatively)"""
+    with tracer.span("pdf_render") as span:
+        key = html_cache_key(html_content)
+        cached = pdf_cache.get(key)
+        span.set("cached", cached is not None)
+        if cached is not None:
+            return cached
+        pdf_bytes = await render_pool.render(html_content, log_context=log_context)
+        pdf_cache.put(key, pdf_bytes)
+        return pdf_bytes
+
+def build_default_exports(doc: dict) -> List[tuple]:
+    """HTML of the default-style sujet and corrigé, as a guest would export them"""
+    document_id = str(doc.get("id", ""))
+    pipeline = DocumentRenderPipeline("pdf", model=Document)
+    document_dict = pipeline.prepare(doc, doc_id=document_id[:8])
+    exports = []
+    for export_type in ("sujet", "corrige"):
+        html_content, template_name, _ = build_export_html(pipeline, document_dict, export_type, "classique", False, {})
+        exports.append((html_content, {"doc_id": document_id[:8], "export_type": export_type, "template": template_name}))
+    return exports
+
+async def build_speculative_exports(doc: dict) -> List[tuple]:
+    return await run_prepare(build_default_exports, doc)
+
+speculative_renderer = SpeculativeRenderer(pdf_cache, render_pool, build_speculative_exports)
+
+# Largest sujet/corrigé bundle accepted by /export/bundle
+MAX_BUNDLE_ITEMS = 6
+
+def export_filename(document_dict: dict, export_type: str, style: str) -> str:
+    return f"LeMaitremot_{document_dict['type_doc']}_{document_dict['matiere']}_{document_dict['niveau']}_{export_type}_{style}.pdf"
+
 @api_router.post("/export")
 @log_execution_time("export_pdf")
 async def export_pdf(request: ExportRequest, http_request: Request):
@@ -3582,350 +3783,27 @@ async def export_pdf(request: ExportRequest, http_request: Request):
     )
     
     try:
-        # Check authentication - ONLY session token method (no legacy email fallback)
-        session_token = http_request.headers.get("X-Session-Token")
-        is_pro_user = False
-        user_email = None
-        template_config = {}
-        
-        # Authenticate using session token only
-        if session_token:
-            logger.info(f"Session token provided: {session_token[:20]}...")
-            email = await validate_session_token(session_token)
-            if email:
-                logger.info(f"Session token validated for email: {email}")
-                is_pro, user = await check_user_pro_status(email)
-                is_pro_user = is_pro
-                user_email = email
-                logger.info(f"Pro status check result - email: {email}, is_pro: {is_pro}")
-                
-                # Load user template configuration if Pro
-                if is_pro:
-                    logger.info(f"Loading template config for Pro user: {email}")
-                    try:
-                        template_doc = await db.user_templates.find_one({"user_email": email})
-                        logger.info(f"🔍 Raw template doc from DB: {template_doc}")
-                        if template_doc:
-                            template_config = {
-                                'template_style': template_doc.get('template_style', 'minimaliste'),
-                                'professor_name': template_doc.get('professor_name'),
-                                'school_name': template_doc.get('school_name'),
-                                'school_year': template_doc.get('school_year'),
-                                'footer_text': template_doc.get('footer_text'),
-                                'logo_url': template_doc.get('logo_url'),
-                                'logo_filename': template_doc.get('logo_filename')
-                            }
-                            logger.info(f"🔍 Processed template config for {email}: {template_config}")
-                            
-                            # Vérifier si on a des données réelles
-                            has_real_data = any([
-                                template_config.get('professor_name'),
-                                template_config.get('school_name'),
-                                template_config.get('school_year'),
-                                template_config.get('footer_text')
-                            ])
-                            logger.info(f"🔍 Template has real data: {has_real_data}")
-                        else:
-                            # Default template for Pro users
-                            template_config = {'template_style': 'minimaliste'}
-                            logger.info(f"Using default template for Pro user {email}")
-                    except Exception as e:
-                        logger.error(f"Error loading template config: {e}")
-                        template_config = {'template_style': 'minimaliste'}
-                else:
-                    logger.info(f"User {email} is not Pro - using standard PDF generation")
-            else:
-                logger.info("Session token validation failed - treating as guest")
-        else:
-            logger.info("No session token provided - treating as guest user")
-        
-        # Pro users have unlimited exports
-        if not is_pro_user:
-            # Check guest quota
-            if not request.guest_id:
-                raise HTTPException(status_code=400, detail="Guest ID required for non-Pro users")
-                
-            quota_status = await check_guest_quota(request.guest_id)
-            
-            if quota_status["quota_exceeded"]:
-                raise HTTPException(status_code=402, detail={
-                    "error": "quota_exceeded", 
-                    "message": "Limite de 3 exports gratuits atteinte. Passez à l'abonnement Pro pour continuer.",
-                    "action": "upgrade_required"
-                })
-        
-        # Find the document
-        doc = await db.documents.find_one({"id": request.document_id})
-        if not doc:
-            raise HTTPException(status_code=404, detail="Document non trouvé")
-        
-        # CRITICAL: Process geometric schemas and LaTeX before PDF generation
-        
-        if 'exercises' in doc:
-            for exercise in doc['exercises']:
-                if 'enonce' in exercise and exercise['enonce']:
-                    exercise['enonce'] = process_exercise_content(exercise['enonce'])
-                    # Convert LaTeX math to MathML for PDF rendering
-                    exercise['enonce'] = process_math_content_for_pdf(exercise['enonce'])
-                
-                # NEW: Generate SVG for schema if present in donnees
-                if exercise.get('donnees') and isinstance(exercise['donnees'], dict):
-                    schema_data = exercise['donnees'].get('schema')
-                    if schema_data:
-                        schema_type = schema_data.get('type', 'unknown')
-                        logger.info(
-                            "Generating SVG for PDF schema",
-                            module_name="export",
-                            func_name="generate_svg",
-                            doc_id=request.document_id,
-                            schema_type=schema_type
-                        )
-                        
-                        svg_content = schema_renderer.render_to_svg(schema_data)
-                        if svg_content:
-                            exercise['schema_svg'] = svg_content
-                            logger.info(
-                                "SVG generated successfully for PDF",
-                                module_name="export",
-                                func_name="generate_svg",
-                                doc_id=request.document_id,
-                                schema_type=schema_type,
-                                svg_length=len(svg_content),
-                                status="success"
-                            )
-                            log_schema_processing(schema_type, True, doc_id=request.document_id)
-                        else:
-                            logger.warning(
-                                "Failed to generate SVG for PDF schema",
-                                module_name="export",
-                                func_name="generate_svg",
-                                doc_id=request.document_id,
-                                schema_type=schema_type,
-                                status="failed"
-                            )
-                            log_schema_processing(schema_type, False, doc_id=request.document_id)
-                            exercise['schema_svg'] = ""
-                    else:
-                        exercise['schema_svg'] = ""
-                else:
-                    exercise['schema_svg'] = ""
-                
-                # NOUVEAU: Process geographic document if present
-                if exercise.get('document'):
-                    doc_data = exercise['document']
-                    logger.info(
-                        "🗺️ Processing geographic document for PDF export",
-                        module_name="export",
-                        func_name="process_geographic_document",
-                        doc_id=request.document_id,
-                        exercise_id=exercise.get('id', 'unknown'),
-                        document_title=doc_data.get('titre', 'Unknown'),
-                        document_type=doc_data.get('type', 'Unknown'),
-                        has_image=bool(doc_data.get('url_fichier_direct')),
-                        image_url=doc_data.get('url_fichier_direct', 'No URL')[:100] if doc_data.get('url_fichier_direct') else None,
-                        licence_type=doc_data.get('licence', {}).get('type', 'Unknown'),
-                        licence_attribution=doc_data.get('licence', {}).get('notice_attribution', 'No attribution')[:50] if doc_data.get('licence', {}).get('notice_attribution') else None
-                    )
-                    
-                    # Validate document data for PDF rendering
-                    if not doc_data.get('url_fichier_direct'):
-                        logger.warning(
-                            "⚠️ Geographic document missing image URL",
-                            module_name="export",
-                            func_name="document_validation",
-                            doc_id=request.document_id,
-                            document_title=doc_data.get('titre', 'Unknown')
-                        )
-                    
-                    if not doc_data.get('licence', {}).get('notice_attribution'):
-                        logger.warning(
-                            "⚠️ Geographic document missing attribution",
-                            module_name="export",
-                            func_name="document_validation",
-                            doc_id=request.document_id,
-                            document_title=doc_data.get('titre', 'Unknown')
-                        )
-                else:
-                    logger.debug(
-                        "No geographic document for exercise",
-                        module_name="export",
-                        func_name="process_geographic_document",
-                        exercise_id=exercise.get('id', 'unknown')
-                    )
-                
-                # Process solution if it exists
-                if exercise.get('solution'):
-                    if exercise['solution'].get('resultat'):
-                        exercise['solution']['resultat'] = process_exercise_content(exercise['solution']['resultat'])
-                        
-                    if exercise['solution'].get('etapes') and isinstance(exercise['solution']['etapes'], list):
-                        exercise['solution']['etapes'] = [
-                            process_exercise_content(step) for step in exercise['solution']['etapes']
-                        ]
-            
-
-        # Convert to Document object
-        if isinstance(doc.get('created_at'), str):
-            doc['created_at'] = datetime.fromisoformat(doc['created_at'])
-        document = Document(**doc)
-        
-        # NEW TEMPLATE STYLE SYSTEM - Choose template based on requested style
-        requested_style = request.template_style or "classique"
-        logger.info(f"🎨 TEMPLATE STYLE EXPORT - Requested style: {requested_style}, Pro user: {is_pro_user}")
-        
-        # Validate style permission
-        if requested_style not in EXPORT_TEMPLATE_STYLES:
-            logger.warning(f"Invalid template style: {requested_style}, falling back to classique")
-            requested_style = "classique"
-        
-        style_config = EXPORT_TEMPLATE_STYLES[requested_style]
-        
-        # Check if user has permission for this style
-        if "free" not in style_config["available_for"] and not is_pro_user:
-            logger.info(f"Style {requested_style} is Pro-only, user is not Pro. Using classique instead.")
-            requested_style = "classique"
-            style_config = EXPORT_TEMPLATE_STYLES["classique"]
-        
-        # Choose the correct template file
-        if request.export_type == "sujet":
-            template_name = style_config["sujet_template"]
-        else:
-            template_name = style_config["corrige_template"]
-        
-        logger.info(f"📄 Using template: {template_name} for style: {requested_style}")
-        template_content = load_template(template_name)
-        
-        # Prepare render context
-        render_context = {
-            'document': document,
-            'date_creation': datetime.now(timezone.utc).strftime("%d/%m/%Y"),
-        }
-        
-        # Add Pro personalization if available
-        if is_pro_user and template_config:
-            render_context['template_config'] = template_config
-            render_context['school_name'] = template_config.get('school_name')
-            render_context['professor_name'] = template_config.get('professor_name')
-            render_context['school_year'] = template_config.get('school_year')
-            render_context['footer_text'] = template_config.get('footer_text')
-            render_context['logo_filename'] = template_config.get('logo_filename')
-            
-            # Convert logo URL to absolute file path for WeasyPrint
-            logo_url = template_config.get('logo_url')
-            if logo_url and logo_url.startswith('/uploads/'):
-                logo_file_path = ROOT_DIR / logo_url[1:]  # Remove leading slash
-                if logo_file_path.exists():
-                    absolute_logo_url = f"file://{logo_file_path}"
-                    render_context['logo_url'] = absolute_logo_url
-                    template_config['logo_url'] = absolute_logo_url
-                    logger.info(f"✅ Logo converted for WeasyPrint: {logo_file_path}")
-                else:
-                    logger.warning(f"⚠️ Logo file not found: {logo_file_path}")
-                    render_context['logo_url'] = None
-                    template_config['logo_url'] = None
-            else:
-                render_context['logo_url'] = logo_url
-            
-            logger.info(f"🔍 FINAL RENDER CONTEXT FOR PRO USER:")
-            logger.info(f"   school_name: {render_context.get('school_name')}")
-            logger.info(f"   professor_name: {render_context.get('professor_name')}")
-            logger.info(f"   logo_url: {render_context.get('logo_url')}")
-       
-        # Generate filename with style suffix
-        filename = f"LeMaitremot_{document.type_doc}_{document.matiere}_{document.niveau}_{request.export_type}_{requested_style}.pdf"
-        
-        # Process LaTeX expressions in document before rendering
-        logger.info("🔬 Converting LaTeX expressions to SVG...")
-        
-        # Convert document to dict for processing (to avoid Pydantic read-only issues)
-        document_dict = document.dict()
-        
-        # Process each exercise and convert LaTeX to SVG
-        try:
-            for exercise in document_dict.get('exercises', []):
-                # Process exercise statement
-                if 'enonce' in exercise and exercise['enonce']:
-                    # First process geometric schemas, then LaTeX
-                    exercise['enonce'] = geometry_renderer.process_geometric_schemas(exercise['enonce'])
-                    exercise['enonce'] = latex_renderer.convert_latex_to_svg(exercise['enonce'])
-                
-                # Process QCM options if they exist
-                if (exercise.get('type') == 'qcm' and 
-                    exercise.get('donnees') and 
-                    exercise['donnees'].get('options')):
-                    exercise['donnees']['options'] = [
-                        latex_renderer.convert_latex_to_svg(
-                            geometry_renderer.process_geometric_schemas(option)
-                        )
-                        for option in exercise['donnees']['options']
-                    ]
-                
-                # Process solution if it exists
-                if exercise.get('solution'):
-                    # Process result
-                    if exercise['solution'].get('resultat'):
-                        processed_result = geometry_renderer.process_geometric_schemas(
-                            exercise['solution']['resultat']
-                        )
-                        exercise['solution']['resultat'] = latex_renderer.convert_latex_to_svg(
-                            processed_result
-                        )
-                    # Process steps
-                    if exercise['solution'].get('etapes') and isinstance(exercise['solution']['etapes'], list):
-                        exercise['solution']['etapes'] = [
-                            latex_renderer.convert_latex_to_svg(
-                                geometry_renderer.process_geometric_schemas(step)
-                            )
-                            for step in exercise['solution']['etapes']
-                        ]
-        
-        except Exception as e:
-            logger.error(f"Error during LaTeX to SVG conversion: {e}")
-            # Continue with original document if conversion fails
-            document_dict = document.dict()
-        
-        # Update render context with processed document
-        render_context['document'] = document_dict
-        
-        # Generate SVG schemas for each exercise (before template render)
-        exercises = document_dict.get('exercises', [])
-        for i, exercise in enumerate(exercises, start=1):
-            schema_data = None
-            
-            # Check for schema in donnees
-            if exercise.get('donnees') and isinstance(exercise.get('donnees'), dict):
-                schema_data = exercise.get('donnees').get('schema')
+        # Auth, Pro status, template config, quota and document in one round trip
+        auth, doc = await resolve_export_access(http_request, request.document_id, request.guest_id)
+        is_pro_user = auth.is_pro
+        user_email = auth.email
+        template_config = dict(auth.template_config) if auth.is_pro else {}
+        
+        # Single pass: normalize -> math -> schemas -> documents (memoized per exercise)
+        with tracer.span("render", export_type=request.export_type):
+            pipeline = DocumentRenderPipeline("pdf", model=Document)
+            document_dict = await pipeline.prepare_async(doc, doc_id=request.document_id[:8])
             
-            if schema_data:
-                try:
-                    svg_content = schema_renderer.render_to_svg(schema_data)
-                    if svg_content:
-                        exercise['schema_svg'] = svg_content
-                        logger.info(f"[EXPORT][PDF] Generated SVG for Exercice {i} - schema_svg length = {len(svg_content)}")
-                    else:
-                        logger.warning(f"[EXPORT][PDF] Failed to render schema for Exercice {i}")
-                except Exception as e:
-                    logger.error(f"[EXPORT][PDF] Error rendering schema for Exercice {i}: {e}")
-        
-        # Log schema_svg presence for debugging
-        for i, ex in enumerate(exercises, start=1):
-            schema_svg_length = len(ex.get('schema_svg', ''))
-            logger.info(f"[EXPORT][PDF] Exercice {i} - schema_svg length = {schema_svg_length}")
-        
-        # Render HTML using Jinja2
-        logger.info("🔧 Generating PDF with WeasyPrint...")
-        template = Template(template_content)
-        html_content = template.render(**render_context)
-        
-        logger.info("✅ Mathematical expressions converted to SVG")
-        
-        # Generate PDF with WeasyPrint
-        pdf_bytes = weasyprint.HTML(string=html_content).write_pdf()
+            html_content, template_name, requested_style = build_export_html(
+                pipeline, document_dict, request.export_type, request.template_style, is_pro_user, template_config
+            )
+        filename = export_filename(document_dict, request.export_type, requested_style)
         
-        # Create temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_file.write(pdf_bytes)
-        temp_file.close()
+        # Generate PDF with WeasyPrint on the render pool (cached resources, shared fonts and CSS)
+        pdf_bytes = await render_export_pdf(
+            html_content,
+            log_context={"doc_id": request.document_id[:8], "export_type": request.export_type, "template": template_name}
+        )
         
         # Track export for guest quota (only for non-Pro users)
         if not is_pro_user and request.guest_id:
@@ -3943,11 +3821,8 @@ async def export_pdf(request: ExportRequest, http_request: Request):
         
         logger.info(f"✅ PDF generated successfully: {filename}")
         
-        return FileResponse(
-            temp_file.name,
-            media_type='application/pdf',
-            filename=filename
-        )
+        # Sent from memory (spooled only above EXPORT_MEMORY_LIMIT_MB, removed once sent)
+        return export_response(pdf_bytes, 'application/pdf', filename)
         
     except HTTPException:
         raise
@@ -3961,67 +3836,357 @@ async def export_pdf(request: ExportRequest, http_request: Request):
         logger.error(f"Error exporting PDF: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de l'export PDF")
 
+def validate_bundle_request(request: BundleExportRequest):
+    if request.format not in ("zip", "pdf"):
+        raise HTTPException(status_code=400, detail="Format invalide (zip ou pdf)")
+    if not 1 <= len(request.items) <= MAX_BUNDLE_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Entre 1 et {MAX_BUNDLE_ITEMS} exports par lot")
+    if any(item.export_type not in ("sujet", "corrige") for item in request.items):
+        raise HTTPException(status_code=400, detail="Type d'export invalide (sujet ou corrige)")
+
+async def render_export_payload(doc: dict, document_id: str, items: List[dict], export_format: str,
+                                is_pro_user: bool, template_config: dict,
+                                progress: Optional[JobProgress] = None) -> dict:
+    """
+    Prepare a document once and render one or several exports of it.
+    Returns {"payload", "media_type", "filename"}: a PDF (single or merged) or a ZIP of PDFs.
+    """
+    # Shared preprocessing: every item renders from the same prepared document
+    pipeline = DocumentRenderPipeline("pdf", model=Document, progress=progress.update if progress else None)
+    # Off the event loop: export workers keep publishing progress meanwhile
+    document_dict = await pipeline.prepare_async(doc, doc_id=document_id[:8])
+    
+    rendered = []
+    for index, item in enumerate(items, start=1):
+        html_content, template_name, style = build_export_html(
+            pipeline, document_dict, item["export_type"], item.get("template_style"), is_pro_user, template_config
+        )
+        rendered.append((export_filename(document_dict, item["export_type"], style), template_name, html_content))
+        if progress:
+            progress.update("template", index, len(items))
+    
+    log_context = {"doc_id": document_id[:8], "export_type": "bundle" if len(items) > 1 else items[0]["export_type"]}
+    base_name = f"LeMaitremot_{document_dict['type_doc']}_{document_dict['matiere']}_{document_dict['niveau']}_lot"
+    
+    if export_format == "pdf":
+        if len(rendered) == 1:
+            filename, template_name, html_content = rendered[0]
+            payload = await render_export_pdf(html_content, log_context={**log_context, "template": template_name})
+        else:
+            payload = await render_pool.render_merged([html for _, _, html in rendered], log_context=log_context)
+            filename = f"{base_name}.pdf"
+        if progress:
+            progress.update("render", 1, 1)
+            progress.item_done()
+        return {"payload": payload, "media_type": "application/pdf", "filename": filename}
+    
+    # ZIP: one layout per item, in parallel on the render pool
+    async def render_item(template_name: str, html_content: str) -> bytes:
+        pdf_bytes = await render_export_pdf(html_content, log_context={**log_context, "template": template_name})
+        if progress:
+            progress.item_done()
+            progress.update("render", progress.items["done"], len(items))
+        return pdf_bytes
+    
+    pdfs = await asyncio.gather(*(render_item(template_name, html) for _, template_name, html in rendered))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        used_names = set()
+        for (name, _, _), pdf_bytes in zip(rendered, pdfs):
+            # Same type and style twice would collide in the archive
+            unique_name, counter = name, 2
+            while unique_name in used_names:
+                unique_name = name.replace('.pdf', f'_{counter}.pdf')
+                counter += 1
+            used_names.add(unique_name)
+            archive.writestr(unique_name, pdf_bytes)
+    return {"payload": buffer.getvalue(), "media_type": "application/zip", "filename": f"{base_name}.zip"}
+
+async def record_guest_export(document_id: str, guest_id: str, user_email: Optional[str], items: List[dict],
+                              export_type: str) -> str:
+    """Count one export against the guest quota; returns the export record id"""
+    export_record_id = str(uuid.uuid4())
+    await db.exports.insert_one({
+        "id": export_record_id,
+        "document_id": document_id,
+        "export_type": export_type,
+        "bundle_items": items,
+        "guest_id": guest_id,
+        "user_email": user_email,
+        "is_pro": False,
+        "template_used": 'standard',
+        "created_at": datetime.now(timezone.utc)
+    })
+    return export_record_id
+
+@api_router.post("/export/bundle")
+@log_execution_time("export_bundle")
+async def export_bundle(request: BundleExportRequest, http_request: Request):
+    """Export several PDFs of one document (e.g. sujet + corrigé) as a ZIP or one merged PDF"""
+    logger = get_logger()
+    validate_bundle_request(request)
+    
+    try:
+        # Auth, quota and document once for the whole bundle
+        auth, doc = await resolve_export_access(http_request, request.document_id, request.guest_id)
+        template_config = dict(auth.template_config) if auth.is_pro else {}
+        items = [item.dict() for item in request.items]
+        
+        output = await render_export_payload(
+            doc, request.document_id, items, request.format, auth.is_pro, template_config
+        )
+        
+        # The whole bundle counts as a single export against the guest quota
+        if not auth.is_pro and request.guest_id:
+            await record_guest_export(request.document_id, request.guest_id, auth.email, items, "bundle")
+        
+        logger.info(f"✅ Export bundle generated: {output['filename']} ({len(items)} items)")
+        return export_response(output["payload"], output["media_type"], output["filename"])
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting bundle: {e}")
+        raise HTTPException(status_code=500, detail="Erreur lors de l'export groupé")
+
+async def process_export_job(job: dict, progress: JobProgress) -> dict:
+    """Render an export job (called by export workers) and store the result as an asset"""
+    # Carries the request id of the submission, so the job's logs join the request's
+    with tracer.trace("export_job", request_id=job.get("request_id"), job_id=job["id"],
+                      kind=job["request"].get("kind", "document")):
+        return await run_export_job(job, progress)
+
+async def run_export_job(job: dict, progress: JobProgress) -> dict:
+    request = job["request"]
+    auth = job["auth"]
+    if request.get("kind") == "bulk":
+        return await process_bulk_export_job(job, progress)
+    
+    doc = await db.documents.find_one({"id": request["document_id"]}, {"_id": 0})
+    if not doc:
+        raise ValueError(f"Document {request['document_id']} not found")
+    
+    output = await render_export_payload(
+        doc, request["document_id"], request["items"], request["format"],
+        auth.get("is_pro", False), auth.get("template_config") or {},
+        progress=progress
+    )
+    
+    progress.update("store", 0, 1)
+    job_result_store.put(job["id"], output["payload"])
+    progress.update("store", 1, 1)
+    return {
+        "filename": output["filename"],
+        "media_type": output["media_type"],
+        "bytes": len(output["payload"])
+    }
+
+@api_router.post("/export/jobs", status_code=202)
+async def create_export_job(request: BundleExportRequest, http_request: Request):
+    """Queue an export (one or several PDFs) rendered by a background worker"""
+    validate_bundle_request(request)
+    
+    # Auth and quota are checked at submission; the worker only renders
+    auth, _ = await resolve_export_access(http_request, request.document_id, request.guest_id)
+    items = [item.dict() for item in request.items]
+    
+    export_record_id = None
+    if not auth.is_pro and request.guest_id:
+        export_record_id = await record_guest_export(request.document_id, request.guest_id, auth.email, items, "job")
+    
+    job = await export_job_store.create_job(
+        request={"document_id": request.document_id, "items": items, "format": request.format,
+                 "guest_id": request.guest_id},
+        auth={"email": auth.email, "is_pro": auth.is_pro,
+              "template_config": dict(auth.template_config) if auth.is_pro else {}},
+        export_record_id=export_record_id
+    )
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/api/export/jobs/{job['id']}"
+    }
+
+@api_router.get("/export/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """Status and per-stage progress of an export job"""
+    job = await export_job_store.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export non trouvé")
+    return export_job_store.public_view(job, download_url=f"/api/export/jobs/{job_id}/download")
+
+@api_router.get("/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str):
+    """Download the result of a finished export job"""
+    job = await export_job_store.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export non trouvé")
+    if job["status"] != JOB_DONE:
+        raise HTTPException(status_code=409, detail="Export pas encore terminé")
+    
+    result_path = job_result_store.path_for(job["id"])
+    if not result_path:
+        raise HTTPException(status_code=410, detail="Fichier d'export expiré")
+    return FileResponse(str(result_path), media_type=job["result"]["media_type"], filename=job["result"]["filename"])
+
+def validate_bulk_request(request: BulkExportRequest):
+    if request.format not in ("zip", "pdf"):
+        raise HTTPException(status_code=400, detail="Format invalide (zip ou pdf)")
+    if request.export_type not in ("sujet", "corrige"):
+        raise HTTPException(status_code=400, detail="Type d'export invalide (sujet ou corrige)")
+    if bool(request.document_ids) == bool(request.filter):
+        raise HTTPException(status_code=400, detail="Indiquez soit une liste de documents, soit un filtre")
+    if request.document_ids and len(set(request.document_ids)) > MAX_BULK_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BULK_DOCUMENTS} documents par export groupé")
+
+async def resolve_bulk_access(http_request: Request):
+    """Bulk exports are a Pro feature (the guest quota counts documents one by one)"""
+    auth = await get_request_context(db, http_request).auth()
+    if not auth.email:
+        raise HTTPException(status_code=401, detail="Authentification requise pour les fonctionnalités Pro")
+    if not auth.is_pro:
+        raise HTTPException(status_code=403, detail="Abonnement Pro requis pour cette fonctionnalité")
+    return auth
+
+def owned_guest_ids(auth, guest_id: Optional[str]) -> List[str]:
+    """This device's guest id and the guest ids linked to the Pro account at generation"""
+    return [guest_id] + list((auth.user or {}).get("guest_ids") or [])
+
+async def resolve_bulk_documents(document_ids: Optional[List[str]], bulk_filter: Optional[dict],
+                                 user_email: Optional[str], guest_ids: Optional[List[str]]) -> List[dict]:
+    """Load the documents of a bulk export, in export order"""
+    if document_ids:
+        docs = await db.documents.find({"id": {"$in": list(set(document_ids))}}, {"_id": 0}).to_list(length=None)
+        docs, missing = order_by_ids(docs, document_ids)
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Documents non trouvés : {', '.join(missing[:10])}")
+        return docs
+    
+    query = build_owner_query(user_email, guest_ids, bulk_filter)
+    docs = await db.documents.find(query, {"_id": 0}).sort("created_at", 1).to_list(length=MAX_BULK_DOCUMENTS + 1)
+    if not docs:
+        raise HTTPException(status_code=404, detail="Aucun document ne correspond au filtre")
+    if len(docs) > MAX_BULK_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"Plus de {MAX_BULK_DOCUMENTS} documents correspondent au filtre, affinez-le")
+    return docs
+
+async def render_bulk_export(docs: List[dict], export_type: str, template_style: Optional[str], export_format: str,
+                             template_config: dict, progress: Optional[JobProgress] = None):
+    """Prepare every document with shared render work, then lay them out on the render pool"""
+    def report(stage: str, done: int, total: int):
+        if progress:
+            progress.update(stage, done, total)
+            if stage == "render":
+                progress.items["done"] = done
+    
+    def build_part(index: int, document_dict: dict):
+        html_content, template_name, style = build_export_html(
+            pipeline_for_templates, document_dict, export_type, template_style, True, template_config
+        )
+        return export_filename(document_dict, export_type, style), template_name, html_content
+    
+    # Template timings of the bulk run are kept apart from the per-document pipelines
+    pipeline_for_templates = DocumentRenderPipeline("pdf")
+    exporter = BulkExporter(render_pool)
+    parts = await exporter.prepare_parts_async(docs, export_type, build_part, model=Document, progress=report)
+    return await exporter.render(
+        parts, export_format, bulk_base_name(len(parts), export_type),
+        log_context={"export_type": export_type}, progress=report
+    )
+
+@api_router.post("/export/bulk")
+@log_execution_time("export_bulk")
+async def export_bulk(request: BulkExportRequest, http_request: Request):
+    """Export many documents (ids or filter) as a ZIP of PDFs or one merged PDF with bookmarks"""
+    logger = get_logger()
+    validate_bulk_request(request)
+    auth = await resolve_bulk_access(http_request)
+    docs = await resolve_bulk_documents(
+        request.document_ids, request.filter.dict() if request.filter else None, auth.email,
+        owned_guest_ids(auth, request.guest_id)
+    )
+    
+    try:
+        output = await render_bulk_export(
+            docs, request.export_type, request.template_style, request.format, dict(auth.template_config)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting bulk: {e}")
+        raise HTTPException(status_code=500, detail="Erreur lors de l'export groupé")
+    
+    logger.info(f"✅ Bulk export generated: {output.filename} ({len(docs)} documents)")
+    return stream_response(output.file, output.size, output.media_type, output.filename)
+
+async def process_bulk_export_job(job: dict, progress: JobProgress) -> dict:
+    """Render a queued bulk export (document ids resolved at submission)"""
+    request = job["request"]
+    docs = await resolve_bulk_documents(request["document_ids"], None, None, None)
+    output = await render_bulk_export(
+        docs, request["export_type"], request.get("template_style"), request["format"],
+        job["auth"].get("template_config") or {}, progress=progress
+    )
+    
+    progress.update("store", 0, 1)
+    try:
+        size = job_result_store.put(job["id"], output.file)
+    finally:
+        output.file.close()
+    progress.update("store", 1, 1)
+    return {"filename": output.filename, "media_type": output.media_type, "bytes": size}
+
+@api_router.post("/export/bulk/jobs", status_code=202)
+async def create_bulk_export_job(request: BulkExportRequest, http_request: Request):
+    """Queue a bulk export; progress and download through /api/export/jobs/{job_id}"""
+    validate_bulk_request(request)
+    auth = await resolve_bulk_access(http_request)
+    # The filter is resolved now: the job exports the documents that matched at submission
+    docs = await resolve_bulk_documents(
+        request.document_ids, request.filter.dict() if request.filter else None, auth.email,
+        owned_guest_ids(auth, request.guest_id)
+    )
+    
+    job = await export_job_store.create_job(
+        request={"kind": "bulk", "document_ids": [doc["id"] for doc in docs], "export_type": request.export_type,
+                 "template_style": request.template_style, "format": request.format},
+        auth={"email": auth.email, "is_pro": True, "template_config": dict(auth.template_config)}
+    )
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "documents": len(docs),
+        "status_url": f"/api/export/jobs/{job['id']}"
+    }
+
 @api_router.post("/export/advanced")
 async def export_pdf_advanced(request: EnhancedExportRequest, http_request: Request):
     """Export document as PDF with advanced layout options (Pro only)"""
     try:
         # Check authentication - Pro only feature
-        session_token = http_request.headers.get("X-Session-Token")
-        if not session_token:
+        context_loader = get_request_context(db, http_request)
+        if not context_loader.session_token:
             raise HTTPException(status_code=401, detail="Session token requis pour les options avancées")
         
-        email = await validate_session_token(session_token)
+        # Auth, Pro status, template config and document in one concurrent round trip
+        auth, document = await context_loader.load(request.document_id)
+        email = auth.email
         if not email:
             raise HTTPException(status_code=401, detail="Session token invalide")
         
-        is_pro, user = await check_user_pro_status(email)
-        if not is_pro:
+        if not auth.is_pro:
             raise HTTPException(status_code=403, detail="Fonctionnalité Pro uniquement")
         
         logger.info(f"Advanced PDF export requested by Pro user: {email}")
         
-        # Get document
-        document = await db.documents.find_one({"id": request.document_id})
         if not document:
             raise HTTPException(status_code=404, detail="Document non trouvé")
         
-        # CRITICAL: Process geometric schemas and LaTeX before PDF generation
-        if 'exercises' in document:
-            for exercise in document['exercises']:
-                if 'enonce' in exercise and exercise['enonce']:
-                    exercise['enonce'] = process_exercise_content(exercise['enonce'])
-                
-                # Process solution if it exists
-                if exercise.get('solution'):
-                    if exercise['solution'].get('resultat'):
-                        exercise['solution']['resultat'] = process_exercise_content(exercise['solution']['resultat'])
-                        # Convert LaTeX math to MathML for PDF rendering
-                        exercise['solution']['resultat'] = process_math_content_for_pdf(exercise['solution']['resultat'])
-                        
-                    if exercise['solution'].get('etapes') and isinstance(exercise['solution']['etapes'], list):
-                        processed_steps = []
-                        for step in exercise['solution']['etapes']:
-                            processed_step = process_exercise_content(step)
-                            # Convert LaTeX math to MathML for PDF rendering
-                            processed_step = process_math_content_for_pdf(processed_step)
-                            processed_steps.append(processed_step)
-                        exercise['solution']['etapes'] = processed_steps
-        
-        # Load user template configuration
-        template_config = {}
-        template_doc = await db.user_templates.find_one({"user_email": email})
-        if template_doc:
-            template_config = {
-                'template_style': template_doc.get('template_style', 'minimaliste'),
-                'professor_name': template_doc.get('professor_name'),
-                'school_name': template_doc.get('school_name'),
-                'school_year': template_doc.get('school_year'),
-                'footer_text': template_doc.get('footer_text'),
-                'logo_url': template_doc.get('logo_url'),
-                'logo_filename': template_doc.get('logo_filename')
-            }
-        else:
-            template_config = {'template_style': 'minimaliste'}
+        # Same single-pass pipeline as the standard export
+        document = await DocumentRenderPipeline("pdf").prepare_async(document, doc_id=request.document_id[:8])
+        
+        # User template configuration was loaded with the session
+        template_config = dict(auth.template_config)
         
         # Apply advanced options
         advanced_opts = request.advanced_options or AdvancedPDFOptions()
@@ -4037,11 +4202,6 @@ async def export_pdf_advanced(request: EnhancedExportRequest, http_request: Requ
             document, content, request.export_type, template_config, advanced_opts
         )
         
-        # Create temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_file.write(pdf_content)
-        temp_file.close()
-        
         # Generate filename
         filename = f"LeMaitremot_{request.export_type}_{document['matiere']}_{document['niveau']}_advanced.pdf"
         
@@ -4060,11 +4220,7 @@ async def export_pdf_advanced(request: EnhancedExportRequest, http_request: Requ
         
         logger.info(f"✅ Advanced PDF generated successfully: {filename}")
         
-        return FileResponse(
-            temp_file.name,
-            media_type='application/pdf',
-            filename=filename
-        )
+        return export_response(pdf_content, 'application/pdf', filename)
         
     except HTTPException:
         raise
@@ -4348,10 +4504,20 @@ async def get_user_status(email: str):
         logger.error(f"Error getting user status: {e}")
         return {"is_pro": False, "account_type": "guest"}
 
-@api_router.get("/documents")
+async def process_document_for_display(doc: dict) -> dict:
+    """Apply web content processing to a stored document (old and new formats alike)"""
+    # Mirrored maps are served locally (web variant), the source URL is kept for attribution
+    return await DocumentRenderPipeline("web", url_rewriter=map_mirror.web_url_for).prepare_async(doc)
+
+@api_router.get("/documents", response_class=OrjsonResponse)
 @log_execution_time("get_documents")
-async def get_documents(guest_id: str = None):
-    """Get user documents"""
+async def get_documents(guest_id: str = None, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, fields: Optional[str] = None):
+    """
+    Get user documents, newest first, with keyset pagination.
+    - cursor: opaque value returned as next_cursor by the previous page
+    - fields: "summary" for a lightweight listing (metadata + counts), or a
+      comma-separated list of top-level fields; full documents by default
+    """
     logger = get_logger()
     user_type = "guest" if guest_id else "unknown"
     
@@ -4360,60 +4526,50 @@ async def get_documents(guest_id: str = None):
         module_name="documents",
         func_name="get_documents",
         user_type=user_type,
-        guest_id=guest_id[:8] + "..." if guest_id and len(guest_id) > 8 else guest_id
+        guest_id=guest_id[:8] + "..." if guest_id and len(guest_id) > 8 else guest_id,
+        fields=fields or "full",
+        paginated=bool(cursor)
     )
     
     try:
-        if guest_id:
-            # Get documents for guest user
-            documents = await db.documents.find({"guest_id": guest_id}).sort("created_at", -1).limit(20).to_list(length=20)
-        else:
-            return {"documents": []}
+        mode, projection = parse_fields(fields)
+        page_size = clamp_limit(limit, mode)
+        pipeline = build_listing_pipeline({"guest_id": guest_id}, cursor, page_size, projection) if guest_id else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        if not pipeline:
+            return OrjsonResponse({"documents": [], "next_cursor": None})
         
-        for doc in documents:
-            if isinstance(doc.get('created_at'), str):
-                doc['created_at'] = datetime.fromisoformat(doc['created_at'])
-            
-            # Apply professional content processing to ensure consistency
-            # Process all content systematically to handle both old and new documents
-            if 'exercises' in doc:
-                for exercise in doc['exercises']:
-                    if 'enonce' in exercise and exercise['enonce']:
-                        exercise['enonce'] = process_exercise_content(exercise['enonce'])
-                    
-                    # schema_img is now generated during exercise creation, no need to process again
-                    if exercise.get('schema_img'):
-                        logger.debug(
-                            "Schema image already present from generation",
-                            module_name="documents",
-                            func_name="check_schemas",
-                            doc_id=str(doc.get('id', 'unknown'))[:8],
-                            has_schema_img=bool(exercise.get('schema_img'))
-                        )
-
-                    # Process solution if it exists
-                    if exercise.get('solution'):
-                        if exercise['solution'].get('resultat'):
-                            exercise['solution']['resultat'] = process_exercise_content(exercise['solution']['resultat'])
-                                
-                        if exercise['solution'].get('etapes') and isinstance(exercise['solution']['etapes'], list):
-                            exercise['solution']['etapes'] = [
-                                process_exercise_content(step) for step in exercise['solution']['etapes']
-                            ]
+        # Get documents for guest user
+        rows = await db.documents.aggregate(pipeline).to_list(length=page_size + 1)
+        documents, next_cursor = paginate(rows, page_size)
         
-        # Clean up MongoDB-specific fields that can't be JSON serialized
-        for doc in documents:
-            # Remove MongoDB ObjectId fields that cause serialization issues
-            if '_id' in doc:
-                del doc['_id']
+        # One render pipeline for the page (summaries have no exercises: normalize only)
+        display_pipeline = DocumentRenderPipeline("web", url_rewriter=map_mirror.web_url_for)
+        documents = await run_prepare(lambda: [display_pipeline.prepare(doc) for doc in documents])
         
         # Return raw documents to preserve dynamic fields like schema_img
         # Don't use Pydantic models here as they filter out dynamic fields
-        return {"documents": documents}
+        # (orjson, no jsonable_encoder pass: inline SVG and base64 images make these payloads large)
+        return OrjsonResponse({"documents": documents, "next_cursor": next_cursor})
         
     except Exception as e:
         logger.error(f"Error getting documents: {e}")
-        return {"documents": []}
+        return OrjsonResponse({"documents": [], "next_cursor": None})
+
+@api_router.get("/documents/{document_id}", response_class=OrjsonResponse)
+async def get_document(document_id: str):
+    """Get one document with its full content"""
+    doc = await db.documents.find_one({"id": document_id})
+    if not doc:
+        # Abandoned guest documents may have been archived - bring them back on access
+        doc = await document_archiver.restore_document(document_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+    
+    return OrjsonResponse({"document": await process_document_for_display(doc)})
 
 @api_router.post("/documents/{document_id}/vary/{exercise_index}")
 async def vary_exercise(document_id: str, exercise_index: int):
@@ -4441,12 +4597,17 @@ async def vary_exercise(document_id: str, exercise_index: int):
             # Update the specific exercise
             # Convert Exercise object to dict for MongoDB storage
             exercise_dict = exercises[0].dict() if hasattr(exercises[0], 'dict') else exercises[0]
-            doc["exercises"][exercise_index] = exercise_dict
+            exercise_dict = asset_store.externalize_exercise(exercise_dict)
+            # Only the varied exercise is rewritten, not the whole array
             await db.documents.update_one(
                 {"id": document_id},
-                {"$set": {"exercises": doc["exercises"]}}
+                {"$set": {f"exercises.{exercise_index}": exercise_dict}}
             )
             
+            # A pending speculative render of the old content is cancelled and restarted
+            doc["exercises"][exercise_index] = exercise_dict
+            speculative_renderer.schedule(document_id, doc)
+            
             # Return the exercise as dict for JSON serialization
             return {"exercise": exercise_dict}
         
@@ -4458,9 +4619,99 @@ async def vary_exercise(document_id: str, exercise_index: int):
         logger.error(f"Error varying exercise: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de la génération de la variation")
 
+@api_router.get("/admin/retention/stats")
+async def get_retention_stats(request: Request):
+    """Collection sizes and archive volume (admin only)"""
+    await require_admin(request)
+    collections = await document_archiver.refresh_collection_metrics()
+    return {
+        "policy": document_archiver.policy.__dict__,
+        "collections": collections,
+        "archived_documents": metrics.counter("retention_archived_documents_total").value(),
+        "archived_bytes": {
+            target: metrics.counter("retention_archived_bytes_total").value(target=target)
+            for target in ("collection", "jsonl")
+        }
+    }
+
+@api_router.post("/admin/retention/run")
+async def run_retention(request: Request):
+    """Run one retention pass now (admin only)"""
+    await require_admin(request)
+    return await document_archiver.run_once()
+
+@api_router.post("/admin/documents/{document_id}/restore")
+async def restore_archived_document(document_id: str, request: Request):
+    """Restore an archived document (admin only)"""
+    await require_admin(request)
+    doc = await document_archiver.restore_document(document_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document archivé non trouvé")
+    return {"restored": True, "document_id": document_id}
+
+@api_router.get("/admin/metrics")
+async def get_admin_metrics(request: Request):
+    """In-process application metrics as JSON (admin only)"""
+    await require_admin(request)
+    return {"metrics": metrics.as_dict()}
+
+@api_router.get("/metrics")
+async def get_prometheus_metrics(request: Request):
+    """Prometheus scrape endpoint (all workers when METRICS_MULTIPROC_DIR is set)"""
+    token = os.environ.get("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Jeton de métriques invalide")
+    # Reads the other workers' snapshot files: off the event loop
+    body = await asyncio.get_running_loop().run_in_executor(None, generate_latest)
+    return Response(content=body, media_type=METRICS_CONTENT_TYPE)
+
+@api_router.get("/admin/traces")
+async def get_slowest_traces(request: Request, limit: int = 20):
+    """Slowest recent request traces, slowest first (admin only)"""
+    await require_admin(request)
+    return {"enabled": tracer.enabled, "traces": [trace.summary() for trace in tracer.slowest(limit)]}
+
+@api_router.get("/admin/traces/{trace_id}")
+async def get_trace(trace_id: str, request: Request):
+    """Span tree of one kept trace, by trace id or request id (admin only)"""
+    await require_admin(request)
+    trace = tracer.get(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace non trouvée")
+    return trace.to_dict()
+
+@api_router.get("/admin/profiles")
+async def get_request_profiles(request: Request):
+    """Recently captured request profiles, newest first (admin only)"""
+    await require_admin(request)
+    return {
+        "sample_rate": request_profiler.sample_rate,
+        "threshold_ms": request_profiler.threshold_ms,
+        "profiles": request_profiler.summaries()
+    }
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_request_profile(profile_id: str, request: Request):
+    """One profile as speedscope JSON (open it in https://www.speedscope.app) (admin only)"""
+    await require_admin(request)
+    path = request_profiler.path_for(profile_id)
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profil non trouvé")
+    return FileResponse(path, media_type="application/json", filename=os.path.basename(path))
+
+@api_router.get("/admin/mongo/slow-queries")
+async def get_mongo_slow_queries(request: Request):
+    """Recent sampled slow Mongo commands with their shape (admin only)"""
+    await require_admin(request)
+    if not mongo_instrumentation:
+        return {"enabled": False, "recent_slow_queries": []}
+    return {"enabled": True, **mongo_instrumentation.summary()}
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# gzip / brotli for JSON and HTML payloads (PDFs and images are sent as they are)
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -4468,6 +4719,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilingMiddleware, profiler=request_profiler, admin_key=os.environ.get("ADMIN_API_KEY"))
+# Outermost: the trace covers CORS handling and the whole response
+app.add_middleware(TracingMiddleware, tracer=tracer)
 
 # Configure logging
 logging.basicConfig(
@@ -4476,6 +4730,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+app_background_tasks = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Compile every export template once, before the first export
+    await asyncio.get_running_loop().run_in_executor(None, template_registry.precompile)
+    
+    # Local copies of the geographic maps (offline seed directory, then optional download)
+    if os.environ.get("MAP_MIRROR_SEED_DIR"):
+        await asyncio.get_running_loop().run_in_executor(
+            None, map_mirror.seed_from_directory, os.environ["MAP_MIRROR_SEED_DIR"]
+        )
+    if os.environ.get("MAP_MIRROR_SYNC", "false").lower() == "true":
+        app_background_tasks.append(asyncio.create_task(map_mirror.sync()))
+    
+    # Single-host setups can consume export jobs in the API process itself
+    if os.environ.get("EXPORT_JOBS_INLINE_WORKER", "false").lower() == "true":
+        inline_worker = ExportJobWorker(export_job_store, process_export_job)
+        app_background_tasks.append(asyncio.create_task(inline_worker.run()))
+        logger.info("Inline export worker started")
+    # Pooled HTTP session for the Wikimedia Commons search (closed on shutdown)
+    await document_searcher.start()
+    # Removes export spool files left by crashed workers, and results of expired export jobs
+    app_background_tasks.append(asyncio.create_task(run_spool_janitor()))
+    app_background_tasks.append(asyncio.create_task(job_result_store.run_janitor()))
+    app_background_tasks.append(asyncio.create_task(monitor_event_loop_lag()))
+    if mongo_instrumentation:
+        mongo_instrumentation.start_explainer(mongo_url, os.environ['DB_NAME'])
+    if os.environ.get("RETENTION_ENABLED", "false").lower() == "true":
+        app_background_tasks.append(asyncio.create_task(document_archiver.run_periodically()))
+        logger.info("Retention background task started")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in app_background_tasks:
+        task.cancel()
+    render_pool.shutdown()
+    await document_searcher.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Template Environment - Process-wide Jinja2 environment for the export templates
+Templates are loaded through a FileSystemLoader, compiled once per process and
+cached as bytecode on disk, so an export never re-reads or re-parses its template.
+Autoreload (checking template mtimes on every lookup) is only enabled in dev.
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+from logger import get_logger
+
+logger = get_logger()
+
+ROOT_DIR = Path(__file__).parent
+TEMPLATES_DIR = ROOT_DIR / 'templates'
+
+
+def is_dev_environment() -> bool:
+    # Same switch as the logger (APP_ENV=dev)
+    return os.getenv('APP_ENV', 'prod').lower() == 'dev'
+
+
+def create_template_environment(templates_dir: Path = TEMPLATES_DIR,
+                                cache_dir: Optional[str] = None,
+                                auto_reload: Optional[bool] = None) -> Environment:
+    """
+    Build the Jinja2 environment used for every export.
+    Options match jinja2.Template defaults (no autoescape): the templates inject
+    pre-rendered HTML (math SVG, schemas) that must not be escaped.
+    """
+    if auto_reload is None:
+        auto_reload = is_dev_environment()
+
+    bytecode_cache = None
+    cache_dir = cache_dir or os.environ.get('TEMPLATE_CACHE_DIR', str(ROOT_DIR / '.jinja_cache'))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    except OSError as e:
+        logger.warning(f"Template bytecode cache disabled: {e}")
+
+    return Environment(
+        loader=FileSystemLoader(str(templates_dir), encoding='utf-8'),
+        bytecode_cache=bytecode_cache,
+        auto_reload=auto_reload,
+        # Keep every template in memory (default is 400, we have ~20)
+        cache_size=-1
+    )
+
+
+class TemplateRegistry:
+    """Compiled export templates addressed by name (without the .html suffix)"""
+
+    def __init__(self, environment: Environment):
+        self.environment = environment
+
+    def get_template(self, template_name: str) -> Template:
+        """Return the compiled template (raises jinja2.TemplateNotFound)"""
+        return self.environment.get_template(f"{template_name}.html")
+
+    def render(self, template_name: str, **context) -> str:
+        return self.get_template(template_name).render(**context)
+
+    def template_names(self) -> List[str]:
+        return sorted(name[:-len('.html')] for name in self.environment.list_templates(extensions=['html']))
+
+    def precompile(self) -> Dict[str, float]:
+        """Compile every template up front; returns compile time (ms) per template"""
+        timings = {}
+        for name in self.template_names():
+            start = time.perf_counter()
+            try:
+                self.get_template(name)
+                timings[name] = round((time.perf_counter() - start) * 1000, 2)
+            except Exception as e:
+                # A broken template must not prevent the others from being served
+                logger.error(f"Error precompiling template {name}: {e}")
+
+        logger.info(
+            "Export templates precompiled",
+            module_name="templates",
+            func_name="precompile",
+            template_count=len(timings),
+            duration_ms=round(sum(timings.values()), 2),
+            auto_reload=self.environment.auto_reload
+        )
+        return timings
+
+
+# Global instance for easy use
+template_registry = TemplateRegistry(create_template_environment())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed asset store
+"""
+
+import base64
+import tempfile
+
+from asset_store import AssetStore
+
+
+def _store():
+    return AssetStore(tempfile.mkdtemp(prefix="assets-"))
+
+
+def test_put_is_content_addressed():
+    store = _store()
+    first = store.put(b"<svg>same</svg>", "image/svg+xml")
+    second = store.put(b"<svg>same</svg>", "image/svg+xml")
+    assert first == second
+    assert first.endswith(".svg") and len(first) == 64 + 4
+    assert store.get(first) == b"<svg>same</svg>"
+    assert store.path_for("../../etc/passwd") is None
+
+
+def test_externalize_exercise_moves_heavy_fields():
+    store = _store()
+    png = b"\x89PNG" + b"0" * 2048
+    svg = '<svg xmlns="http://www.w3.org/2000/svg">' + "<path d='M 0 0 L 1 1'/>" * 50 + '</svg>'
+    exercise = {
+        "enonce": f'Calculer <span class="math-inline">{svg}</span> puis conclure.',
+        "schema_img": "data:image/png;base64," + base64.b64encode(png).decode(),
+        "solution": {"etapes": ["Étape sans formule", svg], "resultat": "42"}
+    }
+
+    store.externalize_exercise(exercise)
+
+    assert "<svg" not in exercise["enonce"]
+    assert 'src="/api/assets/' in exercise["enonce"]
+    assert exercise["schema_img"].startswith("/api/assets/")
+    assert store.get(store.asset_id_from_url(exercise["schema_img"])) == png
+    assert exercise["solution"]["etapes"][0] == "Étape sans formule"
+    assert exercise["solution"]["etapes"][1].startswith('<img class="math-asset"')
+
+
+def test_url_fetcher_serves_assets():
+    store = _store()
+    asset_id = store.put(b"<svg>x</svg>", "image/svg+xml")
+    fetched = store.url_fetcher(f"file:///api/assets/{asset_id}")
+    assert fetched["string"] == b"<svg>x</svg>"
+    assert fetched["mime_type"] == "image/svg+xml"
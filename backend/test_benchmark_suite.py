@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Tests for the benchmark suite: baseline comparison and the offline corpus
+"""
+
+from benchmarks import corpus
+from benchmarks.bench_suite import compare, measure
+
+
+def test_compare_flags_regressions_beyond_threshold_and_noise():
+    baseline = {"latex/formulas": {"median_ms": 400.0}, "template/sujet_pro/math": {"median_ms": 0.02},
+                "schema_renderer/cercle": {"median_ms": 50.0}}
+    results = {"latex/formulas": {"median_ms": 520.0}, "template/sujet_pro/math": {"median_ms": 0.04},
+               "schema_renderer/cercle": {"median_ms": 30.0}, "geometry_base64/carre": {"median_ms": 40.0}}
+
+    report = compare(results, baseline, threshold=0.25)
+
+    # 0.02 -> 0.04 ms doubles but stays under the noise floor
+    assert [entry["case"] for entry in report["regressions"]] == ["latex/formulas"]
+    assert report["regressions"][0]["ratio"] == 1.3
+    assert [entry["case"] for entry in report["improvements"]] == ["schema_renderer/cercle"]
+    assert report["new"] == ["geometry_base64/carre"]
+
+
+def test_measure_loops_fast_cases_and_corpus_is_offline():
+    calls = []
+    result = measure(lambda: calls.append(1), repeat=3)
+    assert result["loops"] > 1 and len(calls) == 1 + 3 * result["loops"]
+
+    documents = corpus.documents()
+    assert set(documents) == {"math", "geometry", "geography", "long_corrige"}
+    schema_types = {ex["donnees"]["schema"]["type"] for ex in documents["geometry"]["exercises"]}
+    assert schema_types == set(corpus.SCHEMAS)
+    for exercise in documents["geography"]["exercises"]:
+        assert exercise["document"]["url_fichier_direct"].startswith("data:image/png;base64,")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for class-set bulk exports (shared render work, bounded layout, ZIP output)
+"""
+
+import asyncio
+import io
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+from bulk_export import BulkExporter, build_owner_query, order_by_ids
+from pdf_renderer import with_part_bookmark
+
+
+class FakeRenderPool:
+    """Stands in for RenderPool: records the concurrency it is driven at"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.merged = None
+
+    async def render(self, html_content, log_context=None, **write_options):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        # Later documents finish first: the archive must still list them in order
+        await asyncio.sleep(0.01 if "doc-0" in html_content else 0)
+        self.active -= 1
+        return f"%PDF {html_content}".encode("utf-8")
+
+    async def render_merged(self, html_parts, log_context=None, bookmarks=None, **write_options):
+        self.merged = (html_parts, bookmarks)
+        return b"%PDF merged"
+
+
+def _class_set(count):
+    return [
+        {
+            "id": f"doc-{i}", "matiere": "Mathématiques", "niveau": "4e", "chapitre": "Pythagore",
+            "exercises": [{"type": "ouvert", "enonce": f"Exercice {i} : $a^2 + b^2 = c^2$",
+                           "solution": {"resultat": "$5$"}}],
+        }
+        for i in range(count)
+    ]
+
+
+def _build_part(index, document):
+    return f"{document['id']}.pdf", "sujet_classique", f"<body>{document['id']} {document['exercises'][0]['enonce']}</body>"
+
+
+def test_owner_query_and_requested_order():
+    query = build_owner_query("prof@example.org", ["guest-1", None], {"niveau": "4e", "matiere": None})
+    assert query == {"$or": [{"user_id": "prof@example.org"}, {"guest_id": "guest-1"}], "niveau": "4e"}
+    query = build_owner_query(None, ["guest-1", "guest-2", "guest-1"])
+    assert query == {"guest_id": {"$in": ["guest-1", "guest-2"]}}
+
+    docs, missing = order_by_ids([{"id": "b"}, {"id": "a"}], ["a", "b", "a", "c"])
+    assert [doc["id"] for doc in docs] == ["a", "b"]
+    assert missing == ["c"]
+
+
+def test_created_at_filter_matches_string_and_datetime_documents():
+    after = datetime(2026, 9, 1, tzinfo=timezone.utc)
+    before = datetime(2026, 10, 1, 2, 0, tzinfo=timezone(timedelta(hours=2)))
+    query = build_owner_query("prof@example.org", ["guest-1"], {"created_after": after, "created_before": before})
+    owners, created = query["$and"]
+    assert owners == {"$or": [{"user_id": "prof@example.org"}, {"guest_id": "guest-1"}]}
+
+    string_range, datetime_range = (branch["created_at"] for branch in created["$or"])
+    # /generate stores datetime.isoformat() strings, older documents a datetime
+    stored = [
+        datetime(2026, 8, 31, 23, 59, tzinfo=timezone.utc).isoformat(),
+        datetime(2026, 9, 1, tzinfo=timezone.utc).isoformat(),
+        datetime(2026, 9, 15, 12, 30, 5, 250000, tzinfo=timezone.utc).isoformat(),
+        datetime(2026, 10, 1, tzinfo=timezone.utc).isoformat(),
+    ]
+    matched = [value for value in stored if string_range["$gte"] <= value < string_range["$lt"]]
+    assert matched == stored[1:3]
+    assert datetime_range == {"$gte": after, "$lt": datetime(2026, 10, 1, tzinfo=timezone.utc)}
+
+    # Naive bounds are taken as UTC
+    query = build_owner_query(None, ["guest-1"], {"created_before": datetime(2026, 10, 1)})
+    assert query["$or"][0] == {"created_at": {"$lt": "2026-10-01T00:00:00+00:00"}}
+
+
+def test_shared_formulas_are_rendered_once_per_run():
+    exporter = BulkExporter(FakeRenderPool())
+    parts = exporter.prepare_parts(_class_set(4), "sujet", _build_part)
+
+    assert [part.label for part in parts][0] == "1. Mathématiques - 4e - Pythagore (sujet)"
+    # Every exercise differs, but "$5$" and the formula inside each enonce are shared
+    assert exporter.stats["cache_misses"] == 4 * 3
+    assert exporter.stats["fragment_hits"] == 3
+    assert all("<svg" in part.html for part in parts)
+
+
+def test_zip_is_rendered_with_bounded_concurrency_in_order():
+    pool = FakeRenderPool()
+    exporter = BulkExporter(pool, concurrency=2)
+    parts = exporter.prepare_parts(_class_set(5), "sujet", _build_part)
+
+    output = asyncio.run(exporter.render(parts, "zip", "lot"))
+    assert pool.peak == 2
+    assert output.filename == "lot.zip"
+    with zipfile.ZipFile(io.BytesIO(output.read_all())) as archive:
+        # doc-0 finishes last, its index prefix still sorts it first
+        assert archive.namelist()[-1] == "001_doc-0.pdf"
+        assert sorted(archive.namelist()) == [f"{i:03d}_doc-{i - 1}.pdf" for i in range(1, 6)]
+
+    merged = asyncio.run(exporter.render(parts, "pdf", "lot"))
+    assert merged.read_all() == b"%PDF merged"
+    assert pool.merged[1][4] == "5. Mathématiques - 4e - Pythagore (sujet)"
+
+
+def test_part_bookmark_is_inserted_after_body():
+    html = with_part_bookmark('<html><body class="page"><h1>Sujet</h1></body></html>', 'Lot "4e"')
+    assert html.startswith('<html><body class="page"><div style="bookmark-level: 1;')
+    assert "&quot;Lot \\&quot;4e\\&quot;&quot;" in html
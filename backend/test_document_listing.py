@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for keyset pagination of the documents listing
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from document_listing import (
+    SORT_FIELD, build_listing_pipeline, clamp_limit, decode_cursor, encode_cursor, paginate, parse_fields
+)
+
+
+def test_cursor_roundtrip():
+    for created_at in ["2025-10-01T08:00:00+00:00", datetime(2025, 10, 1, 8, 0)]:
+        cursor = encode_cursor(created_at, "doc-42")
+        assert decode_cursor(cursor) == (created_at, "doc-42")
+
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def _run(pipeline, docs):
+    """Just enough of the listing pipeline over in-memory documents"""
+    rows = [dict(doc) for doc in docs]
+    for stage in pipeline:
+        if "$addFields" in stage:
+            for row in rows:
+                value = row["created_at"]
+                row[SORT_FIELD] = datetime.fromisoformat(value) if isinstance(value, str) else value
+        elif "$match" in stage and "$or" in stage["$match"]:
+            after, same = stage["$match"]["$or"]
+            rows = [d for d in rows if d[SORT_FIELD] < after[SORT_FIELD]["$lt"]
+                    or (d[SORT_FIELD] == same[SORT_FIELD] and d["id"] < same["id"]["$lt"])]
+        elif "$sort" in stage:
+            assert list(stage["$sort"]) == [SORT_FIELD, "id"]
+            rows.sort(key=lambda d: (d[SORT_FIELD], d["id"]), reverse=True)
+        elif "$limit" in stage:
+            rows = rows[:stage["$limit"]]
+    return rows
+
+
+def _all_pages(docs, page_size):
+    seen, cursor = [], None
+    while True:
+        page, cursor = paginate(_run(build_listing_pipeline({}, cursor, page_size, None), docs), page_size)
+        assert all(SORT_FIELD not in d for d in page)
+        seen.extend(d["id"] for d in page)
+        if not cursor:
+            return seen
+
+
+def test_pages_follow_each_other_without_overlap():
+    # 45 documents, several sharing the same created_at
+    docs = [
+        {"id": f"doc-{i:03d}", "created_at": f"2025-10-{1 + i // 3:02d}T10:00:00+00:00"}
+        for i in range(45)
+    ]
+    ordered = sorted(docs, key=lambda d: (d["created_at"], d["id"]), reverse=True)
+    assert _all_pages(docs, 20) == [d["id"] for d in ordered]
+
+
+def test_pages_cross_string_and_datetime_created_at():
+    # /generate stores ISO strings, older documents hold datetimes: the two forms interleave
+    docs = []
+    for i in range(30):
+        created_at = datetime(2025, 10, 1 + i // 2, 10, 0, tzinfo=timezone.utc)
+        docs.append({"id": f"doc-{i:03d}", "created_at": created_at.isoformat() if i % 3 else created_at})
+    expected = [d["id"] for d in sorted(docs, key=lambda d: d["id"], reverse=True)]
+
+    assert _all_pages(docs, 7) == expected
+    # The cursor carries the normalized date, whatever the form of the last document
+    page, cursor = paginate(_run(build_listing_pipeline({}, None, 1, None), docs), 1)
+    assert isinstance(page[0]["created_at"], str) and isinstance(decode_cursor(cursor)[0], datetime)
+
+
+def test_fields_projection():
+    assert parse_fields(None) == ("full", None)
+    mode, projection = parse_fields("summary")
+    assert mode == "summary" and "exercises" not in projection
+    mode, projection = parse_fields("matiere,niveau")
+    assert mode == "summary" and projection["matiere"] == 1 and projection["id"] == 1
+    with pytest.raises(ValueError):
+        parse_fields("password")
+    assert clamp_limit(1000, "summary") == 200
+    assert clamp_limit(0, "full") == 20
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the Wikimedia Commons search against a local HTTP stand-in
+"""
+
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from document_search import DocumentSearcher
+from metrics import metrics
+
+SEARCH_HITS = ["File:Europe map.svg", "File:Europe_political_map.png", "File:Carte Europe.jpg"]
+
+
+async def _stand_in(delay: float = 0.0):
+    """Minimal api.php: list=search and batched prop=imageinfo"""
+    calls = []
+
+    async def api(request):
+        calls.append(dict(request.query))
+        await asyncio.sleep(delay)
+        if request.query.get("list") == "search":
+            return web.json_response({"query": {"search": [{"title": title} for title in SEARCH_HITS]}})
+        pages, normalized = {}, []
+        for index, title in enumerate(request.query["titles"].split("|")):
+            canonical = title.replace("_", " ")
+            if canonical != title:
+                normalized.append({"from": title, "to": canonical})
+            pages[str(index + 1)] = {"title": canonical, "imageinfo": [{
+                "url": f"https://upload.example.org/{index}.png", "width": 800 + 400 * index, "height": 600,
+                "mime": "image/svg+xml" if title.endswith(".svg") else "image/png", "size": 1000,
+                "commonsmeta": {"LicenseShortName": "CC-BY-SA-4.0"}
+            }]}
+        return web.json_response({"query": {"normalized": normalized, "pages": pages}})
+
+    app = web.Application()
+    app.router.add_get("/w/api.php", api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/w/api.php", calls
+
+
+def test_metadata_is_fetched_in_one_batched_request():
+    async def scenario():
+        runner, url, calls = await _stand_in()
+        searcher = DocumentSearcher(api_base=url)
+        try:
+            results = await searcher._search_wikimedia_commons("carte_thematique", ["relief"], "français")
+            session = searcher._session
+            await searcher._search_wikimedia_commons("carte_thematique", ["relief"], "français")
+            assert searcher._session is session  # One pooled session for every call
+        finally:
+            await searcher.close()
+            await runner.cleanup()
+        return results, calls
+
+    results, calls = asyncio.run(scenario())
+
+    assert [doc["titre"] for doc in results] == ["Europe map.svg", "Europe political map.png", "Carte Europe.jpg"]
+    assert results[1]["url_page_commons"].endswith("File:Europe_political_map.png")
+    assert results[0]["licence"]["type"] == "CC BY-SA"
+    # Two searches: one list=search and one batched imageinfo request each
+    assert len(calls) == 4
+    assert calls[1]["titles"] == "|".join(SEARCH_HITS)
+    assert metrics.histogram("document_search_stage_seconds").quantile(1.0, stage="metadata") is not None
+
+
+def test_slow_api_times_out_and_falls_back():
+    async def scenario():
+        runner, url, _ = await _stand_in(delay=1.0)
+        searcher = DocumentSearcher(api_base=url, timeout=aiohttp.ClientTimeout(total=0.2))
+        try:
+            start = asyncio.get_running_loop().time()
+            doc = await searcher.search_geographic_document({"type": "carte_thematique", "doit_afficher": ["relief"]})
+            elapsed = asyncio.get_running_loop().time() - start
+        finally:
+            await searcher.close()
+            await runner.cleanup()
+        return doc, elapsed
+
+    doc, elapsed = asyncio.run(scenario())
+    assert elapsed < 0.9
+    assert doc["titre"] == "Planisphère monde (fallback)"
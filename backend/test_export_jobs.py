@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for the export job worker (progress reporting, completion and retries)
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from export_jobs import ExportJobStore, ExportJobWorker, JOB_DONE, JOB_FAILED, JOB_QUEUED, MAX_ATTEMPTS
+from job_results import JobResultStore
+
+
+class InMemoryJobStore:
+    """Stands in for the Mongo collection: one job, recorded transitions"""
+
+    def __init__(self, job):
+        self.job = job
+        self.events = []
+
+    async def claim_next(self, worker_id):
+        if self.job["status"] != JOB_QUEUED:
+            return None
+        self.job.update(status="running", attempts=self.job["attempts"] + 1)
+        return dict(self.job)
+
+    async def heartbeat(self, job_id, worker_id, progress):
+        self.events.append(("heartbeat", progress["stage"]))
+        return True
+
+    async def complete(self, job_id, worker_id, result, progress):
+        self.job.update(status=JOB_DONE, result=result, progress=progress)
+
+    async def fail(self, job, worker_id, error):
+        self.job.update(status=JOB_QUEUED, error=error)
+        return JOB_QUEUED
+
+
+def _job():
+    return {"id": "job-1", "status": JOB_QUEUED, "attempts": 0,
+            "request": {"document_id": "doc-1", "items": [{"export_type": "sujet"}, {"export_type": "corrige"}]}}
+
+
+def test_worker_reports_progress_and_completes():
+    store = InMemoryJobStore(_job())
+
+    async def process(job, progress):
+        for index in range(1, 4):
+            progress.update("math", index, 3)
+            await asyncio.sleep(0)
+        progress.item_done()
+        progress.item_done()
+        return {"filename": "lot.zip", "media_type": "application/zip", "bytes": 10}
+
+    worker = ExportJobWorker(store, process)
+    asyncio.run(worker.run_job(asyncio.run(store.claim_next(worker.worker_id))))
+
+    assert store.job["status"] == JOB_DONE
+    assert store.job["progress"]["stages"]["math"] == {"done": 3, "total": 3}
+    assert store.job["progress"]["items"] == {"done": 2, "total": 2}
+    view = ExportJobStore.public_view(store.job, download_url="/api/export/jobs/job-1/download")
+    assert view["result"]["filename"] == "lot.zip"
+    assert "auth" not in view
+
+
+def test_failed_job_is_requeued_with_its_error():
+    store = InMemoryJobStore(_job())
+
+    async def process(job, progress):
+        raise RuntimeError("layout failed")
+
+    worker = ExportJobWorker(store, process)
+    asyncio.run(worker.run_job(asyncio.run(store.claim_next(worker.worker_id))))
+    assert store.job["status"] == JOB_QUEUED
+    assert store.job["error"] == "layout failed"
+    assert store.job["attempts"] == 1
+
+
+def test_lost_lease_stops_the_job_without_storing_it():
+    store = InMemoryJobStore(_job())
+    rendered = []
+
+    async def heartbeat(job_id, worker_id, progress):
+        return False  # another worker claimed the expired lease
+
+    async def process(job, progress):
+        await asyncio.sleep(5)
+        rendered.append(job["id"])
+        return {}
+
+    store.heartbeat = heartbeat
+    worker = ExportJobWorker(store, process)
+    asyncio.run(asyncio.wait_for(worker.run_job(asyncio.run(store.claim_next(worker.worker_id))), 2))
+    assert rendered == []
+    assert store.job["status"] == "running" and "result" not in store.job
+
+
+class SweepCollection:
+    """find_one_and_update over a list of jobs, for ExportJobStore.fail_abandoned"""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        for job in self.jobs:
+            if (job["status"] == query["status"] and job["lease_until"] < query["lease_until"]["$lt"]
+                    and job["attempts"] >= query["attempts"]["$gte"]):
+                job.update(update["$set"])
+                return dict(job)
+        return None
+
+
+class RecordingExports:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_one(self, query):
+        self.deleted.append(query["id"])
+
+
+def test_job_abandoned_on_its_last_attempt_is_failed_and_refunded():
+    expired = datetime.now(timezone.utc) - timedelta(minutes=5)
+    jobs = [
+        {"id": "last", "status": "running", "lease_until": expired, "attempts": MAX_ATTEMPTS, "export_record_id": "exp-1"},
+        {"id": "retry", "status": "running", "lease_until": expired, "attempts": 1, "export_record_id": "exp-2"},
+    ]
+    db = SimpleNamespace(export_jobs=SweepCollection(jobs), exports=RecordingExports())
+    results = JobResultStore(tempfile.mkdtemp(prefix="job-results-"))
+    results.put("last", b"%PDF-partial")
+    store = ExportJobStore(db, results=results)
+
+    assert asyncio.run(store.fail_abandoned()) == 1
+    assert jobs[0]["status"] == JOB_FAILED and jobs[0]["expires_at"] > expired
+    assert jobs[1]["status"] == "running"  # claim_next retries it
+    assert db.exports.deleted == ["exp-1"]
+    assert results.path_for("last") is None
+
+
+def test_results_are_removed_once_their_job_expires(tmp_path):
+    results = JobResultStore(str(tmp_path), ttl_seconds=7 * 24 * 3600)
+    with open(tmp_path / "source.zip", "wb") as source:
+        source.write(b"PK" * 1000)
+    with open(tmp_path / "source.zip", "rb") as source:
+        assert results.put("3f2c9a10-old", source) == 2000
+    results.put("8d41b7e2-recent", b"%PDF-1.7")
+    (tmp_path / "source.zip").unlink()
+
+    eight_days_ago = time.time() - 8 * 24 * 3600
+    os.utime(results.path_for("3f2c9a10-old"), (eight_days_ago, eight_days_ago))
+    assert results.clean_expired() == 1
+    assert results.path_for("3f2c9a10-old") is None
+    assert results.path_for("8d41b7e2-recent").read_bytes() == b"%PDF-1.7"
+    # Ids come from the job document, never a path
+    assert results.path_for("../assets") is None
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for export responses (in-memory delivery, spool cleanup, janitor)
+"""
+
+import asyncio
+import os
+import time
+
+from export_response import clean_stale_spool_files, content_disposition, export_response
+
+
+def test_small_export_is_sent_from_memory(tmp_path):
+    response = export_response(b"%PDF-1.7 small", "application/pdf", "sujet.pdf",
+                               memory_limit=1024, spool_dir=tmp_path)
+
+    assert response.body == b"%PDF-1.7 small"
+    assert response.headers["content-length"] == "14"
+    assert response.headers["content-disposition"] == 'attachment; filename="sujet.pdf"'
+    assert not list(tmp_path.iterdir())
+
+
+def test_large_export_is_spooled_then_removed(tmp_path):
+    payload = b"%PDF" + b"x" * 4096
+    response = export_response(payload, "application/pdf", "LeMaitremot_Mathématiques.pdf",
+                               memory_limit=1024, spool_dir=tmp_path)
+
+    spooled = list(tmp_path.iterdir())
+    assert len(spooled) == 1 and spooled[0].read_bytes() == payload
+    assert "filename*=utf-8''LeMaitremot_Math%C3%A9matiques.pdf" in response.headers["content-disposition"]
+
+    # Starlette runs the background task once the body has been sent
+    asyncio.run(response.background())
+    assert not list(tmp_path.iterdir())
+
+
+def test_janitor_removes_only_stale_spool_files(tmp_path):
+    stale = tmp_path / "export-stale.pdf"
+    fresh = tmp_path / "export-fresh.pdf"
+    unrelated = tmp_path / "keep.pdf"
+    for path in (stale, fresh, unrelated):
+        path.write_bytes(b"%PDF")
+    old = time.time() - 7200
+    os.utime(stale, (old, old))
+    os.utime(unrelated, (old, old))
+
+    assert clean_stale_spool_files(max_age_seconds=3600, spool_dir=tmp_path) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["export-fresh.pdf", "keep.pdf"]
+    assert content_disposition("a b.pdf") == "attachment; filename*=utf-8''a%20b.pdf"
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline geographic document catalog
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from document_search import DocumentSearcher
+from geo_catalog import GeoCatalog, geo_catalog
+
+LICENCE = {"type": "PD", "notice_attribution": "Domaine public"}
+
+
+def _doc(doc_id, doc_type, titre, url, regions=(), themes=()):
+    return {"id": doc_id, "doc_type": doc_type, "titre": titre, "url_fichier_direct": url,
+            "licence": LICENCE, "regions": list(regions), "themes": list(themes), "niveaux": ["4e"]}
+
+
+def test_shipped_catalog_loads_with_complete_licences():
+    assert geo_catalog.version == 1
+    assert {"carte_france", "carte_monde", "carte_europe", "carte_asie",
+            "carte_amerique_nord", "carte_afrique"} <= set(geo_catalog.by_type)
+    for document in geo_catalog.documents:
+        assert set(document["licence"]) >= {"type", "notice_attribution", "lien_licence"}
+        assert document["url_fichier_direct"].startswith("https://upload.wikimedia.org/")
+
+    found = geo_catalog.search("planisphere", ["océans"])
+    assert found["type"] == "carte_monde" and found["licence"]["type"] == "PD"
+    assert "regions" not in found and "id" not in found
+
+
+def test_ranking_uses_index_and_diversity():
+    catalog = GeoCatalog([
+        _doc("fr-admin", "carte_france", "France administrative", "https://maps/fr-admin.png", ["France"], ["départements"]),
+        _doc("fr-relief", "carte_france", "Relief de la France", "https://maps/fr-relief.png", ["France"], ["relief"]),
+        _doc("eu-ue", "carte_europe", "Union européenne", "https://maps/eu.png", ["Europe", "Union européenne"]),
+        _doc("eu-world", "carte_europe", "Monde centré sur l'Europe", "https://maps/world.png", ["Europe"]),
+        _doc("world", "carte_monde", "Planisphère", "https://maps/world.png", ["monde"], ["océans"]),
+    ])
+    # Type first, then elements (accent-insensitive)
+    assert catalog.search("carte_france", ["Relief"])["titre"] == "Relief de la France"
+    assert catalog.search("carte_france", ["departements"])["titre"] == "France administrative"
+    # Already used title: the other map of the same type
+    assert catalog.search("carte_france", ["relief"], avoid_titles=["Relief de la France"])["titre"] == "France administrative"
+    # Same image under another title is penalised too
+    assert catalog.search("carte_europe", avoid_titles=["Union européenne", "Planisphère"])["titre"] == "Monde centré sur l'Europe"
+    assert catalog.rank("carte_europe", avoid_titles=["Planisphère"])[0][1]["id"] == "eu-ue"
+    # Uncovered type: answered only by a region/theme match, otherwise left to remote search
+    assert catalog.search("carte_thematique", ["océans"])["titre"] == "Planisphère"
+    assert catalog.search("carte_thematique", ["climat"], niveau="4e") is None
+
+    with pytest.raises(ValueError):
+        GeoCatalog([{"id": "broken", "doc_type": "carte_monde", "titre": "Sans URL", "licence": LICENCE}])
+
+
+def test_search_uses_the_catalog_without_network(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps({"version": 7, "documents": [
+        _doc("asia", "carte_asie", "Asie orientale", "https://maps/asia.png", ["Asie", "Chine", "Japon"])
+    ]}), encoding="utf-8")
+    # Unreachable API: any remote call would fail the lookup
+    searcher = DocumentSearcher(api_base="http://127.0.0.1:9/w/api.php", catalog=GeoCatalog.load(str(path)))
+
+    doc = asyncio.run(searcher.search_geographic_document(
+        {"type": "cartographic", "enonce": "Décrivez les échanges entre la Chine et le Japon."}))
+    assert doc["titre"] == "Asie orientale"
+    assert searcher._session is None
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the single-pass keyword classifiers (document type, icons, geometry)
+"""
+
+from document_search import DOCUMENT_TYPE_CLASSIFIER, DocumentSearcher
+from keyword_classifier import GEOMETRY_KEYWORDS, MATH_CONTENT_TYPES, KeywordClassifier, classify_chapter
+
+
+def test_whole_words_plurals_prefixes_and_ranking():
+    classifier = KeywordClassifier({
+        "europe": ["ue", "union européenne", "berlin"],
+        "france": ["paris", "métropole"],
+        "demographic": ["démographi*"],
+    })
+    assert classifier.matches("Une statue dans la rue") == {}
+    assert classifier.matches("Les métropoles de l'UE") == {"france": ["métropole"], "europe": ["ue"]}
+    assert classifier.matches("L'Union européenne") == {"europe": ["union européenne"]}
+    assert classifier.matches("La transition démographique") == {"demographic": ["démographi*"]}
+    # Most hits first, ties in declaration order
+    assert classifier.rank("Paris, Berlin et l'UE") == [("europe", 2), ("france", 1)]
+    assert classifier.classify("Paris et Berlin") == "europe"
+    assert classifier.classify("Rien à signaler", default="none") == "none"
+
+
+def test_document_type_accuracy_on_sample_enonces():
+    searcher = DocumentSearcher()
+    samples = {
+        "Localisez Paris, Lyon et Marseille sur la carte des régions.": "carte_france",
+        "Présentez les pays membres de l'Union européenne et l'espace Schengen.": "carte_europe",
+        "Décrivez les flux entre la Chine, le Japon et la Corée du Sud.": "carte_asie",
+        "Comparez New York et Los Angeles, deux villes des États-Unis.": "carte_amerique_nord",
+        "Expliquez l'avancée du Sahara au Sahel, du Mali au Tchad.": "carte_afrique",
+        "Sur le planisphère, repérez l'équateur et les tropiques.": "carte_monde",
+        # Substring false positives of the old scan: "ue" in "statue", "inde" in "Grindel"
+        "Décrivez la statue de la place du quartier Grindel.": "carte_monde",
+        # Demonyms and adjectives (the old substring scan found them)
+        "Les Japonais vivent majoritairement sur le littoral.": "carte_asie",
+        "Présentez l'économie marocaine.": "carte_afrique",
+        "Décrivez la population algérienne.": "carte_afrique",
+        "Comparez les villes italiennes.": "carte_europe",
+        "Décrivez la banlieue parisienne.": "carte_france",
+        "Comment vivent les agriculteurs sénégalais ?": "carte_afrique",
+        "Quels sont les enjeux du développement régional ?": "carte_france",
+        # Several regions: the most cited wins
+        "Paris accueille des touristes venus de Chine, du Japon, d'Inde et de Corée.": "carte_asie",
+    }
+    for enonce, expected in samples.items():
+        assert searcher._analyze_content_for_document_type(enonce) == expected, enonce
+    assert DOCUMENT_TYPE_CLASSIFIER.rank("Tokyo et Osaka") == [("carte_asie", 2)]
+
+
+def test_curriculum_chapters_keep_their_icons():
+    expected = {
+        ("Physique-Chimie", "Organisation et transformations de la matière"): ("chemistry", "flask"),
+        ("Physique-Chimie", "L'énergie : conversions et transferts"): ("energy", "battery"),
+        ("Physique-Chimie", "Mouvements et interactions"): ("physics", "zap"),
+        ("Physique-Chimie", "Ondes et signaux"): ("waves", "radio"),
+        ("SVT", "La Terre, la vie et l'organisation du vivant"): ("biology", "dna"),
+        ("SVT", "La planète Terre, l'environnement et l'action humaine"): ("geology", "mountain"),
+        ("SVT", "Le corps humain et la santé"): ("health", "heart"),
+        ("Géographie", "Mieux habiter - La ville de demain"): ("urban", "building-2"),
+        ("Géographie", "Les mobilités humaines transnationales"): ("demographic", "users"),
+        ("Géographie", "Des espaces transformés par la mondialisation"): ("geographic", "globe"),
+        ("Géographie", "Découvrir le(s) lieu(x) où j'habite"): ("geographic", "compass"),
+        ("Géographie", "Satisfaire les besoins en énergie, en eau"): ("cartographic", "map"),
+    }
+    for (matiere, chapitre), icon in expected.items():
+        assert classify_chapter(matiere, chapitre) == icon, chapitre
+    assert classify_chapter("Mathématiques", "Fractions") is None
+
+
+def test_math_content_and_geometry_detection():
+    assert MATH_CONTENT_TYPES.classify("Calculer l'aire du carré ABCD de côté 4 cm.") == ("geometry", "triangle-ruler")
+    assert MATH_CONTENT_TYPES.classify("Résoudre l'équation puis simplifier.") == ("algebra", "calculator")
+    # "aire" inside "salaire" is not geometry any more
+    assert MATH_CONTENT_TYPES.classify("Quelle est la moyenne des salaires ?") == ("statistics", "bar-chart")
+    assert GEOMETRY_KEYWORDS.matches("Le triangle ABC et ses côtés")["geometry"] == ["triangle", "côté"]
+    assert GEOMETRY_KEYWORDS.matches("Un salaire nécessaire") == {}
@@ -173,6 +173,62 @@ def test_different_log_levels():
     logger.error("Error message - something failed", module_name="test", func_name="error_test")
     logger.critical("Critical message - system failure", module_name="test", func_name="critical_test")
 
+def test_queue_handler_drops_instead_of_blocking():
+    """A full log queue drops (and counts) INFO records instead of blocking the caller"""
+    import logging
+    import queue
+    from logger import DroppingQueueHandler
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    for i in range(5):
+        handler.handle(logging.LogRecord("lemaitremot", logging.INFO, __file__, 1, "record %s", (i,), None))
+
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    # The message is frozen on the request thread, formatting happens on the listener
+    assert handler.queue.get_nowait().msg == "record 0"
+
+def test_per_module_sampling():
+    """LOG_SAMPLING keeps a ratio of DEBUG/INFO per module, never warnings or errors"""
+    import logging
+    from logger import parse_sampling
+
+    assert parse_sampling("schema=0, render_pipeline=0.5,*=1,bad") == {"schema": 0.0, "render_pipeline": 0.5, "*": 1.0}
+
+    app_logger = get_logger()
+    previous = app_logger.sampling
+    app_logger.sampling = {"schema": 0.0}
+    try:
+        assert app_logger._sampled_out(logging.INFO, "schema")
+        assert not app_logger._sampled_out(logging.WARNING, "schema")
+        assert not app_logger._sampled_out(logging.INFO, "export")
+    finally:
+        app_logger.sampling = previous
+
+def test_listener_flush_writes_queued_records():
+    """The listener tracks whether it runs (AppLogger.flush relies on it) and drains the queue on stop"""
+    import logging
+    import queue
+    from logger import LogListener
+
+    class Collect(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.messages = []
+
+        def emit(self, record):
+            self.messages.append(record.getMessage())
+
+    collect = Collect()
+    log_queue = queue.Queue()
+    listener = LogListener(log_queue, collect)
+    assert not listener.started
+    listener.start()
+    log_queue.put(logging.LogRecord("lemaitremot", logging.INFO, __file__, 1, "queued", None, None))
+    listener.stop()
+    assert not listener.started
+    assert collect.messages == ["queued"]
+
 def main():
     """Run all logging tests"""
     print("🚀 Professional Logging System Test Suite")
@@ -185,6 +241,8 @@ def main():
     test_function_decorators()
     test_error_logging()
     test_different_log_levels()
+    test_queue_handler_drops_instead_of_blocking()
+    test_per_module_sampling()
     
     print("\n✅ All logging tests completed!")
     print("=" * 60)
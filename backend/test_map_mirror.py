@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for the local map mirror (offline seeding, variants, WeasyPrint fetcher)
+"""
+
+import io
+import tempfile
+from pathlib import Path
+
+from PIL import Image
+
+from map_mirror import MapMirror, referenced_map_urls, source_filename
+
+WORLD_URL = ("https://upload.wikimedia.org/wikipedia/commons/thumb/8/83/Equirectangular_projection_SW.jpg/"
+             "1200px-Equirectangular_projection_SW.jpg")
+
+
+def _seed_dir():
+    seed_dir = Path(tempfile.mkdtemp(prefix="maps-seed-"))
+    buffer = io.BytesIO()
+    Image.new("RGB", (1200, 600), (30, 90, 160)).save(buffer, format="JPEG")
+    (seed_dir / source_filename(WORLD_URL)).write_bytes(buffer.getvalue())
+    return seed_dir
+
+
+def test_referenced_urls_include_validated_and_fallback_maps():
+    urls = referenced_map_urls()
+    assert WORLD_URL in urls
+    assert any("France" in url for url in urls)
+
+
+def test_seed_builds_print_and_web_variants():
+    mirror = MapMirror(tempfile.mkdtemp(prefix="maps-"))
+    assert mirror.seed_from_directory(str(_seed_dir()), urls=[WORLD_URL]) == [WORLD_URL]
+
+    meta = mirror.metadata(WORLD_URL)
+    assert meta["variants"]["print"]["width"] == 1200
+    assert meta["variants"]["web"]["width"] == 800
+    assert meta["variants"]["web"]["height"] == 400
+    assert mirror.web_url_for(WORLD_URL).endswith(f"/api/maps/{meta['map_id']}/web")
+
+
+def test_url_fetcher_serves_mirrored_maps_offline():
+    fallback_calls = []
+    mirror = MapMirror(tempfile.mkdtemp(prefix="maps-"),
+                       fallback_fetcher=lambda url, *a, **kw: fallback_calls.append(url) or {"string": b""})
+    mirror.seed_from_directory(str(_seed_dir()), urls=[WORLD_URL])
+
+    fetched = mirror.url_fetcher(WORLD_URL)
+    assert fetched["mime_type"] == "image/jpeg"
+    assert fetched["string"][:2] == b"\xff\xd8"
+    assert fallback_calls == []
+
+    mirror.url_fetcher("https://example.org/other.png")
+    assert fallback_calls == ["https://example.org/other.png"]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus exposition and the multiprocess aggregation of metrics
+"""
+
+import os
+
+from logger import log_execution_time, log_quota_check
+from metrics import MetricsRegistry, SnapshotWriter, metrics
+from metrics_export import add_cache_ratios, collect, generate_latest, render_prometheus
+
+
+def test_histogram_is_exposed_with_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram("stage_seconds", "Stage latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, stage="layout")
+    registry.counter("exports_total", "Exports").inc(2, format='pdf "A4"')
+
+    text = render_prometheus(collect(registry, directory=None))
+
+    assert "# TYPE stage_seconds histogram" in text
+    assert 'stage_seconds_bucket{stage="layout",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="layout",le="1"} 3' in text
+    assert 'stage_seconds_bucket{stage="layout",le="+Inf"} 4' in text
+    assert 'stage_seconds_count{stage="layout"} 4' in text
+    assert 'exports_total{format="pdf \\"A4\\""} 2' in text
+
+
+def test_snapshots_of_other_processes_are_merged(tmp_path):
+    other = MetricsRegistry()
+    other.counter("renders_total").inc(3, kind="pdf")
+    other.histogram("stage_seconds", buckets=(1.0,)).observe(0.5)
+    other.gauge("queue_depth").set(7)
+    SnapshotWriter(other, str(tmp_path)).write()
+    # Snapshot files are named after the pid: this one belongs to a live process (ours is read live)
+    os.replace(tmp_path / f"{os.getpid()}.json", tmp_path / f"{os.getppid()}.json")
+    # Same content from a process that is gone: its gauges are dropped
+    (tmp_path / "999999999.json").write_text((tmp_path / f"{os.getppid()}.json").read_text())
+
+    local = MetricsRegistry()
+    local.counter("renders_total").inc(1, kind="pdf")
+    state = collect(local, directory=str(tmp_path))
+
+    assert state["renders_total"]["series"][(("kind", "pdf"),)] == 7
+    assert state["stage_seconds"]["series"][()]["count"] == 2
+    assert state["queue_depth"]["series"] == {(("pid", str(os.getppid())),): 7}
+
+
+def test_helpers_feed_metrics_and_cache_ratios():
+    @log_execution_time("metrics_probe")
+    def probe():
+        return 42
+
+    probe()
+    log_quota_check("guest", 3, 3)
+    registry = MetricsRegistry()
+    registry.counter("pdf_cache_lookups_total").inc(3, result="hit")
+    registry.counter("pdf_cache_lookups_total").inc(1, result="miss")
+
+    assert metrics.histogram("function_duration_seconds").quantile(
+        1.0, function="metrics_probe", module="test_metrics", status="success") is not None
+    assert metrics.counter("quota_checks_total").value(user_type="guest", status="exceeded") >= 1
+    ratios = add_cache_ratios(collect(registry, directory=None))["cache_hit_ratio"]["series"]
+    assert ratios == {(("cache", "pdf_export"),): 0.75}
+    assert "function_duration_seconds_bucket" in generate_latest(directory=None)
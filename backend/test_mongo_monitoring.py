@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for the Mongo command instrumentation (latency histograms, slow-query shapes)
+"""
+
+import tempfile
+from types import SimpleNamespace
+
+from metrics import metrics
+from mongo_monitoring import MongoCommandInstrumentation, command_shape, _find_stats
+
+
+def _event(command_name, request_id, command=None, reply=None, duration_ms=1.0):
+    return SimpleNamespace(command_name=command_name, request_id=request_id, connection_id=("localhost", 27017),
+                           database_name="lemaitremot", command=command or {}, reply=reply or {},
+                           duration_micros=int(duration_ms * 1000))
+
+
+def test_command_shape_hides_values():
+    command = {"find": "documents", "filter": {"guest_id": "guest-123", "created_at": {"$lt": "2026-01-01"}},
+               "sort": {"created_at": -1}, "limit": 21, "lsid": {"id": "x"}}
+    shape = command_shape(command)
+    assert shape == {"find": "<str>", "filter": {"guest_id": "<str>", "created_at": {"$lt": "<str>"}},
+                     "sort": {"created_at": -1}, "limit": 21}
+
+
+def test_listener_records_latency_and_slow_queries():
+    instrumentation = MongoCommandInstrumentation(slow_ms=50, explain_sample_rate=0,
+                                                  log_dir=tempfile.mkdtemp(prefix="mongo-logs-"))
+    histogram = metrics.histogram("mongo_command_duration_seconds")
+    before = histogram.snapshot().get((("collection", "documents"), ("operation", "find")), {"count": 0})["count"]
+
+    find = {"find": "documents", "filter": {"guest_id": "guest-1"}}
+    reply = {"cursor": {"firstBatch": [{"id": "a"}, {"id": "b"}]}}
+    instrumentation.started(_event("find", 1, command=find))
+    instrumentation.succeeded(_event("find", 1, reply=reply, duration_ms=5))
+    instrumentation.started(_event("find", 2, command=find))
+    instrumentation.succeeded(_event("find", 2, reply=reply, duration_ms=120))
+    # Commands without a collection are ignored
+    instrumentation.started(_event("ping", 3, command={"ping": 1}))
+    instrumentation.succeeded(_event("ping", 3))
+
+    after = histogram.snapshot()[(("collection", "documents"), ("operation", "find"))]["count"]
+    assert after - before == 2
+    slow = instrumentation.summary()["recent_slow_queries"]
+    assert len(slow) == 1
+    assert slow[0]["returned"] == 2
+    assert slow[0]["shape"]["filter"] == {"guest_id": "<str>"}
+
+
+def test_explain_stats_detect_collscan():
+    explain = {"queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}},
+               "executionStats": {"nReturned": 3, "totalDocsExamined": 5000}}
+    stats = {"collscan": False, "docs_examined": 0, "n_returned": 0}
+    _find_stats(explain, stats)
+    assert stats == {"collscan": True, "docs_examined": 5000, "n_returned": 3}
+
+
+def test_explainer_is_off_by_default():
+    instrumentation = MongoCommandInstrumentation(log_dir=tempfile.mkdtemp(prefix="mongo-logs-"))
+    assert instrumentation.explain_sample_rate == 0
+    assert instrumentation.explain_verbosity == "queryPlanner"
+    instrumentation.start_explainer("mongodb://localhost:1", "lemaitremot")
+    assert instrumentation._explain_thread is None
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for the export PDF cache and the speculative renderer
+"""
+
+import asyncio
+
+from pdf_cache import ORIGIN_SPECULATIVE, PDFCache, SpeculativeRenderer, html_cache_key
+
+
+class FakeRenderPool:
+    def __init__(self, busy=False):
+        self.rendered = []
+        self._busy = busy
+
+    def busy(self):
+        return self._busy
+
+    async def render(self, html_content, log_context=None, **write_options):
+        await asyncio.sleep(0)
+        self.rendered.append(html_content)
+        return f"%PDF {html_content}".encode("utf-8")
+
+
+async def _build(doc):
+    return [(f"{doc['id']} sujet v{doc['version']}", {"export_type": "sujet"}),
+            (f"{doc['id']} corrige v{doc['version']}", {"export_type": "corrige"})]
+
+
+def test_cache_tracks_speculative_hit_ratio():
+    cache = PDFCache(max_bytes=100)
+    cache.put("a", b"x" * 40, origin=ORIGIN_SPECULATIVE)
+    cache.put("b", b"y" * 40)
+
+    assert cache.get("a") == b"x" * 40
+    assert cache.get("a") == b"x" * 40  # Second hit is an ordinary one
+    assert cache.get("missing") is None
+    assert cache.stats()["speculative_hit_ratio"] == round(1 / 3, 4)
+
+    cache.put("c", b"z" * 40)  # Over 100 bytes: least recently used ("b") goes
+    assert not cache.contains("b") and cache.contains("a")
+
+
+def test_speculative_render_fills_cache_and_is_cancelled_on_vary():
+    async def scenario():
+        cache, pool = PDFCache(), FakeRenderPool()
+        renderer = SpeculativeRenderer(cache, pool, _build, enabled=True, delay=0.01)
+
+        assert renderer.schedule("doc-1", {"id": "doc-1", "version": 1})
+        # Varied before the render started: only the new version is rendered
+        assert renderer.schedule("doc-1", {"id": "doc-1", "version": 2})
+        await asyncio.sleep(0.05)
+
+        assert pool.rendered == ["doc-1 sujet v2", "doc-1 corrige v2"]
+        assert renderer.pending() == 0
+        assert cache.get(html_cache_key("doc-1 sujet v2")) == b"%PDF doc-1 sujet v2"
+        assert cache.stats()["speculative_hits"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_speculation_is_capped_and_opt_in():
+    async def scenario():
+        disabled = SpeculativeRenderer(PDFCache(), FakeRenderPool(), _build)
+        assert not disabled.schedule("doc-1", {"id": "doc-1", "version": 1})
+
+        capped = SpeculativeRenderer(PDFCache(), FakeRenderPool(), _build, enabled=True, max_pending=1, delay=0.01)
+        assert capped.schedule("doc-1", {"id": "doc-1", "version": 1})
+        assert not capped.schedule("doc-2", {"id": "doc-2", "version": 1})
+        capped.cancel("doc-1")
+
+    asyncio.run(scenario())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the caching WeasyPrint url_fetcher
+"""
+
+import os
+import tempfile
+
+from asset_store import AssetStore
+from pdf_renderer import CachingURLFetcher
+
+
+def _counting_fetcher(calls):
+    def fetch(url, *args, **kwargs):
+        calls.append(url)
+        if url.startswith("file://"):
+            with open(url[len("file://"):], "rb") as f:
+                return {"string": f.read(), "mime_type": "image/png", "redirected_url": url}
+        return {"string": url.encode("utf-8") * 10, "mime_type": "image/png", "redirected_url": url}
+    return fetch
+
+
+def test_file_resources_are_cached_until_modified():
+    calls = []
+    fetcher = CachingURLFetcher(_counting_fetcher(calls))
+    fd, path = tempfile.mkstemp(suffix=".png")
+    os.write(fd, b"logo-v1")
+    os.close(fd)
+    url = f"file://{path}"
+
+    assert fetcher(url)["string"] == b"logo-v1"
+    assert fetcher(url)["string"] == b"logo-v1"
+    assert len(calls) == 1
+
+    with open(path, "wb") as f:
+        f.write(b"logo-v2")
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000_000))
+    assert fetcher(url)["string"] == b"logo-v2"
+    assert len(calls) == 2
+    # The stale version was replaced, not kept alongside
+    assert fetcher.stats()["entries"] == 1
+
+
+def test_lru_is_bounded_by_bytes():
+    calls = []
+    fetcher = CachingURLFetcher(_counting_fetcher(calls), max_bytes=2000)
+    urls = [f"https://maps.example.org/{i:03d}.png" for i in range(10)]  # 320 bytes each
+    for url in urls:
+        fetcher(url)
+    assert fetcher.stats()["bytes"] <= 2000
+
+    fetcher(urls[-1])
+    assert calls.count(urls[-1]) == 1
+    fetcher(urls[0])
+    assert calls.count(urls[0]) == 2
+
+
+def test_data_uris_bypass_the_cache():
+    calls = []
+    fetcher = CachingURLFetcher(_counting_fetcher(calls))
+    fetcher("data:image/png;base64,AAAA")
+    fetcher("data:image/png;base64,AAAA")
+    assert len(calls) == 2
+    assert fetcher.stats()["entries"] == 0
+
+
+def test_asset_blobs_are_cached_by_content_hash(tmp_path):
+    store = AssetStore(str(tmp_path))
+    asset_id = store.put(b'<svg xmlns="http://www.w3.org/2000/svg"/>', "image/svg+xml")
+    calls = []
+
+    def fetch(url, *args, **kwargs):
+        calls.append(url)
+        return store.url_fetcher(url, *args, **kwargs)
+
+    fetcher = CachingURLFetcher(fetch)
+    # Relative /api/assets/ references resolve against base_url to a path that does not exist
+    for url in (f"file:///api/assets/{asset_id}", f"https://app.example.org/api/assets/{asset_id}",
+                f"file:///api/assets/{asset_id}"):
+        assert fetcher(url)["string"].startswith(b"<svg")
+    assert len(calls) == 1
+    assert fetcher.stats()["entries"] == 1
+
+
+def test_render_pool_runs_jobs_in_thread_mode(monkeypatch):
+    import asyncio
+    import pdf_renderer
+
+    monkeypatch.setattr(pdf_renderer.pdf_renderer, "render_pdf",
+                        lambda html, log_context=None, **options: f"pdf:{html}".encode())
+    monkeypatch.setattr(pdf_renderer.pdf_renderer, "render_merged_pdf",
+                        lambda parts, log_context=None, **options: "|".join(parts).encode())
+    pool = pdf_renderer.RenderPool(workers=0)
+
+    async def run():
+        single = await asyncio.gather(pool.render("sujet"), pool.render("corrige"))
+        merged = await pool.render_merged(["sujet", "corrige"])
+        return single, merged
+
+    single, merged = asyncio.run(run())
+    assert single == [b"pdf:sujet", b"pdf:corrige"]
+    assert merged == b"sujet|corrige"
+
+
+def test_optimizer_minifies_svg_and_shares_repeated_formulas():
+    from pdf_optimizer import minify_svg, optimize_html
+
+    formula = ('<svg xmlns="http://www.w3.org/2000/svg" width="10pt"><metadata><rdf:RDF/></metadata>'
+               '<g id="figure_1"><g id="patch_1"><path d="M 0 22.838400 \nL 44.18 -0.000001 \nz\n" '
+               'style="fill: none; opacity: 0"/></g><!-- $x^2$ --><defs><path id="DejaVuSans-78" '
+               'd="M 3513 3500 \nL 2247 1797 \nz\n"/></defs><use xlink:href="#DejaVuSans-78" '
+               'transform="translate(0 0.546875)"/></g></svg>')
+    minified = minify_svg(formula)
+    assert "metadata" not in minified and "figure_1" not in minified and "opacity: 0" not in minified
+    assert 'id="DejaVuSans-78" d="M 3513 3500 L 2247 1797 z"' in minified
+    assert len(minified) < len(formula)
+
+    html, report = optimize_html(f"<p>{formula} puis {formula}</p><div>{minified}</div>")
+    assert report["svg_fragments"] == 3 and report["svg_shared"] == 1
+    assert html.count('src="data:image/svg+xml;base64,') == 2
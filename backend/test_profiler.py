@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the sampling request profiler and its middleware
+"""
+
+import asyncio
+import json
+import time
+
+from profiler import ProfilingMiddleware, RequestProfiler
+
+
+def busy_layout(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(200))
+    return total
+
+
+def _request(profiler, headers, work_seconds=0.1):
+    async def app(scope, receive, send):
+        busy_layout(work_seconds)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "POST", "path": "/api/export", "headers": headers}
+    middleware = ProfilingMiddleware(app, profiler, admin_key="secret")
+    asyncio.run(middleware(scope, receive, send))
+
+
+def test_admin_header_captures_a_speedscope_profile(tmp_path):
+    profiler = RequestProfiler(directory=str(tmp_path), threshold_ms=10_000, interval=0.002)
+    _request(profiler, [(b"x-profile", b"1"), (b"x-admin-key", b"secret")])
+
+    [entry] = profiler.summaries()
+    assert entry["name"] == "POST /api/export" and entry["samples"] > 5
+    assert "test_profiler" in entry["packages"]
+    with open(profiler.path_for(entry["id"])) as f:
+        profile = json.load(f)
+    names = {frame["name"] for frame in profile["shared"]["frames"]}
+    assert "busy_layout" in names
+    sampled = profile["profiles"][0]
+    assert sampled["type"] == "sampled" and len(sampled["samples"]) == len(sampled["weights"])
+
+
+def test_only_slow_or_authorized_requests_are_kept(tmp_path):
+    profiler = RequestProfiler(directory=str(tmp_path), threshold_ms=10_000, interval=0.002)
+    # Wrong admin key: not profiled at all (sample rate is 0)
+    _request(profiler, [(b"x-profile", b"1"), (b"x-admin-key", b"wrong")], work_seconds=0.01)
+    assert profiler.summaries() == []
+
+    # Sampled but under the latency threshold: discarded
+    profiler.sample_rate = 1.0
+    _request(profiler, [], work_seconds=0.01)
+    assert profiler.summaries() == []
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for the single-pass document render pipeline
+"""
+
+import asyncio
+import threading
+
+from render_pipeline import DocumentRenderPipeline, StageCache, run_prepare
+
+
+def _document():
+    return {
+        "id": "doc-pipeline",
+        "created_at": "2026-01-10T09:00:00+00:00",
+        "exercises": [
+            {
+                "type": "qcm",
+                "enonce": "Calculer $\\frac{3}{4} + \\frac{1}{4}$",
+                "donnees": {"options": ["$1$", "$2$"]},
+                "solution": {"etapes": ["On additionne $\\frac{4}{4}$"], "resultat": "$1$"},
+                "document": {"titre": "Planisphère", "url_fichier_direct": "https://example.org/map.jpg",
+                             "licence": {"type": "PD", "notice_attribution": "Domaine public"}},
+            }
+        ],
+    }
+
+
+def test_web_pipeline_renders_fragments_and_rewrites_maps():
+    pipeline = DocumentRenderPipeline("web", cache=StageCache(),
+                                      url_rewriter=lambda url: "/api/maps/abc/web" if url else None)
+    doc = pipeline.prepare(_document())
+    exercise = doc["exercises"][0]
+
+    assert "<svg" in exercise["enonce"]
+    assert exercise["solution"]["resultat"].startswith("<span")
+    # QCM options are only rendered for print
+    assert exercise["donnees"]["options"] == ["$1$", "$2$"]
+    assert exercise["document"]["url_fichier_direct"] == "/api/maps/abc/web"
+    assert exercise["document"]["url_fichier_source"] == "https://example.org/map.jpg"
+    assert doc["created_at"].year == 2026
+
+
+def test_pdf_pipeline_is_memoized_per_exercise():
+    cache = StageCache()
+    first = DocumentRenderPipeline("pdf", cache=cache)
+    rendered = first.prepare(_document())
+    assert first.cache_misses == 3 and first.cache_hits == 0
+    assert all("<svg" in option for option in rendered["exercises"][0]["donnees"]["options"])
+    assert rendered["exercises"][0]["schema_svg"] == ""
+
+    second = DocumentRenderPipeline("pdf", cache=cache)
+    again = second.prepare(_document())
+    assert second.cache_hits == 3 and second.cache_misses == 0
+    assert again["exercises"] == rendered["exercises"]
+
+    # Cached results are copies: mutating one document does not leak into the next
+    again["exercises"][0]["enonce"] = "modifié"
+    assert DocumentRenderPipeline("pdf", cache=cache).prepare(_document())["exercises"][0]["enonce"] != "modifié"
+
+
+def test_async_preparation_runs_on_the_single_prepare_thread():
+    seen = []
+
+    def record(stage, done, total):
+        seen.append(threading.current_thread().name)
+
+    pipeline = DocumentRenderPipeline("pdf", cache=StageCache(), progress=record)
+
+    async def prepare_concurrently():
+        return await asyncio.gather(pipeline.prepare_async(_document()),
+                                    run_prepare(lambda: threading.current_thread().name))
+
+    doc, other = asyncio.run(prepare_concurrently())
+    assert "<svg" in doc["exercises"][0]["enonce"]
+    # matplotlib is not thread-safe: every preparation shares one thread, never the event loop's
+    assert set(seen) == {other} and other.startswith("render-prepare")
+
+
+def test_stage_cache_is_bounded_by_bytes():
+    cache = StageCache(max_bytes=100)
+    cache.put(("math", "web", "a"), "x" * 40)
+    cache.put(("math", "web", "b"), {"enonce": "y" * 30})
+    cache.get(("math", "web", "a"))
+    cache.put(("math", "web", "c"), "z" * 40)
+    # Least recently used entry goes first
+    assert cache.get(("math", "web", "b")) is None
+    assert cache.get(("math", "web", "a")) == "x" * 40
+    assert cache.current_bytes == 80 and len(cache) == 2
+    # Larger than the whole cache: not stored
+    cache.put(("math", "web", "d"), "w" * 101)
+    assert cache.get(("math", "web", "d")) is None and len(cache) == 2
+
+
+def test_web_map_urls_follow_the_mirror_state():
+    mirrored = set()
+    cache = StageCache()
+
+    def prepare():
+        pipeline = DocumentRenderPipeline("web", cache=cache,
+                                          url_rewriter=lambda url: "/api/maps/abc/web" if url in mirrored else None)
+        return pipeline.prepare(_document())["exercises"][0]["document"]["url_fichier_direct"]
+
+    assert prepare() == "https://example.org/map.jpg"
+    # Synced afterwards: the next display serves the local copy despite the memo
+    mirrored.add("https://example.org/map.jpg")
+    assert prepare() == "/api/maps/abc/web"
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for the memoized export request context (auth, Pro status, document)
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from request_context import RequestContextLoader
+
+
+class Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length=None):
+        return self.rows[:length]
+
+
+class Sessions:
+    def __init__(self, rows, fail_writes=False):
+        self.rows = rows
+        self.fail_writes = fail_writes
+        self.aggregations = 0
+        self.deleted = []
+        self.touched = []
+
+    def aggregate(self, pipeline):
+        self.aggregations += 1
+        token = pipeline[0]["$match"]["session_token"]
+        return Cursor([row for row in self.rows if row["session_token"] == token])
+
+    async def delete_one(self, query):
+        if self.fail_writes:
+            raise RuntimeError("mongo unavailable")
+        self.deleted.append(query["session_token"])
+
+    async def update_one(self, query, update):
+        if self.fail_writes:
+            raise RuntimeError("mongo unavailable")
+        self.touched.append(query["session_token"])
+
+
+class Documents:
+    def __init__(self):
+        self.lookups = 0
+
+    async def find_one(self, query):
+        self.lookups += 1
+        await asyncio.sleep(0)
+        return {"id": query["id"], "exercises": []}
+
+
+def _session(token, expires_in_days, template=None):
+    now = datetime.now(timezone.utc)
+    return {
+        "session_token": token,
+        "user_email": "prof@example.org",
+        "expires_at": (now + timedelta(days=expires_in_days)).isoformat(),
+        "pro_user": [{"email": "prof@example.org", "subscription_expires": now + timedelta(days=30)}],
+        "user_template": [template] if template else [],
+    }
+
+
+def _db(rows, fail_writes=False):
+    return SimpleNamespace(login_sessions=Sessions(rows, fail_writes), documents=Documents())
+
+
+async def _settle():
+    # Let the fire-and-forget session bookkeeping run
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_lookups_are_memoized_for_the_request():
+    db = _db([_session("token-1", 7, {"template_style": "academique", "school_name": "Collège Jean Moulin"})])
+    loader = RequestContextLoader(db, "token-1")
+
+    async def run():
+        auth, doc = await loader.load("doc-1")
+        again = await loader.auth()
+        same_doc = await loader.document("doc-1")
+        await _settle()
+        return auth, doc, again, same_doc
+
+    auth, doc, again, same_doc = asyncio.run(run())
+    assert auth.is_pro and auth.email == "prof@example.org"
+    assert auth.template_config["template_style"] == "academique"
+    assert again is auth and same_doc is doc
+    assert db.login_sessions.aggregations == 1 and db.documents.lookups == 1
+    assert db.login_sessions.touched == ["token-1"]
+
+
+def test_expired_session_is_anonymous_and_cleaned_up():
+    db = _db([_session("old-token", -1)])
+
+    async def run():
+        auth = await RequestContextLoader(db, "old-token").auth()
+        await _settle()
+        return auth
+
+    auth = asyncio.run(run())
+    assert auth.email is None and not auth.is_pro and auth.template_config == {}
+    assert db.login_sessions.deleted == ["old-token"]
+    assert db.login_sessions.touched == []
+
+
+def test_session_bookkeeping_errors_do_not_escape():
+    errors = []
+
+    async def run(token, expires_in_days):
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        loader = RequestContextLoader(_db([_session(token, expires_in_days)], fail_writes=True), token)
+        auth = await loader.auth()
+        await _settle()
+        return auth, [task.exception() for task in loader._tasks.values()]
+
+    expired, expired_errors = asyncio.run(run("old-token", -1))
+    valid, valid_errors = asyncio.run(run("token-1", 7))
+    assert expired.email is None and valid.is_pro
+    assert expired_errors == [None, None] and valid_errors == [None, None]
+    assert errors == []
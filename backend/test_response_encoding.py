@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for orjson responses and the gzip / brotli compression middleware
+"""
+
+import asyncio
+import gzip
+import json
+from datetime import datetime, timezone
+from typing import List
+
+import brotli
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from response_encoding import CompressionMiddleware, OrjsonResponse, choose_encoding
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg"><path d="M0 0L40 12"/></svg>'
+
+
+class Exercise(BaseModel):
+    enonce: str
+    schema_img: str = ""
+
+
+class Document(BaseModel):
+    id: str
+    exercises: List[Exercise]
+    created_at: datetime
+
+
+def _call(middleware_app, accept_encoding: str):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    scope = {"type": "http", "method": "GET", "path": "/api/documents", "headers": headers}
+    asyncio.run(middleware_app(scope, receive, send))
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return dict(start["headers"]), body, len(messages) - 1
+
+
+def _app(body: bytes, content_type: bytes = b"application/json", chunks: int = 1):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+        size = -(-len(body) // chunks)
+        for index in range(chunks):
+            await send({"type": "http.response.body", "body": body[index * size:(index + 1) * size],
+                        "more_body": index < chunks - 1})
+    return app
+
+
+def test_orjson_response_matches_the_stock_encoder():
+    document = Document(id="doc-1", exercises=[Exercise(enonce=f"Résoudre {SVG}", schema_img="iVBORw0KGgo=")],
+                        created_at=datetime(2026, 10, 19, 8, 30, tzinfo=timezone.utc))
+    content = {"document": document, "tags": {"4e"}}
+    rendered = OrjsonResponse(content).body
+    assert json.loads(rendered) == jsonable_encoder(content)
+    assert "Résoudre".encode() in rendered  # UTF-8, not \u escapes
+
+
+def test_negotiates_brotli_then_gzip():
+    assert choose_encoding("gzip, deflate, br") == "br"
+    assert choose_encoding("gzip, br;q=0.5") == "gzip"
+    assert choose_encoding("deflate") is None
+    assert choose_encoding("") is None
+
+
+def test_compresses_large_text_payloads_only():
+    payload = json.dumps({"documents": [{"enonce": SVG * 40}] * 20}).encode()
+
+    headers, body, _ = _call(CompressionMiddleware(_app(payload)), "gzip, br")
+    assert headers[b"content-encoding"] == b"br" and headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(body) < len(payload) // 10
+    assert brotli.decompress(body) == payload
+
+    headers, body, _ = _call(CompressionMiddleware(_app(payload)), "gzip")
+    assert gzip.decompress(body) == payload
+
+    # Below the minimum size, already compressed formats, or no Accept-Encoding: untouched
+    for app, accept in ((_app(b'{"ok":true}'), "gzip"), (_app(payload, b"application/pdf"), "gzip"),
+                        (_app(payload), "")):
+        headers, body, _ = _call(CompressionMiddleware(app), accept)
+        assert b"content-encoding" not in headers
+        assert body in (b'{"ok":true}', payload)
+
+
+def test_streamed_bodies_are_compressed_incrementally():
+    payload = ("<p>" + SVG * 500 + "</p>").encode()
+    headers, body, messages = _call(CompressionMiddleware(_app(payload, b"text/html; charset=utf-8", chunks=4)), "gzip")
+    assert messages == 4
+    assert b"content-length" not in headers
+    assert gzip.decompress(body) == payload
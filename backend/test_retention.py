@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the retention archiver (JSONL archive round trip and selection policy)
+"""
+
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from retention import DocumentArchiver, RetentionPolicy
+
+
+def _matches(doc, query):
+    """Just enough of Mongo's $match for the selection pipeline"""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(doc, branch) for branch in condition):
+                return False
+            continue
+        value = doc.get(key)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for operator, operand in condition.items():
+            if operator == "$nin" and value in operand:
+                return False
+            if operator == "$size" and len(value) != operand:
+                return False
+            if operator == "$lt" and not (type(value) is type(operand) and value < operand):
+                return False
+    return True
+
+
+def _select(pipeline, documents, collections):
+    """Run the selection pipeline over in-memory collections (no recent exports)"""
+    rows = [dict(doc) for doc in documents]
+    for stage in pipeline:
+        if "$match" in stage:
+            rows = [row for row in rows if _matches(row, stage["$match"])]
+        elif "$lookup" in stage:
+            lookup = stage["$lookup"]
+            for row in rows:
+                if "pipeline" in lookup:
+                    assert not collections.get(lookup["from"])
+                    row[lookup["as"]] = []
+                else:
+                    row[lookup["as"]] = [other for other in collections.get(lookup["from"], [])
+                                         if row.get(lookup["localField"]) in other.get(lookup["foreignField"], [])]
+        elif "$project" in stage:
+            rows = [{key: value for key, value in row.items() if key not in stage["$project"]} for row in rows]
+    return rows
+
+
+def _archiver():
+    policy = RetentionPolicy(guest_document_ttl_days=30, archive_mode="jsonl",
+                             archive_dir=tempfile.mkdtemp(prefix="archive-"))
+    return DocumentArchiver(db=None, policy=policy)
+
+
+def test_jsonl_archive_roundtrip_across_runs():
+    archiver = _archiver()
+    now = datetime(2026, 1, 15, tzinfo=timezone.utc)
+    first = [{"id": "doc-1", "guest_id": "g1", "created_at": "2025-10-01T10:00:00+00:00",
+              "exercises": [{"enonce": "Calculer l'aire"}]}]
+    second = [{"id": "doc-2", "guest_id": "g2", "created_at": datetime(2025, 9, 1, tzinfo=timezone.utc),
+               "exercises": []}]
+
+    sizes = archiver._write_jsonl(first, now)
+    archiver._write_jsonl(second, now)
+
+    assert sizes["doc-1"] > 0
+    archive_file = f"documents-{now.strftime('%Y%m%d')}.jsonl.gz"
+    assert archiver._read_from_jsonl(archive_file, "doc-1")["exercises"][0]["enonce"] == "Calculer l'aire"
+    restored = archiver._read_from_jsonl(archive_file, "doc-2")
+    assert restored["created_at"] == datetime(2025, 9, 1, tzinfo=timezone.utc)
+    assert archiver._read_from_jsonl(archive_file, "doc-3") is None
+
+
+def test_selection_matches_both_created_at_formats():
+    archiver = _archiver()
+    now = datetime(2026, 1, 15, tzinfo=timezone.utc)
+    match = archiver._abandoned_pipeline(now)[0]["$match"]
+    cutoff = now - timedelta(days=30)
+    assert {"created_at": {"$lt": cutoff.isoformat()}} in match["$or"]
+    assert {"created_at": {"$lt": cutoff}} in match["$or"]
+    assert match["user_id"] is None
+
+
+def test_pro_owned_documents_are_never_selected():
+    archiver = _archiver()
+    now = datetime(2026, 1, 15, tzinfo=timezone.utc)
+    old = "2025-10-01T10:00:00+00:00"
+    documents = [
+        {"id": "guest-doc", "guest_id": "g-guest", "created_at": old},
+        # Generated while logged in as Pro
+        {"id": "pro-doc", "guest_id": "g-pro", "user_id": "prof@example.org", "created_at": old},
+        # Generated on a device whose guest id is linked to a Pro account
+        {"id": "pro-device-doc", "guest_id": "g-pro", "created_at": datetime(2025, 9, 1, tzinfo=timezone.utc)},
+    ]
+    pro_users = [{"email": "prof@example.org", "guest_ids": ["g-pro"]}]
+
+    selected = _select(archiver._abandoned_pipeline(now), documents, {"pro_users": pro_users})
+    assert [doc["id"] for doc in selected] == ["guest-doc"]
+    assert "pro_owner" not in selected[0]
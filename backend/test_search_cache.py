@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for the Mongo-backed geographic document search cache
+"""
+
+import asyncio
+from datetime import timedelta
+
+from search_cache import SearchCache, search_cache_key
+
+
+class InMemoryCacheCollection:
+    """The few collection methods SearchCache uses, with $gt/$lte on datetimes"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def _matches(self, doc, query):
+        for field, condition in query.items():
+            value = doc.get(field)
+            if isinstance(condition, dict):
+                if "$gt" in condition and not value > condition["$gt"]:
+                    return False
+                if "$lte" in condition and not value <= condition["$lte"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    async def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc and self._matches(doc, query) else None
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs.setdefault(query["_id"], {"_id": query["_id"]}).update(update["$set"])
+
+    async def find_one_and_update(self, query, update, return_document=None):
+        doc = self.docs.get(query["_id"])
+        if not doc or not self._matches(doc, query):
+            return None
+        doc.update(update["$set"])
+        return dict(doc)
+
+
+class FakeDb:
+    def __init__(self):
+        self.document_search_cache = InMemoryCacheCollection()
+
+
+def _counting_search(results):
+    calls = []
+
+    async def search():
+        calls.append(1)
+        return results
+
+    return search, calls
+
+
+def test_key_ignores_element_order_and_case():
+    assert search_cache_key("carte_europe", ["Paris", "berlin"], "français") == \
+        search_cache_key("carte_europe", ["Berlin", "paris"], "français")
+    assert search_cache_key("carte_europe", [], "français") != search_cache_key("carte_europe", [], "anglais")
+
+
+def test_hits_and_negative_entries_skip_the_search():
+    async def scenario():
+        cache = SearchCache(FakeDb(), ttl=timedelta(hours=1), negative_ttl=timedelta(minutes=5))
+        found, found_calls = _counting_search([{"titre": "Carte de l'Europe"}])
+        assert await cache.lookup("k1", found) == [{"titre": "Carte de l'Europe"}]
+        assert await cache.lookup("k1", found) == [{"titre": "Carte de l'Europe"}]
+        assert len(found_calls) == 1
+
+        empty, empty_calls = _counting_search([])
+        assert await cache.lookup("k2", empty) == []
+        assert await cache.lookup("k2", empty) == []
+        assert len(empty_calls) == 1
+        entry = cache.collection.docs["k2"]
+        assert entry["negative"] and entry["expires_at"] - entry["created_at"] == timedelta(minutes=5)
+
+    asyncio.run(scenario())
+
+
+def test_entries_near_expiry_are_served_then_refreshed_once():
+    async def scenario():
+        cache = SearchCache(FakeDb(), ttl=timedelta(hours=1))
+        old, _ = _counting_search([{"titre": "Ancienne carte"}])
+        await cache.lookup("k", old)
+        entry = cache.collection.docs["k"]
+        entry["refresh_after"] -= timedelta(hours=1)
+
+        new, new_calls = _counting_search([{"titre": "Nouvelle carte"}])
+        # Stale entry served immediately, a single refresh runs in the background
+        assert await cache.lookup("k", new) == [{"titre": "Ancienne carte"}]
+        assert await cache.lookup("k", new) == [{"titre": "Ancienne carte"}]
+        await asyncio.gather(*list(cache._refreshing.values()))
+        assert len(new_calls) == 1
+        assert await cache.lookup("k", new) == [{"titre": "Nouvelle carte"}]
+
+        # An empty refresh never replaces found candidates
+        cache.collection.docs["k"]["refresh_after"] -= timedelta(hours=1)
+        empty, _ = _counting_search([])
+        await cache.lookup("k", empty)
+        await asyncio.gather(*list(cache._refreshing.values()))
+        assert cache.collection.docs["k"]["results"] == [{"titre": "Nouvelle carte"}]
+
+    asyncio.run(scenario())
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for the compiled Jinja2 template environment
+"""
+
+import os
+import tempfile
+
+from jinja2 import Template
+
+from benchmarks.bench_templates import STYLES, sample_context
+from template_env import TEMPLATES_DIR, TemplateRegistry, create_template_environment
+
+
+def _registry():
+    return TemplateRegistry(create_template_environment(cache_dir=tempfile.mkdtemp(prefix="jinja-")))
+
+
+def test_precompile_covers_every_template():
+    registry = _registry()
+    timings = registry.precompile()
+    assert set(timings) == {path.stem for path in TEMPLATES_DIR.glob("*.html")}
+
+
+def test_compiled_render_matches_legacy_template():
+    registry = _registry()
+    context = sample_context(exercise_count=3)
+    for templates in STYLES.values():
+        for name in templates:
+            legacy = Template((TEMPLATES_DIR / f"{name}.html").read_text(encoding="utf-8")).render(**context)
+            assert registry.render(name, **context) == legacy
+
+
+def test_bytecode_cache_is_reused_by_a_new_environment():
+    cache_dir = tempfile.mkdtemp(prefix="jinja-")
+    TemplateRegistry(create_template_environment(cache_dir=cache_dir)).get_template("sujet_classique")
+    env = create_template_environment(cache_dir=cache_dir)
+    assert env.bytecode_cache is not None
+    assert os.listdir(cache_dir)
+    assert TemplateRegistry(env).get_template("sujet_classique") is not None
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for request tracing: span trees, log correlation, slowest traces and exporters
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from tracing import JsonlTraceExporter, OTLPHttpExporter, Tracer, TracingMiddleware, current_ids
+
+
+def test_spans_form_a_tree_across_tasks():
+    tracer = Tracer(exporters=[])
+
+    async def exercise(index):
+        with tracer.span("schema_pass", exercise=index):
+            await asyncio.sleep(0)
+            return current_ids()
+
+    async def scenario():
+        with tracer.trace("POST /api/generate", request_id="req-1") as root:
+            with tracer.span("llm_first_pass"):
+                pass
+            ids = await asyncio.gather(exercise(1), exercise(2))
+        return root, ids
+
+    root, ids = asyncio.run(scenario())
+    trace = root.trace
+    tree = trace.to_dict()["root"]
+
+    assert [child["name"] for child in tree["children"]] == ["llm_first_pass", "schema_pass", "schema_pass"]
+    assert {entry["request_id"] for entry in ids} == {"req-1"}
+    assert ids[0]["span_id"] != ids[1]["span_id"]
+    assert current_ids() == {}
+    # Spans opened after the request finished (background tasks) are not recorded
+    with tracer.span("late"):
+        pass
+    assert len(trace.spans) == 4
+
+
+def test_slowest_traces_are_kept_and_exported_to_jsonl(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(slowest=2, exporters=[JsonlTraceExporter(str(path))])
+    for index, delay in enumerate((0.0, 0.02, 0.01)):
+        with tracer.trace(f"GET /t{index}") as root:
+            root.start_ns -= int(delay * 1e9)
+    tracer.export_queue.flush()
+
+    assert [trace.root.name for trace in tracer.slowest()] == ["GET /t1", "GET /t2"]
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["GET /t0", "GET /t1", "GET /t2"]
+    assert tracer.get(lines[1]["trace_id"]).root.name == "GET /t1"
+
+
+def test_middleware_echoes_request_id_and_exports_otlp():
+    received = []
+
+    class Collector(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Collector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    tracer = Tracer(exporters=[OTLPHttpExporter(f"http://127.0.0.1:{server.server_port}/v1/traces")])
+
+    async def app(scope, receive, send):
+        with tracer.span("mongo_insert"):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "method": "GET", "path": "/api/health", "headers": [(b"x-request-id", b"abc-123")]}
+    asyncio.run(TracingMiddleware(app, tracer=tracer)(scope, receive, send))
+    tracer.export_queue.flush()
+    server.shutdown()
+
+    assert (b"x-request-id", b"abc-123") in sent[0]["headers"]
+    spans = received[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["GET /api/health", "mongo_insert"]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert {"key": "status_code", "value": {"intValue": "200"}} in spans[0]["attributes"]
@@ -0,0 +1,399 @@
+"""
+Request Tracing - Request ids and span trees carried by contextvars
+Every HTTP request gets a request id (X-Request-ID, echoed back) and a root
+span; code on the way opens child spans (llm_first_pass, schema_pass,
+document_search, render, mongo_insert...). AppLogger records carry the ids of
+the current span. Finished traces are kept in memory when they are among the
+slowest N, and exported off the request thread to a JSONL file and/or an
+OTLP/HTTP JSON collector.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from heapq import heappush, heappushpop
+from typing import Any, Dict, Iterator, List, Optional
+
+from metrics import metrics
+
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() == 'true'
+TRACE_SLOWEST = int(os.environ.get('TRACE_SLOWEST', '50'))
+# Spans beyond this in one trace are counted, not recorded (loops over many exercises)
+TRACE_MAX_SPANS = int(os.environ.get('TRACE_MAX_SPANS', '500'))
+TRACE_EXPORT_FILE = os.environ.get('TRACE_EXPORT_FILE')
+TRACE_OTLP_ENDPOINT = os.environ.get('TRACE_OTLP_ENDPOINT')
+TRACE_EXPORT_QUEUE_SIZE = 1000
+OTLP_TIMEOUT_SECONDS = 2.0
+SERVICE_NAME = "lemaitremot-backend"
+
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+traces_finished = metrics.counter("traces_finished_total", "Finished request traces")
+traces_export_dropped = metrics.counter("traces_export_dropped_total", "Traces not exported because the export queue was full")
+trace_export_errors = metrics.counter("trace_export_errors_total", "Trace export failures by exporter")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation of a trace"""
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": dict(self.attributes)
+        }
+
+
+class _NoopSpan:
+    """Yielded when tracing is off or no trace is active: set() does nothing"""
+    span_id = None
+
+    def set(self, key: str, value: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Spans of one request, root first"""
+
+    def __init__(self, request_id: str, max_spans: int = TRACE_MAX_SPANS):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self.finished = False
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def add(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Optional[Span]:
+        # Background tasks started by a request may outlive it: their spans are not recorded
+        if self.finished:
+            return None
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return None
+        span = Span(self, name, parent_id, attributes)
+        self.spans.append(span)
+        return span
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "request_id": self.request_id,
+            "name": self.root.name,
+            "started_at": self.root.start_ns // 1_000_000,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.root.status,
+            "span_count": len(self.spans),
+            "dropped_spans": self.dropped_spans
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summary plus the span tree (children nested under their parent)"""
+        nodes = {span.span_id: {**span.to_dict(), "children": []} for span in self.spans}
+        for span in self.spans[1:]:
+            parent = nodes.get(span.parent_id)
+            if parent is not None:
+                parent["children"].append(nodes[span.span_id])
+        return {**self.summary(), "root": nodes[self.root.span_id]}
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(trace: Trace) -> Dict[str, Any]:
+    """OTLP/HTTP JSON body (ExportTraceServiceRequest) for one trace"""
+    spans = []
+    for span in trace.spans:
+        attributes = dict(span.attributes, **{"request.id": trace.request_id})
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "kind": 2 if span.parent_id is None else 1,  # SERVER for the request, INTERNAL below
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+            "status": {"code": 2 if span.status == "error" else 1}
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}]
+    }]}
+
+
+class JsonlTraceExporter:
+    """Appends one JSON trace (with its span tree) per line"""
+    name = "jsonl"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, trace: Trace):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+class OTLPHttpExporter:
+    """POSTs OTLP JSON to a collector (e.g. http://localhost:4318/v1/traces)"""
+    name = "otlp"
+
+    def __init__(self, endpoint: str, timeout: float = OTLP_TIMEOUT_SECONDS):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, trace: Trace):
+        body = json.dumps(otlp_payload(trace), default=str).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, method="POST",
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class TraceExportQueue:
+    """Bounded queue drained by one daemon thread; a full queue drops traces"""
+
+    def __init__(self, exporters: List[Any], maxsize: int = TRACE_EXPORT_QUEUE_SIZE):
+        self.exporters = exporters
+        self._queue: "queue.Queue[Optional[Trace]]" = queue.Queue(maxsize=maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, trace: Trace):
+        if not self.exporters:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            traces_export_dropped.inc()
+
+    def flush(self):
+        """Wait until every submitted trace has been exported (tests, shutdown)"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            try:
+                for exporter in self.exporters:
+                    try:
+                        exporter.export(trace)
+                    except Exception:
+                        trace_export_errors.inc(exporter=exporter.name)
+            finally:
+                self._queue.task_done()
+
+
+def default_exporters() -> List[Any]:
+    exporters = []
+    if TRACE_EXPORT_FILE:
+        exporters.append(JsonlTraceExporter(TRACE_EXPORT_FILE))
+    if TRACE_OTLP_ENDPOINT:
+        exporters.append(OTLPHttpExporter(TRACE_OTLP_ENDPOINT))
+    return exporters
+
+
+class Tracer:
+    """Opens traces and spans in the current context and keeps the slowest traces"""
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, slowest: int = TRACE_SLOWEST,
+                 max_spans: int = TRACE_MAX_SPANS, exporters: Optional[List[Any]] = None):
+        self.enabled = enabled
+        self.slowest_limit = slowest
+        self.max_spans = max_spans
+        self.export_queue = TraceExportQueue(default_exporters() if exporters is None else exporters)
+        self._lock = threading.Lock()
+        # Min-heap on duration: the fastest of the kept traces is replaced first
+        self._slowest: List[tuple] = []
+        self._sequence = 0
+
+    @contextmanager
+    def trace(self, name: str, request_id: Optional[str] = None, **attributes) -> Iterator[Any]:
+        """Root span of a request (or of a job); yields the root span"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        trace = Trace(request_id or uuid.uuid4().hex, self.max_spans)
+        root = trace.add(name, None, attributes)
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException:
+            root.status = "error"
+            raise
+        finally:
+            root.end_ns = time.time_ns()
+            trace.finished = True
+            _current_span.reset(token)
+            self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Any]:
+        """Child of the current span; a no-op outside a trace"""
+        parent = _current_span.get()
+        span = parent.trace.add(name, parent.span_id, attributes) if parent is not None else None
+        if span is None:
+            yield NOOP_SPAN
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+
+    def traced(self, name: Optional[str] = None):
+        """Decorator: run the function inside a span (sync or async)"""
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return await func(*args, **kwargs)
+
+            @wraps(func)
+            def sync_wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+
+            return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
+        return decorator
+
+    def _finish(self, trace: Trace):
+        traces_finished.inc()
+        with self._lock:
+            self._sequence += 1
+            entry = (trace.duration_ms, self._sequence, trace)
+            if len(self._slowest) < self.slowest_limit:
+                heappush(self._slowest, entry)
+            elif self.slowest_limit and entry[0] > self._slowest[0][0]:
+                heappushpop(self._slowest, entry)
+        self.export_queue.submit(trace)
+
+    def slowest(self, limit: Optional[int] = None) -> List[Trace]:
+        with self._lock:
+            ordered = sorted(self._slowest, key=lambda entry: entry[0], reverse=True)
+        return [trace for _, _, trace in ordered[:limit]]
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            for _, _, trace in self._slowest:
+                if trace.trace_id == trace_id or trace.request_id == trace_id:
+                    return trace
+        return None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_ids() -> Dict[str, str]:
+    """request_id / trace_id / span_id of the current context (empty outside a trace)"""
+    span = _current_span.get()
+    if span is None:
+        return {}
+    return {"request_id": span.trace.request_id, "trace_id": span.trace.trace_id, "span_id": span.span_id}
+
+
+class TracingMiddleware:
+    """ASGI middleware: one trace per HTTP request, X-Request-ID in and out"""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")
+        request_id = incoming if REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        method = scope.get("method", "")
+
+        with self.tracer.trace(f"{method} {scope.get('path', '')}", request_id=request_id,
+                               method=method, path=scope.get("path", "")) as root:
+            async def send_with_request_id(message):
+                if message["type"] == "http.response.start":
+                    root.set("status_code", message["status"])
+                    if message["status"] >= 500:
+                        root.status = "error"
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_request_id)
+            finally:
+                # Group by route template (/api/documents/{id}) rather than by raw path
+                route = scope.get("route")
+                if getattr(route, "path", None):
+                    root.name = f"{method} {route.path}"
+
+
+# Global instance for easy use
+tracer = Tracer()
@@ -469,7 +469,9 @@ function MainApp() {
         nb_exercices: nbExercices,
         guest_id: guestId
       }, {
-        timeout: 30000  // 30 seconds timeout
+        timeout: 30000,  // 30 seconds timeout
+        // Pro documents are recorded under the account (bulk export, retention)
+        headers: sessionToken ? { 'X-Session-Token': sessionToken } : {}
       });
       
       setCurrentDocument(response.data.document);